@@ -0,0 +1,3 @@
+'''
+Shared code for the antimicrobial susceptibility pipeline
+'''
@@ -0,0 +1,224 @@
+##################################
+#                                #
+# artifact.py                    #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Versioned model files, read by the shiny app without scikit-learn
+
+A fitted logistic regression is its intercept and coefficients, so each model is saved as
+two files instead of a pickle:
+    <Antibiotic>_<Site>.json: format and version, antibiotic, site, feature names (in the order
+                              of the coefficients), classes, training window and metrics, and the
+                              name, type, shape and SHA-256 of the parameter array
+    <Antibiotic>_<Site>.npy:  the parameters, [intercept, coefficients...], as little-endian float64
+The array is a standard .npy file, so it can be memory-mapped with np.load(..., mmap_mode='r').
+The array is written before the JSON file, each to a temporary file renamed over the old one,
+so a reader that finds a new JSON file also finds its array, and a reader that finds a new
+array with the old JSON file sees that the hash does not match and keeps its current model.
+
+Unlike a pickle, loading a model runs no code and does not depend on the version of
+scikit-learn it was fitted with. A reader refuses a file of another format or a newer version.
+
+Usage:
+    from amr import artifact
+    artifact.write('.', reg, 'Ceftriaxone', 'TOH', artifact.training_window(one_hot_data, 'TOH'))
+    model = artifact.read('Ceftriaxone_TOH.json')
+    reg   = artifact.to_model(model)  # a LogisticRegression, for predict_proba and warm starts
+
+    python -m amr.artifact "shiny core"/*.pickle  # converts pickled models
+'''
+
+import io
+import os
+import sys
+import json
+import math
+import pickle
+import hashlib
+import argparse
+
+import numpy as np
+
+from amr import encoding, storage
+
+
+format_name    = 'amr-logistic-regression'
+format_version = 1
+
+# Little-endian float64, whatever the byte order of the machine that wrote it
+array_dtype = '<f8'
+
+
+def path(directory, antibiotic, site):
+    return os.path.join(directory, antibiotic+'_'+site+'.json')
+
+
+def array_path(path):
+    '''
+    Returns the path of the parameter array of a model's JSON file
+    '''
+    return os.path.splitext(path)[0]+'.npy'
+
+
+def files(directory, antibiotic, site):
+    '''
+    Returns both files of a model, the array first, in the order they are written
+    '''
+    json_path = path(directory, antibiotic, site)
+    return [array_path(json_path), json_path]
+
+
+def training_window(data, site=None):
+    '''
+    Takes the regression inputs a model was fitted to (e.g. one_hot_data, or from training.read_inputs)
+    Returns the number of isolates, and the first and last year if the data has the site's year column
+        (or the 'year' column saved by training.write_inputs)
+    '''
+    window = {'isolates':int(len(data))}
+
+    for column in ['year', encoding.year_columns.get(site)]:
+        if column in data.columns and len(data):
+            window['first_year'] = int(data[column].min())
+            window['last_year']  = int(data[column].max())
+            break
+
+    return window
+
+
+def _json_value(value):
+    '''
+    Returns a value that json can write: NumPy numbers as Python numbers, and NaN as None
+    '''
+    if isinstance(value, dict): return {i:_json_value(j) for i, j in value.items()}
+    if isinstance(value, (list,tuple)): return [_json_value(i) for i in value]
+    if isinstance(value, np.generic): value = value.item()
+    if isinstance(value, float) and not math.isfinite(value): return None
+
+    return value
+
+
+def write(directory, reg, antibiotic, site, window=None, metrics=None):
+    '''
+    Takes a fitted binary LogisticRegression with feature names (fitted on a DataFrame)
+    Writes its parameter array and JSON file to directory, with the training window and metrics (dicts)
+    Returns the path of the JSON file
+    '''
+    if list(reg.classes_)!=[0,1]:
+        raise ValueError('Model for {} at {} should have classes [0, 1] (susceptible, resistant)'.format(antibiotic, site))
+
+    json_path = path(directory, antibiotic, site)
+
+    parameters = np.concatenate([reg.intercept_, reg.coef_[0]]).astype(array_dtype)
+    array = io.BytesIO()
+    np.save(array, parameters, allow_pickle=False)
+    array = array.getvalue()
+
+    contents = {'format':      format_name,
+                'version':     format_version,
+                'antibiotic':  antibiotic,
+                'site':        site,
+                'features':    list(reg.feature_names_in_),
+                'classes':     [0,1],
+                'parameters':  {'file':  os.path.basename(array_path(json_path)),
+                                'dtype': array_dtype,
+                                'shape': list(parameters.shape),
+                                'sha256':hashlib.sha256(array).hexdigest()},
+                'window':      window or {},
+                'metrics':     metrics or {}}
+
+    storage.write_atomic(array_path(json_path), array)
+    storage.write_atomic(json_path, (json.dumps(_json_value(contents), indent=1)+'\n').encode())
+
+    return json_path
+
+
+def check(contents, array):
+    '''
+    Takes the parsed JSON file of a model, and the bytes of its parameter array
+    Raises ValueError if the file is not a model this version can read, or the array does not belong to it
+    '''
+    if contents.get('format')!=format_name:
+        raise ValueError('Not a model file (format {!r}, expected {!r})'.format(contents.get('format'), format_name))
+    if contents.get('version')!=format_version:
+        raise ValueError('Model file version {} cannot be read (expected {})'.format(contents.get('version'), format_version))
+    if hashlib.sha256(array).hexdigest()!=contents['parameters']['sha256']:
+        raise ValueError('Parameter array of {} {} does not match its model file'.format(contents['antibiotic'], contents['site']))
+
+
+def read(path, mmap=True):
+    '''
+    Reads a model written by write()
+    Returns the contents of the JSON file as a dict, plus:
+        intercept:    float
+        coefficients: array of the coefficients of the features, memory-mapped from the .npy file if mmap
+    '''
+    with open(path,'rb') as f:
+        contents = json.loads(f.read())
+
+    with open(array_path(path),'rb') as f:
+        array = f.read()
+    check(contents, array)
+
+    if mmap: parameters = np.load(array_path(path), mmap_mode='r', allow_pickle=False)
+    else:    parameters = np.load(io.BytesIO(array), allow_pickle=False)
+
+    if parameters.shape!=(len(contents['features'])+1,):
+        raise ValueError('Parameter array of {} has shape {}, for {} features'.format(path, parameters.shape, len(contents['features'])))
+
+    contents['intercept']    = float(parameters[0])
+    contents['coefficients'] = parameters[1:]
+
+    return contents
+
+
+def to_model(model):
+    '''
+    Takes a model from read()
+    Returns a fitted scikit-learn LogisticRegression with the same parameters, e.g. to start a refit from
+    '''
+    from sklearn import linear_model
+
+    reg = linear_model.LogisticRegression(max_iter=500, penalty=None)
+    reg.classes_           = np.array(model['classes'])
+    reg.feature_names_in_  = np.array(model['features'], dtype=object)
+    reg.n_features_in_     = len(model['features'])
+    reg.coef_              = np.array(model['coefficients'], dtype=float)[None,:]
+    reg.intercept_         = np.array([model['intercept']])
+    reg.n_iter_            = np.array([model['metrics'].get('iterations') or 0], dtype=np.int32)
+
+    return reg
+
+
+def convert(pickle_path, site=None, antibiotic=None):
+    '''
+    Writes the model in a pickle (e.g. <Antibiotic>_<Site>.pickle from an older version) as an artifact
+    in the same folder, with the antibiotic and site taken from the file name unless given
+    Only convert pickles you trust: loading a pickle can run any code
+    Returns the path of the JSON file
+    '''
+    name = os.path.splitext(os.path.basename(pickle_path))[0]
+    antibiotic = antibiotic or name.rsplit('_',1)[0]
+    site       = site       or name.rsplit('_',1)[-1]
+
+    with open(pickle_path,'rb') as f:
+        reg = pickle.load(f)
+
+    metrics = {'iterations':int(reg.n_iter_[0])} if hasattr(reg,'n_iter_') else {}
+    return write(os.path.dirname(pickle_path), reg, antibiotic, site, metrics=metrics)
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description='Convert pickled models to model files the app can read')
+    parser.add_argument('pickles', nargs='+', help='<Antibiotic>_<Site>.pickle files')
+    arguments = parser.parse_args(arguments)
+
+    for pickle_path in arguments.pickles:
+        print(convert(pickle_path))
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,412 @@
+##################################
+#                                #
+# benchmark.py                   #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Timings and memory use of each step, from raw extract to the app's predictions
+
+Synthetic extracts (see synthetic.py) of each size go through the same steps as the
+pipeline, each timed separately:
+    generate:           creating the synthetic raw extract
+    clean:              ingest.cleaning
+    impute:             the imputation rules (ingest.impute_cleaned)
+    write, read:        the imputed extract as Parquet (storage.py)
+    previous_infection: prior gram negative resistance of every regression antibiotic (features.py)
+    encode:             one-hot encoding of the regression rows (encoding.encode)
+    train:              fitting every antibiotic's logistic regression (training.fit)
+and the app, once per run:
+    app_load:           loading the models and building the scoring table
+    app_lookup:         predictions for one set of form values, per call
+    app_outputs:        susceptibility_outputs_f, per call (needs shiny installed)
+    app_start:          a new process importing the app, to its first prediction (needs shiny installed)
+    app_fast_start:     the same with AMR_FAST_START set
+
+Each size runs in its own process, so that the memory used by one size does not carry
+over to the next. max_rss_bytes is the most memory the process had used by the end of a
+step. With --trace-memory, traced_peak_bytes is the peak of Python and NumPy allocations
+during the step; timings are then much slower, so should only be compared between runs
+that both traced memory.
+
+Results are appended to benchmark_results.csv, one row per step, with the versions of
+the code and libraries, so that runs can be compared with --compare.
+
+Usage:
+    python -m amr.benchmark --sizes 10000 100000 1000000
+    python -m amr.benchmark --compare
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import tempfile
+import subprocess
+import tracemalloc
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+from amr import encoding, features, imputation, ingest, storage, synthetic, training
+
+
+default_sizes = [10000,100000,1000000]
+
+stages     = ['generate','clean','impute','write','read','previous_infection','encode','train']
+app_stages = ['app_load','app_lookup','app_outputs','app_start','app_fast_start']
+
+results_filename = 'benchmark_results.csv'
+
+app_directory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shiny core')
+
+result_columns = ['run','commit','python','numpy','pandas','sklearn','processors',
+                  'site','rows','stage','step_rows','seconds','rows_per_second',
+                  'calls','median_ms','p95_ms','max_ms',
+                  'max_rss_bytes','traced_peak_bytes','note']
+
+
+def max_rss():
+    '''
+    Returns the most memory used by this process so far in bytes, or NaN where this is not available (Windows)
+    '''
+    try:
+        import resource
+    except ImportError:
+        return np.nan
+
+    # Kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform=='darwin' else rss*1024
+
+
+def timed(records, stage, rows, function, trace_memory=False):
+    '''
+    Runs function() on rows rows, adding its time and memory use to records
+    Returns the result of function()
+    '''
+    if trace_memory: tracemalloc.start()
+
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter()-start
+
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else: traced_peak = np.nan
+
+    records.append({'stage':            stage,
+                    'step_rows':        rows,
+                    'seconds':          seconds,
+                    'rows_per_second':  rows/seconds if seconds>0 else np.nan,
+                    'max_rss_bytes':    max_rss(),
+                    'traced_peak_bytes':traced_peak})
+    return result
+
+
+def prior_resistance(data):
+    '''
+    Returns the prior gram negative resistance of every regression antibiotic, as in encoding.encode
+    '''
+    return [features.previous_infection(data['PriorGNOrg'], data[antibiotic+'_PGNO_imp'])
+            for antibiotic in storage.regression_antibiotics]
+
+
+def fit_models(one_hot_data, antibiotics):
+    '''
+    Fits the final model of every antibiotic on the encoded rows, one after another
+    '''
+    inputs = one_hot_data[training.regression_columns(antibiotics)].astype(float)
+
+    return [training.fit(inputs[training.regression_inputs(antibiotic)], inputs[training.outcome(antibiotic)])
+            for antibiotic in antibiotics]
+
+
+def benchmark_size(site, rows, seed=0, antibiotics=training.antibiotic_list, trace_memory=False):
+    '''
+    Times every stage for a synthetic extract of a site with the given number of rows
+    Returns a list of records (dicts), where step_rows is the number of rows each step worked on
+        (the steps from previous_infection on only use the regression rows)
+    '''
+    records = []
+    step = lambda stage, function, n=rows: timed(records, stage, n, function, trace_memory)
+
+    raw     = step('generate', lambda: synthetic.extract(site, rows, seed))
+    cleaned = step('clean',    lambda: ingest.cleaning[site](raw))
+    del raw
+
+    rules   = imputation.load_rules(site)
+    imputed = step('impute',   lambda: ingest.impute_cleaned(cleaned, site, rules))
+    del cleaned
+    if ingest.output_columns[site] is not None: imputed = imputed[ingest.output_columns[site]]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'imputed.parquet')
+        step('write', lambda: storage.write(imputed, path))
+        del imputed
+
+        data = step('read', lambda: storage.read(path, columns=storage.regression_columns[site], categorical=False))
+
+    data = encoding.regression_rows(data, site).copy()
+
+    # The regression notebooks convert prior susceptibilities to numbers before finding prior resistance
+    prior = data[['PriorGNOrg']+[i+'_PGNO_imp' for i in storage.regression_antibiotics]]
+    prior = prior.replace({'SUSCEPTIBLE':0,'INTERMEDIATE':1,'RESISTANT':1})
+    step('previous_infection', lambda: prior_resistance(prior), len(data))
+
+    one_hot_data = step('encode', lambda: encoding.encode(data, site, antibiotics), len(data))
+    step('train', lambda: fit_models(one_hot_data, antibiotics), len(one_hot_data))
+
+    for record in records:
+        record['site'] = site
+        record['rows'] = rows
+
+    return records
+
+
+def form_values(rng, app_encoding, antibiotic_list):
+    '''
+    Returns a random set of form values, as given by the app's encoding.form_values
+    '''
+    values = {'Hospital':          rng.choice(['Sunnybrook','TOH','Trillium']),
+              'Age':               rng.choice(list(app_encoding.age_values)),
+              'SexCat':            rng.choice(['Male','Female']),
+              'Acquisition':       rng.choice(['Community','Hospital non-ICU','ICU']),
+              'MedVsSurgAdmission':rng.choice(['Medical','Surgical'])}
+
+    # The rest are yes/no
+    for i in app_encoding.form_inputs:
+        if i not in values: values[i] = rng.choice(['0','1'])
+    for i in app_encoding.resistance_inputs(antibiotic_list):
+        values[i] = rng.choice(['0','1','2'])
+
+    return values
+
+
+def latencies(records, stage, function, arguments, trace_memory=False):
+    '''
+    Calls function once for each item of arguments, adding the time per call to records
+    '''
+    if trace_memory: tracemalloc.start()
+
+    seconds = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        seconds.append(time.perf_counter()-start)
+
+    traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else np.nan
+    if trace_memory: tracemalloc.stop()
+
+    milliseconds = np.array(seconds)*1000
+    records.append({'site':'app','stage':stage,'seconds':sum(seconds),'calls':len(seconds),
+                    'median_ms':np.median(milliseconds),'p95_ms':np.percentile(milliseconds,95),
+                    'max_ms':milliseconds.max(),'max_rss_bytes':max_rss(),'traced_peak_bytes':traced_peak})
+
+
+# Run by cold_start() in a new process, so that nothing is imported beforehand
+cold_start_script = '''
+import json, time
+start = time.perf_counter()
+import shiny_core_regression as app
+imported = time.perf_counter()
+
+values = {i:'0' for i in app.encoding.form_inputs+app.encoding.resistance_inputs(app.antibiotic_list)}
+values.update({'Hospital':'TOH','Age':'50-54','SexCat':'Male','Acquisition':'Community','MedVsSurgAdmission':'Medical'})
+table = app.scoring_table(app.model_registry.signatures())
+app.susceptibility_predictions(values, table)
+predicted = time.perf_counter()
+app.susceptibility_outputs_f(values, table)
+tabulated = time.perf_counter()
+
+print(json.dumps({'import':imported-start, 'prediction':predicted-start, 'table':tabulated-start}))
+'''
+
+def cold_start(fast_start, directory=app_directory):
+    '''
+    Times a new process importing the app (with AMR_FAST_START set if fast_start),
+        making its first prediction, and its first table of predictions (which needs pandas)
+    The time for Python itself to start is not included
+    Returns a record (dict)
+    '''
+    stage = 'app_fast_start' if fast_start else 'app_start'
+
+    environment = dict(os.environ)
+    environment.pop('AMR_FAST_START', None)
+    if fast_start: environment['AMR_FAST_START'] = '1'
+
+    process = subprocess.run([sys.executable,'-c',cold_start_script], cwd=directory, env=environment,
+                             capture_output=True, text=True)
+    if process.returncode!=0:
+        return {'site':'app','stage':stage,'note':'not run: {}'.format((process.stderr.strip().splitlines() or [''])[-1])}
+
+    times = json.loads(process.stdout.splitlines()[-1])
+    return {'site':'app','stage':stage,'seconds':times['prediction'],
+            'note':'import {:.0f} ms, first prediction {:.0f} ms, first table {:.0f} ms'.format(
+                   times['import']*1000, times['prediction']*1000, times['table']*1000)}
+
+
+def benchmark_app(calls=1000, seed=0, trace_memory=False, directory=app_directory):
+    '''
+    Times loading the app's models, and its predictions for calls random sets of form values
+    Returns a list of records (dicts)
+    '''
+    sys.path.insert(0, directory)
+    import model_registry, lookup, scorer
+    import encoding as app_encoding
+
+    records = []
+    antibiotic_list = training.antibiotic_list
+
+    def load():
+        model_registry.load(antibiotic_list)
+        return lookup.build(scorer.export(model_registry.refresh()))
+
+    table = timed(records, 'app_load', np.nan, load, trace_memory)
+    records[-1]['site'] = 'app'
+
+    rng = np.random.default_rng(seed)
+    values = [form_values(rng, app_encoding, antibiotic_list) for i in range(calls)]
+
+    def predict(values):
+        features = app_encoding.patient_features(values, antibiotic_list)
+        return lookup.susceptibility(table, scorer.feature_vector(table, features))
+
+    latencies(records, 'app_lookup', predict, values, trace_memory)
+
+    # The app's own function, which needs shiny to import
+    try:
+        import shiny_core_regression as app
+    except ImportError as e:
+        records.append({'site':'app','stage':'app_outputs','note':'not run: {}'.format(e)})
+    else:
+        latencies(records, 'app_outputs', lambda i: app.susceptibility_outputs_f(i, table), values, trace_memory)
+
+    records.append(cold_start(False, directory))
+    records.append(cold_start(True, directory))
+
+    return records
+
+
+def environment():
+    '''
+    Returns the run's time, the git commit of the code and the versions of Python and the libraries
+    '''
+    try:
+        commit = subprocess.run(['git','rev-parse','--short','HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+
+    import sklearn
+
+    return {'run':       datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit':    commit,
+            'python':    platform.python_version(),
+            'numpy':     np.__version__,
+            'pandas':    pd.__version__,
+            'sklearn':   sklearn.__version__,
+            'processors':os.cpu_count()}
+
+
+def run(sites=['TOH'], sizes=default_sizes, seed=0, calls=1000, app=True, trace_memory=False, log=print):
+    '''
+    Runs the benchmark of every site and size, each in a new process, then of the app
+    Returns the results as a DataFrame, with the columns of result_columns
+    '''
+    records = []
+
+    for site in sites:
+        for rows in sizes:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                size_records = executor.submit(benchmark_size, site, rows, seed, training.antibiotic_list,
+                                               trace_memory).result()
+            for record in size_records:
+                log('{:<10} {:>9} {:<18} {:8.3f} s'.format(site, rows, record['stage'], record['seconds']))
+            records += size_records
+
+    if app:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            app_records = executor.submit(benchmark_app, calls, seed, trace_memory).result()
+        for record in app_records:
+            if 'calls' in record:
+                log('{:<20} {:<18} {:8.3f} ms median, {:.3f} ms 95th percentile'.format(
+                    'app', record['stage'], record['median_ms'], record['p95_ms']))
+            else:
+                log('{:<20} {:<18} {}'.format('app', record['stage'], record.get('note') or
+                                              '{:8.3f} s'.format(record['seconds'])))
+        records += app_records
+
+    results = pd.DataFrame(records)
+    for column, value in environment().items():
+        results[column] = value
+
+    return results.reindex(columns=result_columns)
+
+
+def append_results(results, path=results_filename):
+    '''
+    Adds a run's results to the end of a results file
+    '''
+    if os.path.exists(path): results = pd.concat([pd.read_csv(path), results], ignore_index=True)
+    storage.write_atomic(path, results.to_csv(index=False).encode())
+
+
+def compare(results, before=None, after=None):
+    '''
+    Takes the results file as a DataFrame, and two runs (by default the last two)
+    Returns the seconds (or median milliseconds per call for the app) of each step in both runs,
+        and their ratio (above 1 when the later run is slower)
+    '''
+    runs = list(dict.fromkeys(results['run']))
+    if before is None or after is None:
+        if len(runs)<2: raise ValueError('Need two runs to compare, found {}'.format(len(runs)))
+        before, after = runs[-2], runs[-1]
+
+    # Latencies are compared per call, other steps by their total time
+    results = results.assign(time=results['median_ms'].fillna(results['seconds']))
+
+    key = ['site','rows','stage']
+    table = pd.merge(results[results['run']==before].groupby(key, dropna=False, sort=False)['time'].median().rename(before),
+                     results[results['run']==after ].groupby(key, dropna=False, sort=False)['time'].median().rename(after),
+                     left_index=True, right_index=True)
+    table['ratio'] = table[after]/table[before]
+
+    return table
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description='Time each step from raw extract to the app on synthetic extracts')
+    parser.add_argument('--sites', nargs='+', default=['TOH'], choices=encoding.hospital_list, help='sites to benchmark')
+    parser.add_argument('--sizes', nargs='+', type=int, default=default_sizes, help='rows of the synthetic extracts')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic extracts and form values')
+    parser.add_argument('--calls', type=int, default=1000, help='predictions timed for the app')
+    parser.add_argument('--no-app', action='store_true', help='skip the app steps')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also record the peak Python and NumPy allocations of each step (slower)')
+    parser.add_argument('--output', default=results_filename, help='CSV file that results are added to')
+    parser.add_argument('--compare', nargs='*', metavar='RUN',
+                        help='compare two runs of the output file (by default the last two) instead of running')
+    arguments = parser.parse_args(arguments)
+
+    if arguments.compare is not None:
+        if len(arguments.compare) not in (0,2): parser.error('--compare takes no runs or two runs')
+        table = compare(pd.read_csv(arguments.output), *arguments.compare)
+        print(table.to_string(float_format='{:.3f}'.format))
+        return
+
+    results = run(arguments.sites, arguments.sizes, arguments.seed, arguments.calls,
+                  not arguments.no_app, arguments.trace_memory)
+    append_results(results, arguments.output)
+    print('\nResults added to {}'.format(arguments.output))
+
+
+if __name__=='__main__':
+    sys.exit(main())
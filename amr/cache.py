@@ -0,0 +1,242 @@
+##################################
+#                                #
+# cache.py                       #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+On-disk cache of stage outputs, addressed by the contents of everything they depend on
+
+An entry is keyed by the hash of the stage name, its settings, the contents of its input
+files (e.g. the extract and the site's rule table in amr/rules) and the source of the amr
+modules that compute it, along with every amr module they import. Changing any of them gives a new key, so entries never need to
+be invalidated: unchanged stages are read back from the cache, and going back to earlier
+inputs or code finds the earlier entry again.
+
+Each entry is a folder <directory>/<key>/ holding the stage's output files. Entries are
+written to a temporary folder and renamed into place, so a reader never sees a partial
+entry. Reading an entry marks it as used, and the least recently used entries are removed
+once the cache is larger than max_bytes.
+
+Usage, e.g. in a regression notebook:
+    one_hot_data = cache.frame('encode', [imputation_file], {'site':'TOH','antibiotics':antibiotic_list},
+                               [encoding, features], lambda: encoding.encode(data, 'TOH', antibiotic_list))
+'''
+
+import os
+import ast
+import json
+import shutil
+import hashlib
+import tempfile
+import importlib
+
+import pandas as pd
+
+
+default_directory = '.amr_cache'
+default_max_bytes = 2*1024**3
+
+# Hashes of input files, by (path, size, modification time), so that each file is only read once per process
+_file_hashes = {}
+
+
+def file_hash(path, chunksize=1<<20):
+    '''
+    Returns the SHA-256 hash of a file's contents
+    '''
+    stat = os.stat(path)
+    index = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    if index not in _file_hashes:
+        h = hashlib.sha256()
+        with open(path,'rb') as f:
+            for block in iter(lambda: f.read(chunksize), b''):
+                h.update(block)
+        _file_hashes[index] = h.hexdigest()
+
+    return _file_hashes[index]
+
+
+def dependencies(modules):
+    '''
+    Takes a list of modules of a package (e.g. [encoding, features])
+    Returns them and every module of the same package that they import, directly or through
+        each other (including imports inside functions), sorted by name
+    '''
+    found = {}
+    queue = list(modules)
+
+    while queue:
+        module = queue.pop()
+        if module.__name__ in found: continue
+        found[module.__name__] = module
+
+        package = module.__name__.partition('.')[0]
+        with open(module.__file__,'rb') as f:
+            tree = ast.parse(f.read())
+
+        names = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ImportFrom) and node.level==0 and node.module==package:
+                names += [package+'.'+i.name for i in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level==0 and (node.module or '').startswith(package+'.'):
+                names.append(node.module)
+            elif isinstance(node, ast.Import):
+                names += [i.name for i in node.names if i.name.startswith(package+'.')]
+
+        # from amr import x can also import a name that is not a module
+        for name in names:
+            try:                queue.append(importlib.import_module(name))
+            except ImportError: pass
+
+    return [found[i] for i in sorted(found)]
+
+
+def code_version(modules):
+    '''
+    Takes a list of modules (e.g. [encoding, features])
+    Returns a hash of their source files and of the source files of every module of the package they import
+    '''
+    h = hashlib.sha256()
+    for module in dependencies(modules):
+        h.update(file_hash(module.__file__).encode())
+
+    return h.hexdigest()
+
+
+def key(stage, inputs, settings, modules=()):
+    '''
+    Returns the cache key of a stage: a hash of its name, settings, input file contents and code
+    File names are left out, so a renamed file with the same contents gives the same key
+    '''
+    h = hashlib.sha256(json.dumps([stage,settings], sort_keys=True, default=str).encode())
+    for path in inputs:
+        h.update(file_hash(path).encode())
+    h.update(code_version(modules).encode())
+
+    return h.hexdigest()
+
+
+def lookup(key, directory=default_directory):
+    '''
+    Returns the folder of a cache entry, marking it as used, or None if there is no entry for key
+    '''
+    entry = os.path.join(directory, key)
+
+    try:
+        os.utime(entry)
+    except FileNotFoundError:
+        return None
+
+    return entry
+
+
+def store(key, files, directory=default_directory, max_bytes=default_max_bytes):
+    '''
+    Copies output files into the cache entry of key (by file name), then removes least recently used entries
+    Returns the folder of the entry
+    '''
+    os.makedirs(directory, exist_ok=True)
+    entry = os.path.join(directory, key)
+
+    temporary = tempfile.mkdtemp(dir=directory, prefix='.'+key+'.')
+    try:
+        for path in files:
+            shutil.copy2(path, os.path.join(temporary, os.path.basename(path)))
+
+        # Another process may have stored the same entry meanwhile, with the same contents
+        try:                os.rename(temporary, entry)
+        except OSError:     shutil.rmtree(temporary, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+
+    os.utime(entry)
+    evict(directory, max_bytes, keep=key)
+
+    return entry
+
+
+def restore(entry, files):
+    '''
+    Copies the files of a cache entry to the given paths (matched by file name)
+    Returns False if the entry is incomplete (e.g. removed by another process meanwhile)
+    '''
+    try:
+        for path in files:
+            directory = os.path.dirname(path)
+            if directory: os.makedirs(directory, exist_ok=True)
+            shutil.copy2(os.path.join(entry, os.path.basename(path)), path)
+    except FileNotFoundError:
+        return False
+
+    return True
+
+
+def entries(directory=default_directory):
+    '''
+    Returns the entries of a cache as a DataFrame of key, bytes and last use, most recently used first
+    '''
+    rows = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            entry = os.path.join(directory, name)
+            if name.startswith('.') or not os.path.isdir(entry): continue
+
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, i)) for i in os.listdir(entry))
+                rows.append({'key':name, 'bytes':size, 'used':os.path.getmtime(entry)})
+            except FileNotFoundError:
+                continue
+
+    rows = pd.DataFrame(rows, columns=['key','bytes','used'])
+    return rows.sort_values('used', ascending=False, ignore_index=True)
+
+
+def evict(directory=default_directory, max_bytes=default_max_bytes, keep=None):
+    '''
+    Removes the least recently used entries until the cache holds at most max_bytes
+    keep is never removed (e.g. the entry just stored)
+    Returns the keys removed
+    '''
+    cached  = entries(directory)
+    total   = cached['bytes'].sum()
+    removed = []
+
+    for row in cached.iloc[::-1].itertuples():
+        if total<=max_bytes: break
+        if row.key==keep: continue
+
+        shutil.rmtree(os.path.join(directory, row.key), ignore_errors=True)
+        total -= row.bytes
+        removed.append(row.key)
+
+    return removed
+
+
+def frame(stage, inputs, settings, modules, compute, directory=default_directory, max_bytes=default_max_bytes):
+    '''
+    Takes the description of a stage (as for key) and a function that computes its DataFrame
+    Returns the cached DataFrame, or the result of compute(), which is then cached
+    '''
+    entry_key = key(stage, inputs, settings, modules)
+    entry = lookup(entry_key, directory)
+
+    if entry is not None:
+        try:
+            return pd.read_pickle(os.path.join(entry,'data.pickle'))
+        except FileNotFoundError:
+            pass
+
+    data = compute()
+
+    # Pickled rather than Parquet, so that every column keeps its exact dtype
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=directory, prefix='.') as temporary:
+        path = os.path.join(temporary,'data.pickle')
+        data.to_pickle(path)
+        store(entry_key, [path], directory, max_bytes)
+
+    return data
@@ -0,0 +1,181 @@
+##################################
+#                                #
+# encoding.py                    #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Converts a site's imputed extract into the regression inputs of the models
+
+The same preprocessing as the regression notebooks: rows are limited to the years used
+for each site, susceptibilities become 0 (susceptible) or 1 (resistant), and age,
+sex, acquisition, admitting service, prior antibiotic exposure and prior gram negative
+resistance become the one-hot columns read by the models.
+Only the first steps differ between sites, and those are kept in preprocessing.
+'''
+
+import numpy as np
+import pandas as pd
+
+from amr import features, imputation, storage
+
+
+hospital_list = ['Sunnybrook','TOH','Trillium']
+
+# Age used by the models for each age category of the extracts
+age_categories = {'<40'  :30,
+                  '40-45':42.5,
+                  '45-50':47.5,
+                  '50-55':52.5,
+                  '55-60':57.5,
+                  '60-65':62.5,
+                  '65-70':67.5,
+                  '70-75':72.5,
+                  '75-80':77.5,
+                  '80-85':82.5,
+                  '85-90':87.5,
+                  '>90'  :95
+                 }
+
+# Column with the year of each isolate, and the first year used for the models
+year_columns = {'Sunnybrook':'YearOfAdmission','TOH':'Year (based on culture)','Trillium':'Year'}
+first_year   = {'Sunnybrook':2016,'TOH':2022,'Trillium':2022}
+
+# Sunnybrook data is only used up to a change in the micro lab reporting system
+last_episode = {'Sunnybrook':7217}
+
+# Susceptibility outcomes where no_data is counted as resistant
+output_antibiotics = {'Sunnybrook':[drug+'_FINAL_imp' for drug in imputation.imputed_drugs],
+                      'TOH':       [drug+'_FINAL_imp' for drug in storage.regression_antibiotics],
+                      'Trillium':  [drug+'_FINAL_imp' for drug in storage.regression_antibiotics]}
+
+# Prior antibiotic exposure columns, one per antibiotic class
+prior_columns = ['PriorAMG','PriorCarbapenem','PriorCephalosporin','PriorFQ','PriorPenicillin','PriorOtherAbx']
+
+# Prior antibiotic classes counted as "prior non-[class]" exposure for each class
+prior_nonclass = {'PriorNonCephalosporin':    ['PriorAMG','PriorCarbapenem','PriorFQ','PriorOtherAbx','PriorPenicillin'],
+                  'PriorNonCarbapenem':       ['PriorAMG','PriorCephalosporin','PriorFQ','PriorOtherAbx','PriorPenicillin'],
+                  'PriorNonPenicillin':       ['PriorAMG','PriorCephalosporin','PriorFQ','PriorOtherAbx','PriorCarbapenem'],
+                  'PriorNonFQ':               ['PriorAMG','PriorCephalosporin','PriorPenicillin','PriorOtherAbx','PriorCarbapenem'],
+                  'PriorNonAMG':              ['PriorFQ','PriorCephalosporin','PriorPenicillin','PriorOtherAbx','PriorCarbapenem'],
+                  'PriorNonOtherAbx':         ['PriorFQ','PriorAMG','PriorCephalosporin','PriorPenicillin','PriorCarbapenem'],
+                  'PriorNonPenicillin_or_AMG':['PriorFQ','PriorCephalosporin','PriorCarbapenem']}
+
+
+def regression_rows(data, site):
+    '''
+    Returns the rows of an imputed extract used for a site's models
+    '''
+    if site in last_episode: data = data[data['Episode'] <= last_episode[site]]
+
+    return data[data[year_columns[site]]>=first_year[site]]
+
+
+def preprocess_Sunnybrook(data):
+    '''
+    Same preprocessing as regression_Sunnybrook.ipynb
+    '''
+    # Convert age to a continuous variable
+    data['Age'] = data['AgeCat'].replace(age_categories)
+
+    # Create a column for location of acquisition: community (1), ward (2), ICU (3)
+    # Created by summing Comm (1) vs. Hosp (2) and ICU acquisition (0 or 1)
+    data['Acquisition'] = data['Community(1), Hospital(2)'] + data['ICU Aquired']
+    data['Acquisition'] = data['Acquisition'].replace({1:'community',2:'ward',3:'ICU'})
+
+    # Change medical vs. surgical admitting service from numbers to words
+    data['Medical(1) Surgical (2) Admitting Service'] = data['Medical(1) Surgical (2) Admitting Service'].replace({1:'medical',2:'surgical'})
+
+    # One hot encode categories
+    return pd.get_dummies(data, columns=['Sex','Acquisition','Medical(1) Surgical (2) Admitting Service'],
+                                prefix= ['sex','acquisition','adm_service'])
+
+
+def preprocess_TOH(data):
+    '''
+    Same preprocessing as regression_TOH.ipynb
+    '''
+    # Convert age to a continuous variable
+    data['Age'] = data['AgeCat'].replace(age_categories).infer_objects()
+
+    # Rename acquisition locations and admitting services to match the Sunnybrook columns
+    data['Acquisition'] = data['Acquisition'].replace({'Community':'community','Hospital':'ward'})
+    data['ADMIT_SVC'] = data['ADMIT_SVC'].replace({'Medical':'medical','Surgical':'surgical'})
+
+    return pd.get_dummies(data, columns=['Sex','Acquisition','ADMIT_SVC'],
+                                prefix= ['sex','acquisition','adm_service'])
+
+
+def preprocess_Trillium(data):
+    '''
+    Same preprocessing as regression_Trillium.ipynb, where prior antibiotics are given by name
+    '''
+    data['Age'] = data['AgeCat'].replace(age_categories).infer_objects()
+
+    data['Acquisition'] = data['Acquisition'].replace({'Community':'community','Hospital':'ward'})
+    data['ADMIT_SVC'] = data['ADMIT_SVC'].replace({'Medical':'medical','Surgical':'surgical'})
+
+    # Convert prior antibiotics from name to binary 1/0
+    # (the notebook's 'PriorAMG':'PriorOtherAbx' slice, named so that it does not depend on column order,
+    #  and whole columns are replaced, as the names are stored as text)
+    data[prior_columns] = data[prior_columns].notna().astype(int)
+
+    return pd.get_dummies(data, columns=['Sex','Acquisition','ADMIT_SVC'],
+                                prefix= ['sex','acquisition','adm_service'])
+
+
+preprocessing = {'Sunnybrook':preprocess_Sunnybrook,
+                 'TOH':       preprocess_TOH,
+                 'Trillium':  preprocess_Trillium}
+
+
+def encode(data, site, antibiotic_list):
+    '''
+    Takes a site's imputed extract (from storage.read with categorical=False), already limited by regression_rows()
+    Returns the one-hot encoded data of the regression notebooks (one_hot_data), with every column kept
+    '''
+    # Add a column for hospital site
+    for hospital in hospital_list:
+        data['hosp_'+hospital] = int(hospital==site)
+
+    # Change missing data in the final output imputation to be resistant
+    data[output_antibiotics[site]] = data[output_antibiotics[site]].replace('no_data','RESISTANT')
+
+    # Convert susceptible/intermediate/resistant to numerical categorical values
+    data = data.replace({'SUSCEPTIBLE':0,'INTERMEDIATE':1,'RESISTANT':1})
+
+    one_hot_data = preprocessing[site](data)
+
+    # Create a column of prior exposure to either penicillins or aminoglycosides
+    conditions = [((one_hot_data['PriorPenicillin']==0) & (one_hot_data['PriorAMG']==0)),
+                  ((one_hot_data['PriorPenicillin']==1) | (one_hot_data['PriorAMG']==1))]
+    # default -1 value should not occur, and is an error-checking mechanism
+    one_hot_data['PriorPenicillin_or_AMG'] = np.select(conditions, [0,1], default=-1)
+
+    # Create new categories of "prior non-[antibiotic class]"
+    for column, classes in prior_nonclass.items():
+        one_hot_data[column] = one_hot_data[classes].any(axis='columns')
+
+    # Add a column for combined pip-taz and tobramycin via multiplication
+    # (would only be 1 (resistant) if both are 1 (resistant), otherwise 0 (susceptible))
+    one_hot_data['Piptaz_or_Tobramycin_FINAL_imp'] = (one_hot_data['Piptaz_FINAL_imp'])*(one_hot_data['Tobramycin_FINAL_imp'])
+
+    # Previous resistance to each antibiotic (0 none or unknown, 1 susceptible, 2 resistant)
+    for antibiotic in antibiotic_list:
+        one_hot_data[antibiotic+'Resistance'] = features.previous_infection(one_hot_data['PriorGNOrg'],
+                                                                             one_hot_data[antibiotic+'_PGNO_imp'])
+
+    one_hot_data['Piptaz_or_TobramycinResistance'] = features.previous_infection_either(one_hot_data['PriorGNOrg'],
+                                                                                        one_hot_data['Piptaz_PGNO_imp'],
+                                                                                        one_hot_data['Tobramycin_PGNO_imp'])
+
+    # Convert prior resistance history into one-hot encoding
+    for antibiotic in antibiotic_list:
+        one_hot_data[antibiotic+'Resistance'] = one_hot_data[antibiotic+'Resistance'].replace({0:'no_prior',
+                                                                                               1:'susceptible',
+                                                                                               2:'nonsusceptible'
+                                                                                              })
+        one_hot_data = pd.get_dummies(one_hot_data,columns=[antibiotic+'Resistance'])
+
+    return one_hot_data
@@ -0,0 +1,222 @@
+##################################
+#                                #
+# evaluation.py                  #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Evaluation of a model's predictions on a test set, with bootstrap confidence intervals
+
+Every function takes the outcome of each isolate (1 = resistant, 0 = susceptible, as in
+the regression inputs) and the model's predicted probability of susceptibility (the
+output of the app, and predict_proba(X)[:,0] in the notebooks).
+
+The predictions are sorted once. A model only predicts a few distinct values (one for each
+combination of its inputs), so the test set comes down to the number of susceptible and
+resistant isolates at each distinct prediction, and every metric is a cumulative sum over
+these counts. A bootstrap replicate only has to count its resampled isolates at each
+prediction, without sorting again, and replicates are spread across processes.
+
+Metrics:
+    AUC:                            area under the ROC curve for resistance (the same as the notebooks' roc_auc_score)
+    observed susceptibility:        proportion of isolates that were susceptible
+    mean predicted susceptibility:  average prediction
+    at each cutoff of the app (80% and 90%), for the isolates whose predicted susceptibility is at least the cutoff:
+        coverage:                   proportion of isolates with such a prediction (the antibiotic would be suggested)
+        susceptible:                proportion of them that were susceptible
+        sensitivity:                proportion of susceptible isolates with such a prediction
+        specificity:                proportion of resistant isolates without such a prediction
+'''
+
+import os
+import warnings
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+
+# Predicted susceptibility cutoffs of the app, depending on clinical severity
+cutoffs = [0.8,0.9]
+
+# Bins of predicted susceptibility in the notebooks' calibration plots
+calibration_edges = np.arange(0,1.05,0.1)
+
+
+def _distinct(y, susceptibility):
+    '''
+    Returns the distinct predictions in ascending order, and for each isolate
+        the position of its prediction among them times 2, plus its outcome
+    '''
+    values, position = np.unique(np.asarray(susceptibility, dtype=float), return_inverse=True)
+    return values, 2*position.ravel() + np.asarray(y, dtype=np.intp)
+
+
+def _counts(codes, size, weights=None):
+    '''
+    Returns the number of susceptible (column 0) and resistant (column 1) isolates at each distinct prediction
+    '''
+    return np.bincount(codes, weights, minlength=2*size).reshape(size,2)
+
+
+def metric_names(cutoffs=cutoffs):
+    names = ['AUC','observed susceptibility','mean predicted susceptibility']
+    for measure in ['coverage','susceptible','sensitivity','specificity']:
+        names += ['{} at {:.0%}'.format(measure, cutoff) for cutoff in cutoffs]
+
+    return names
+
+
+def _metrics(counts, values, cutoffs):
+    '''
+    Takes counts of shape (..., distinct predictions, 2) from _counts
+    Returns an array of shape (..., metrics), in the order of metric_names
+    '''
+    susceptible = counts[...,0]
+    resistant   = counts[...,1]
+    S = susceptible.sum(-1)
+    R = resistant.sum(-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        # Pairs of a resistant and a susceptible isolate where the resistant isolate has the lower prediction,
+        # with ties counting half (predictions are in ascending order)
+        susceptible_above = S[...,None] - np.cumsum(susceptible, -1)
+        AUC = (resistant*(susceptible_above + 0.5*susceptible)).sum(-1) / (S*R)
+
+        total = S+R
+        observed  = S/total
+        predicted = ((susceptible+resistant)*values).sum(-1)/total
+
+        # Isolates with a prediction at or above each cutoff
+        suggested = (values[:,None] >= np.asarray(cutoffs)[None,:]).astype(float)
+        S_suggested = susceptible @ suggested
+        R_suggested = resistant   @ suggested
+
+        coverage    = (S_suggested+R_suggested)/total[...,None]
+        ppv         = S_suggested/(S_suggested+R_suggested)
+        sensitivity = S_suggested/S[...,None]
+        specificity = 1 - R_suggested/R[...,None]
+
+    return np.concatenate([np.stack([AUC,observed,predicted], -1), coverage, ppv, sensitivity, specificity], -1)
+
+
+def evaluate(y, susceptibility, cutoffs=cutoffs):
+    '''
+    Returns every metric (see above) as a Series
+    '''
+    values, codes = _distinct(y, susceptibility)
+    return pd.Series(_metrics(_counts(codes, len(values)), values, cutoffs), index=metric_names(cutoffs))
+
+
+def auc(y, score):
+    '''
+    Takes outcomes and a score that increases with resistance (e.g. reg.decision_function(X))
+    Returns the area under the ROC curve, or NaN if only one class is present
+    '''
+    y = np.asarray(y)
+    if len(np.unique(y))<2: return np.nan
+
+    # Higher scores are lower predictions of susceptibility
+    return evaluate(y, -np.asarray(score, dtype=float), cutoffs=[])['AUC']
+
+
+def roc_curve(y, score):
+    '''
+    Takes outcomes and a score that increases with resistance
+    Returns the false positive rate, true positive rate and score threshold at every distinct score,
+        as metrics.roc_curve with drop_intermediate=False
+    '''
+    values, codes = _distinct(y, -np.asarray(score, dtype=float))
+    counts = _counts(codes, len(values))
+
+    true_positives  = np.concatenate([[0],np.cumsum(counts[:,1])])
+    false_positives = np.concatenate([[0],np.cumsum(counts[:,0])])
+
+    return false_positives/false_positives[-1], true_positives/true_positives[-1], np.concatenate([[np.inf],-values])
+
+
+def calibration(y, susceptibility, edges=calibration_edges):
+    '''
+    Returns the number of susceptible and resistant isolates in each bin of predicted susceptibility
+        (bins include their minimum, as in the notebooks), and the proportion susceptible
+    '''
+    susceptibility = np.asarray(susceptibility, dtype=float)
+    y = np.asarray(y, dtype=np.intp)
+
+    bins = np.searchsorted(edges, susceptibility, side='right')-1
+    inside = (bins>=0) & (bins<len(edges)-1)
+    counts = _counts(2*bins[inside] + y[inside], len(edges)-1)
+
+    table = pd.DataFrame({'Bin minimum':edges[:-1], 'S count':counts[:,0], 'R count':counts[:,1]})
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table['S percentage'] = counts[:,0]/counts.sum(1)
+
+    return table
+
+
+# Distinct predictions and isolates of the worker process, set once by _set_data
+_data = None
+
+def _set_data(data):
+    global _data
+    _data = data
+
+
+def _replicates(seed, replicates):
+    '''
+    Returns the metrics of replicates bootstrap samples of the isolates in _data, as an array (replicates, metrics)
+    '''
+    values, codes, cutoffs = _data
+    rng = np.random.default_rng(seed)
+    n = len(codes)
+
+    # Each replicate is the number of times each isolate is drawn; samples are drawn a block at a time
+    block = max(1, min(replicates, 2000000//max(n,1)))
+    results = []
+
+    for start in range(0, replicates, block):
+        size = min(block, replicates-start)
+        drawn = codes[rng.integers(0, n, (size,n))] + 2*len(values)*np.arange(size)[:,None]
+        counts = np.bincount(drawn.ravel(), minlength=2*len(values)*size).reshape(size,len(values),2)
+        results.append(_metrics(counts, values, cutoffs))
+
+    return np.concatenate(results)
+
+
+def bootstrap(y, susceptibility, replicates=2000, confidence=0.95, cutoffs=cutoffs, seed=0, processes=None,
+              chunksize=250):
+    '''
+    Returns every metric with a percentile bootstrap confidence interval, as a DataFrame
+        (metric, estimate, lower, upper), using replicates resamples of the isolates
+    Replicates are computed chunksize at a time across processes (1 computes them in this process);
+        the result only depends on seed, not on the number of processes
+    '''
+    values, codes = _distinct(y, susceptibility)
+    data = (values, codes, list(cutoffs))
+
+    chunks = [chunksize]*(replicates//chunksize) + ([replicates%chunksize] if replicates%chunksize else [])
+    seeds  = np.random.SeedSequence(seed).spawn(len(chunks))
+
+    processes = processes or os.cpu_count()
+    if processes==1 or len(chunks)==1:
+        _set_data(data)
+        results = [_replicates(i, j) for i, j in zip(seeds, chunks)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(processes,len(chunks)),
+                                                    initializer=_set_data, initargs=(data,)) as executor:
+            results = list(executor.map(_replicates, seeds, chunks))
+
+    results = np.concatenate(results)
+    alpha = (1-confidence)/2
+
+    # Replicates without both outcomes have no AUC, and are left out of its interval
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        lower, upper = np.nanquantile(results, [alpha,1-alpha], axis=0)
+
+    return pd.DataFrame({'metric':  metric_names(cutoffs),
+                         'estimate':_metrics(_counts(codes, len(values)), values, list(cutoffs)),
+                         'lower':   lower,
+                         'upper':   upper})
@@ -0,0 +1,82 @@
+##################################
+#                                #
+# features.py                    #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Prior resistance features for the regression notebooks, computed a column at a time
+
+Both functions expect susceptibilities that have already been converted to numbers
+by the regression notebooks (0 = susceptible, 1 = resistant), with no_data and
+not_applicable left as text.
+'''
+
+import numpy as np
+
+
+# Codes for prior susceptibility results
+susceptible, resistant, no_data, other = 0, 1, 2, 3
+
+# Piperacillin-tazobactam and tobramycin combined, indexed by [Piptaz code, Tobramycin code]
+# Resistance to either one counts as 1 and resistance to both as 2; -1 marks combinations that should not occur
+either_resistance = np.array([[ 0, 1, 0,-1],
+                              [ 1, 2, 1,-1],
+                              [ 0, 1, 0,-1],
+                              [-1,-1,-1,-1]])
+
+
+def susceptibility_codes(prior_susceptibility):
+    '''
+    Takes a column of prior susceptibilities
+    Returns an array of susceptible, resistant, no_data or other codes
+    '''
+    codes = np.full(len(prior_susceptibility), other, dtype=np.int8)
+    codes[(prior_susceptibility=='no_data').to_numpy(dtype=bool)] = no_data
+    codes[(prior_susceptibility==1).to_numpy(dtype=bool)]         = resistant
+    codes[(prior_susceptibility==0).to_numpy(dtype=bool)]         = susceptible
+
+    return codes
+
+
+def previous_infection(prior_gn_organism, prior_susceptibility):
+    '''
+    For a given antibiotic, takes columns of previous gram negative organisms and their susceptibilities
+    Returns an array of:
+        0 if no previous gram negative organism
+        0 if previous gram negative organism without susceptibility data
+        1 if previous susceptible gram negative organism
+        2 if previous resistant gram negative organism
+    '''
+    no_organism = (prior_gn_organism=='not_applicable').to_numpy(dtype=bool)
+    codes = susceptibility_codes(prior_susceptibility)
+
+    if ((codes==other) & ~no_organism).any():
+        raise ValueError('Inputs passed to the previous_infection function are invalid.')
+
+    result = np.zeros(len(codes), dtype=np.int64)
+    result[codes==susceptible] = 1
+    result[codes==resistant]   = 2
+    result[no_organism]        = 0
+
+    return result
+
+
+def previous_infection_either(prior_gn_organism, first_susceptibility, second_susceptibility):
+    '''
+    Takes columns of previous gram negative organisms and their susceptibilities to two antibiotics
+        (piperacillin-tazobactam and tobramycin)
+    Returns an array of:
+        0 if no previous gram negative organism
+        0 if previous gram negative organism without susceptibility data for either antibiotic
+        0 if previous susceptibility to both antibiotics, or to one with no data for the other
+        1 if previous resistance to only one of the two antibiotics (the other may be susceptible or have no data)
+        2 if previous resistance to both antibiotics
+       -1 for any other combination, which should not occur
+    '''
+    result = either_resistance[susceptibility_codes(first_susceptibility),
+                               susceptibility_codes(second_susceptibility)]
+    result[(prior_gn_organism=='not_applicable').to_numpy(dtype=bool)] = 0
+
+    return result
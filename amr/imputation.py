@@ -0,0 +1,243 @@
+##################################
+#                                #
+# imputation.py                  #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Rule engine for imputing antimicrobial susceptibilities
+
+The organism rules that used to live in the imputation_*.ipynb notebooks as one
+data.loc[...] assignment per rule are kept in rules/<site>.csv, one row per rule.
+Each row has the following columns:
+    drug:            imputed antibiotic, e.g. Piptaz fills Piptaz_PGNO_imp and Piptaz_FINAL_imp
+    suffixes:        culture columns the rule applies to, separated by semicolons (PGPO;PGNO;FINAL)
+    precedence:      order of the rule within its drug; a later rule overwrites an earlier one
+    group:           rules that sat in the same try/except KeyError block in the notebook.
+                     If one of their antibiogram columns is absent from the data, that rule
+                     and the rest of its group are skipped
+    organism_match:  equals, not_equals, startswith, contains (case sensitive),
+                     icontains (case insensitive), or blank to match every organism
+    organism:        organism name or genus the match is made against
+    antibiogram:     susceptibility columns that must show the result, separated by semicolons
+    result:          SUSCEPTIBLE/INTERMEDIATE/RESISTANT (any antibiogram column matches)
+                     or missing (all antibiogram columns are blank)
+    outcome:         value written to the imputed column
+
+Rules are compiled once against the columns of an extract, and every distinct
+organism and antibiogram condition is evaluated only once per culture suffix.
+Organism conditions are evaluated on the distinct organism names (see organisms.py)
+rather than on every row. With timing on (see timing.py), each imputed column and each
+rule that has to check antibiogram results is timed.
+'''
+
+import os
+import csv
+
+import numpy as np
+import pandas as pd
+
+from amr import organisms, timing
+
+
+rules_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules')
+
+# Imputed antibiotics, in the order the notebooks created their _imp columns
+imputed_drugs = ['Penicillin','Amoxiclav','Ampicillin','Cloxacillin',
+                 'Piptaz',
+                 'Cefazolin','Ceftriaxone','Ceftazidime',
+                 'Ertapenem','Meropenem',
+                 'Ciprofloxacin','Levofloxacin','Moxifloxacin',
+                 'Daptomycin','Vancomycin','Linezolid',
+                 'Amikacin','Tobramycin','Gentamicin',
+                 'Clindamycin','Doxycycline',
+                 'Erythromycin','TMPSMX']
+
+# Organism column that each culture suffix refers to
+organism_columns = {'_PGPO':'PriorGPOrg','_PGNO':'PriorGNOrg','_FINAL':'FINAL'}
+
+# Culture suffixes imputed at each site, in the order the notebooks created their columns
+imputed_suffixes = {'Sunnybrook':['_PGPO','_PGNO','_FINAL'],
+                    'TOH':       ['_FINAL','_PGNO'],
+                    'Trillium':  ['_FINAL','_PGNO']}
+
+# Value of an imputed column when no rule applies
+no_data = 'no_data'
+
+
+def load_rules(site):
+    '''
+    Reads the imputation rule table of a site (e.g. 'Sunnybrook')
+    Returns a list of rules (dicts), sorted by drug and precedence
+    '''
+    with open(os.path.join(rules_directory, site+'.csv'), newline='') as f:
+        rules = list(csv.DictReader(f))
+
+    for rule in rules:
+        rule['suffixes']    = ['_'+i for i in rule['suffixes'].split(';')]
+        rule['precedence']  = int(rule['precedence'])
+        rule['antibiogram'] = rule['antibiogram'].split(';') if rule['antibiogram'] else []
+
+    return sorted(rules, key=lambda rule: (imputed_drugs.index(rule['drug']), rule['precedence']))
+
+
+def compile_rules(rules, suffixes, columns):
+    '''
+    Resolves a rule table against the columns available in an extract
+    Rules in a group are dropped from the first one that needs a missing antibiogram column,
+        the same way a KeyError ended the notebooks' try blocks
+    Returns a list with one (suffix, organism column, targets) entry per suffix, where targets is a list of
+        (imputed column, [(organism condition, antibiogram condition, outcome, precedence), ...]) in order of precedence
+    '''
+    columns = set(columns)
+    compiled = []
+
+    for suffix in suffixes:
+
+        targets = []
+        for drug in imputed_drugs:
+
+            drug_rules = []
+            failed_groups = set()
+            for rule in rules:
+                if rule['drug']!=drug or suffix not in rule['suffixes']: continue
+                if rule['group'] and rule['group'] in failed_groups: continue
+
+                antibiogram = tuple(i+suffix for i in rule['antibiogram'])
+                missing_columns = [i for i in antibiogram if i not in columns]
+                if missing_columns:
+                    if rule['group']:
+                        failed_groups.add(rule['group'])
+                        continue
+                    raise KeyError('Imputation rule {} #{} needs missing columns: {}'.format(
+                        drug, rule['precedence'], missing_columns))
+
+                organism_condition    = (rule['organism_match'], rule['organism'])
+                antibiogram_condition = (antibiogram, rule['result']) if antibiogram else None
+                drug_rules.append((organism_condition, antibiogram_condition, rule['outcome'], rule['precedence']))
+
+            targets.append((drug+suffix+'_imp', drug_rules))
+
+        compiled.append((suffix, organism_columns[suffix], targets))
+
+    return compiled
+
+
+def _equals(series, value):
+    '''
+    Elementwise comparison of a column with a value, with blanks never matching
+    '''
+    return (series==value).fillna(False).to_numpy(dtype=bool)
+
+
+def organism_mask(organism, condition):
+    '''
+    Evaluates an (organism_match, organism) condition on a column of organism names
+    Returns a boolean NumPy array
+    '''
+    match, value = condition
+
+    if   match=='':           return np.ones(len(organism), dtype=bool)
+    elif match=='equals':     return _equals(organism, value)
+    elif match=='not_equals': return ~_equals(organism, value)
+    elif match=='startswith': return organism.str.startswith(value, na=False).to_numpy(dtype=bool)
+    elif match=='contains':   return organism.str.contains(value, na=False).to_numpy(dtype=bool)
+    elif match=='icontains':  return organism.str.contains(value, case=False, regex=False, na=False).to_numpy(dtype=bool)
+
+    else: raise ValueError('Unknown organism match: {}'.format(match))
+
+
+def antibiogram_mask(data, condition, cache):
+    '''
+    Evaluates an (antibiogram columns, result) condition
+    Single-column comparisons are stored in cache so that they are shared between rules
+    Returns a boolean NumPy array
+    '''
+    columns, result = condition
+
+    masks = []
+    for column in columns:
+        if (column, result) not in cache:
+            if result=='missing': cache[(column, result)] = data[column].isna().to_numpy(dtype=bool)
+            else:                 cache[(column, result)] = _equals(data[column], result)
+        masks.append(cache[(column, result)])
+
+    if result=='missing': return np.logical_and.reduce(masks)
+    else:                 return np.logical_or.reduce(masks)
+
+
+def impute_column(data, codes, categories, drug_rules, organism_cache, antibiogram_cache, column=None, site=None):
+    '''
+    Applies the compiled rules of one imputed column, given the organism codes of its culture suffix
+    Organism and antibiogram conditions are stored in the caches, which are shared by the columns of a suffix
+    column and site only label the timing of each rule
+    Returns the imputed column as a NumPy array
+    '''
+    for organism_condition, _, _, _ in drug_rules:
+        if organism_condition not in organism_cache:
+            organism_cache[organism_condition] = organisms.lookup(
+                categories, lambda names: organism_mask(names, organism_condition))
+
+    # Index of the winning rule for each organism code, where 0 means no rule applied
+    # Rules without an antibiogram condition are settled here, before touching any rows
+    code_winner = np.zeros(len(categories)+1, dtype=np.int16)
+    for i, (organism_condition, antibiogram_condition, _, _) in enumerate(drug_rules, 1):
+        if antibiogram_condition is None:
+            code_winner[organism_cache[organism_condition]] = i
+
+    # Index of the winning rule for each row; blanks (code -1) read the last entry
+    winner = code_winner[codes]
+    for i, (organism_condition, antibiogram_condition, _, precedence) in enumerate(drug_rules, 1):
+        if antibiogram_condition is None: continue
+
+        with timing.span('impute_rule', site=site, column=column, precedence=precedence):
+            mask = organism_cache[organism_condition][codes]
+            mask &= antibiogram_mask(data, antibiogram_condition, antibiogram_cache)
+            mask &= winner<i
+
+            winner[mask] = i
+
+    outcomes = np.array([no_data]+[rule[2] for rule in drug_rules], dtype=object)
+    return outcomes[winner]
+
+
+def apply_rules(data, compiled, site=None):
+    '''
+    Applies compiled rules to an extract
+    Each imputed column holds the outcome of the last rule that matches the row, or no_data
+    Returns a dict of imputed column name: NumPy array
+    '''
+    imputed = {}
+
+    for suffix, organism_column, targets in compiled:
+
+        # Organism conditions are evaluated per distinct organism and looked up by code
+        codes, categories = organisms.organism_codes(data[organism_column])
+        organism_cache    = {}
+        antibiogram_cache = {}
+
+        for column, drug_rules in targets:
+            with timing.span('impute_column', site=site, column=column):
+                imputed[column] = impute_column(data, codes, categories, drug_rules,
+                                                organism_cache, antibiogram_cache, column, site)
+
+    return imputed
+
+
+def impute(data, site, rules=None):
+    '''
+    Fills in the <Drug><suffix>_imp columns of an extract from a site's rule table
+    Takes a DataFrame that has already had INTERMEDIATE results converted to RESISTANT
+    Returns the DataFrame with the imputed columns added
+    '''
+    if rules is None: rules = load_rules(site)
+
+    compiled = compile_rules(rules, imputed_suffixes[site], data.columns)
+    imputed  = apply_rules(data, compiled, site)
+
+    # Column order follows the blank columns the notebooks created before imputing
+    order = [drug+suffix+'_imp' for suffix in imputed_suffixes[site] for drug in imputed_drugs]
+    data[order] = pd.DataFrame(imputed, index=data.index)[order]
+
+    return data
@@ -0,0 +1,352 @@
+##################################
+#                                #
+# ingest.py                      #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Chunked imputation of raw AMR extracts that are too large to load at once
+
+The imputation notebooks read a whole extract with pd.read_excel and clean it in place.
+Every cleaning step and imputation rule only looks at one row at a time, so an extract
+saved as CSV or Parquet can instead be read in chunks, with each chunk cleaned, imputed,
+and appended to the Parquet file read by the regression notebooks (see storage.py).
+Peak memory then depends on the chunk size rather than on the size of the extract.
+
+For the same reason, a refreshed cumulative extract only needs its new and changed rows
+imputed: impute_incremental() reuses the imputed rows of the previous output for rows
+whose contents are unchanged (see rows_path).
+
+Usage:
+    from amr import ingest
+    ingest.impute_file('AMR_data_TOH.csv', '2024-12-14 AMR_imputation_TOH.parquet', 'TOH')
+    ingest.update_file('AMR_data_Sunnybrook.csv', '2024-05-19 AMR_imputation_Sunnybrook.parquet', 'Sunnybrook',
+                       columns=ingest.output_columns['Sunnybrook'])
+'''
+
+import os
+import json
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from amr import cache, imputation, organisms, storage, timing
+
+
+def clean_Sunnybrook(data):
+    '''
+    Same cleaning as imputation_Sunnybrook.ipynb
+    '''
+    return data.fillna('missing_data')
+
+
+def clean_TOH(data):
+    '''
+    Same cleaning as imputation_TOH.ipynb
+    '''
+    # Strip whitespace out of column names
+    data = data.rename(columns=lambda x: x.strip())
+
+    # Strip whitespace out of string-based column values
+    data_strings = data.select_dtypes(['object', 'category'])
+    data[data_strings.columns] = data_strings.apply(lambda x: x.str.strip())
+
+    # Change Female to F and Male to M
+    data = data.replace({'Female':'F','Male':'M'})
+
+    # Change capitalization of Susceptible/Intermediate/Resistant
+    data.loc[:,'AMIKACIN_FINAL':'TOBRAMYCIN_PGNO'] = data.loc[:,'AMIKACIN_FINAL':'TOBRAMYCIN_PGNO'].map(
+        lambda s: s.upper() if type(s)==str else s)
+
+    # Change blanks in PriorGNOrg to not_applicable
+    data['PriorGNOrg'] = data['PriorGNOrg'].fillna('not_applicable')
+
+    return data
+
+
+def clean_Trillium(data):
+    '''
+    Same cleaning as imputation_Trillium.ipynb
+    '''
+    data = data.rename(columns=lambda x: x.strip())
+
+    # Capitalize organism names before the rest of the TOH cleaning, which fills blanks in PriorGNOrg
+    data.loc[:,['FINAL','PriorGNOrg']] = data.loc[:,['FINAL','PriorGNOrg']].map(
+        lambda s: s.strip().capitalize() if type(s)==str else s)
+
+    return clean_TOH(data)
+
+
+cleaning = {'Sunnybrook':clean_Sunnybrook,
+            'TOH':       clean_TOH,
+            'Trillium':  clean_Trillium}
+
+# Columns of the imputed extract kept by imputation_Sunnybrook.ipynb (None keeps every column)
+output_columns = {'Sunnybrook':['Anonymous_ID','Episode','AgeCat','Sex','YearOfAdmission',
+                                'Community(1), Hospital(2)','ICU Aquired','Medical(1) Surgical (2) Admitting Service',
+                                'ClincalMRAS','ClinicalVRE','ClinicalESBL','RecentHospitalization','ICUExposure',
+                                'culture_test_cd',
+                                'PriorPenicillin','PriorCephalosporin','PriorCarbapenem',
+                                'PriorAMG','PriorFQ','PriorOtherAbx',
+                                'PriorGNOrg','FINAL']
+                               + [drug+'_FINAL_imp' for drug in imputation.imputed_drugs]
+                               + [drug+'_PGNO_imp'  for drug in imputation.imputed_drugs],
+                  'TOH':       None,
+                  'Trillium':  None}
+
+# Columns identifying an isolate, used to report new and changed episodes (the TOH and Trillium extracts have none)
+row_keys = {'Sunnybrook':['Anonymous_ID','Episode'],
+            'TOH':       [],
+            'Trillium':  []}
+
+
+
+def mark_not_applicable(data, site):
+    '''
+    Where there was no prior culture, sets the organism and its imputed columns to not_applicable,
+        the same as the processing step of the imputation notebooks
+    Returns the DataFrame
+    '''
+    for suffix in imputation.imputed_suffixes[site]:
+        if suffix=='_FINAL': continue
+
+        organism_column = imputation.organism_columns[suffix]
+        no_culture = data[organism_column].isin(organisms.no_organism)
+        imputed_columns = [drug+suffix+'_imp' for drug in imputation.imputed_drugs]
+
+        data.loc[no_culture, [organism_column]+imputed_columns] = 'not_applicable'
+
+    return data
+
+
+def read_chunks(path, chunksize):
+    '''
+    Reads an extract saved as CSV or Parquet, chunksize rows at a time
+    Yields DataFrames
+    '''
+    path = str(path)
+
+    if path.endswith(('.csv','.csv.gz','.txt')):
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            yield chunk
+
+    elif path.endswith('.parquet'):
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+
+    else: raise ValueError('Extracts must be saved as CSV or Parquet to be read in chunks: {}'.format(path))
+
+
+def read_extract(path):
+    '''
+    Reads a whole raw extract, saved as Excel (as received), CSV or Parquet
+    Returns a DataFrame
+    '''
+    path = str(path)
+
+    if   path.endswith(('.xlsx','.xls')):         return pd.read_excel(path)
+    elif path.endswith(('.csv','.csv.gz','.txt')): return pd.read_csv(path)
+    elif path.endswith('.parquet'):                return pd.read_parquet(path)
+    else: raise ValueError('Extracts must be saved as Excel, CSV or Parquet: {}'.format(path))
+
+
+def impute_chunk(data, site, rules):
+    '''
+    Cleans and imputes one chunk of a site's extract
+    Returns the imputed DataFrame
+    '''
+    with timing.span('clean', site=site):
+        data = cleaning[site](data)
+
+    return impute_cleaned(data, site, rules)
+
+
+def impute_cleaned(data, site, rules=None):
+    '''
+    Imputes an extract that has already been cleaned with cleaning[site]
+    Returns the imputed DataFrame
+    '''
+    # Convert all INTERMEDIATE isolates to RESISTANT
+    data = data.replace('INTERMEDIATE','RESISTANT')
+
+    with timing.span('impute', site=site):
+        data = organisms.categorize(data)
+        data = imputation.impute(data, site, rules)
+        data = mark_not_applicable(data, site)
+
+    return data
+
+
+def impute_file(path, output_path, site, chunksize=100000, columns=None):
+    '''
+    Imputes a raw extract chunk by chunk, appending each chunk to a Parquet file
+    columns optionally limits the columns written, e.g. output_columns['Sunnybrook']
+    Returns the number of rows written
+    '''
+    rules = imputation.load_rules(site)
+
+    def imputed_chunks():
+        for chunk in read_chunks(path, chunksize):
+            chunk = impute_chunk(chunk, site, rules)
+            yield chunk if columns is None else chunk[columns]
+
+    return storage.write_chunks(imputed_chunks(), output_path)
+
+
+def rows_path(output_path):
+    '''
+    Returns the path of the file kept next to an imputed output by impute_incremental(),
+        with the hash of each row of the cleaned extract that the output's rows were imputed from
+    '''
+    root, extension = os.path.splitext(str(output_path))
+    return root+'_rows.parquet'
+
+
+def row_hashes(data, site):
+    '''
+    Returns a DataFrame of a 64 bit hash of the contents of each row, and the row_keys of the site
+    '''
+    rows = pd.DataFrame({'row_hash':pd.util.hash_pandas_object(data, index=False).to_numpy()})
+    for key in row_keys[site]: rows[key] = data[key].to_numpy()
+
+    return rows
+
+
+def incremental_state(data, site, rules, columns):
+    '''
+    Returns a hash of everything other than a row's contents that its imputed output depends on:
+        the site, the rules, the columns of the cleaned extract and of the output, and the imputation code
+    Rows are only reused from an output written with the same state
+    '''
+    h = hashlib.sha256(json.dumps([site, rules, list(map(str,data.columns)), columns], default=str).encode())
+    h.update(cache.code_version([imputation, organisms, storage]).encode())
+    h.update(cache.file_hash(__file__).encode())
+
+    return h.hexdigest()
+
+
+def read_rows(output_path, state):
+    '''
+    Returns the row hashes (and keys) of a previous output, or None if it cannot be reused:
+        missing, written with a different state, or changed since the row hashes were written
+    '''
+    path = rows_path(output_path)
+    if not (os.path.exists(path) and os.path.exists(output_path)): return None
+
+    import pyarrow.parquet
+    table = pyarrow.parquet.read_table(path)
+    metadata = {key.decode():value.decode() for key, value in (table.schema.metadata or {}).items()}
+
+    if metadata.get('amr_state')!=state or metadata.get('amr_output')!=cache.file_hash(output_path): return None
+
+    return table.to_pandas()
+
+
+def write_rows(rows, output_path, state):
+    '''
+    Writes the row hashes of an output to rows_path(output_path), with the state and the hash of the output
+    '''
+    import pyarrow, pyarrow.parquet
+
+    table = pyarrow.Table.from_pandas(rows, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           b'amr_state': state.encode(),
+                                           b'amr_output':cache.file_hash(output_path).encode()})
+    _write_replacing(lambda path: pyarrow.parquet.write_table(table, path), rows_path(output_path))
+
+
+def _write_replacing(write, path):
+    '''
+    Calls write(temporary path) in the folder of path, then renames the temporary file over path
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix='.'+os.path.basename(path)+'.',
+                                         suffix=os.path.splitext(path)[1])
+    os.close(handle)
+
+    try:
+        write(temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary): os.unlink(temporary)
+        raise
+
+
+def impute_incremental(data, output_path, site, rules=None, columns=None):
+    '''
+    Takes a whole cleaned extract (see cleaning), e.g. this month's cumulative extract
+    Imputes only the rows that are not in the previous output at output_path with the same contents,
+        reusing the imputed rows of the previous output for the others
+    Writes the same file as imputing every row, in the order of the extract, and its row hashes (see rows_path)
+    Returns a dict of counts: rows, reused and imputed, and for sites with row_keys,
+        new (isolates not in the previous output), changed and removed
+    '''
+    if rules is None: rules = imputation.load_rules(site)
+
+    data  = data.reset_index(drop=True)
+    state = incremental_state(data, site, rules, columns)
+    keys  = row_keys[site]
+    match = ['row_hash']+keys
+
+    rows = row_hashes(data, site)
+
+    previous = read_rows(output_path, state)
+    if previous is None: previous = pd.DataFrame(columns=match)
+
+    # Position of each row in the previous output, for rows with the same contents (duplicates share the first)
+    previous_position = previous[match].reset_index(names='previous').drop_duplicates(match)
+    matched = rows[match].merge(previous_position, how='left', on=match)['previous']
+    reuse   = matched.notna().to_numpy()
+
+    imputed = impute_cleaned(data[~reuse].copy(), site, rules)
+    if columns is not None: imputed = imputed[columns]
+
+    if reuse.any():
+        # Reused rows keep their stored types, and only the imputed rows are converted to them
+        reused  = storage.read(output_path, placeholders=False).iloc[matched[reuse].astype(int)]
+        imputed = storage.encode(imputed[reused.columns].copy())
+        reused.index  = np.flatnonzero(reuse)
+        imputed.index = np.flatnonzero(~reuse)
+
+        # Organism categories as when imputing every row: those of the whole extract
+        for column in organisms.organism_column_names:
+            if column not in reused.columns: continue
+            categories = organisms.categorize(data[[column]].copy())[column].cat.categories
+            reused[column]  = reused[column].cat.set_categories(categories)
+            imputed[column] = imputed[column].cat.set_categories(categories)
+
+        output = pd.concat([reused, imputed]).sort_index()
+        output.attrs[storage.placeholders_attribute] = {**reused.attrs.get(storage.placeholders_attribute,{}),
+                                                        **imputed.attrs[storage.placeholders_attribute]}
+    else:
+        output = imputed
+
+    _write_replacing(lambda path: storage.write(output, path), output_path)
+    write_rows(rows, output_path, state)
+
+    counts = {'rows':len(data), 'reused':int(reuse.sum()), 'imputed':int((~reuse).sum())}
+
+    if keys:
+        previous_keys = pd.MultiIndex.from_frame(previous[keys]).unique()
+        current_keys  = pd.MultiIndex.from_frame(rows[keys])
+        in_previous   = current_keys.isin(previous_keys)
+
+        counts['new']     = int((~reuse & ~in_previous).sum())
+        counts['changed'] = int((~reuse &  in_previous).sum())
+        counts['removed'] = int((~previous_keys.isin(current_keys)).sum())
+
+    return counts
+
+
+def update_file(path, output_path, site, columns=None):
+    '''
+    Reads and cleans a whole raw extract (e.g. a monthly cumulative extract), then imputes it with impute_incremental()
+    Returns the counts of impute_incremental()
+    '''
+    data = cleaning[site](read_extract(path))
+
+    return impute_incremental(data, output_path, site, imputation.load_rules(site), columns)
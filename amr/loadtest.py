@@ -0,0 +1,362 @@
+##################################
+#                                #
+# loadtest.py                    #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Load test of one worker of the shiny app, with many clinicians using it at once
+
+Launches the app in shiny core on a local port (one uvicorn worker, as deployed), and
+drives concurrent sessions through its websocket, the same way browsers do. Each session
+starts with random form values (the same as benchmark.py), then changes one to three
+inputs at a time (including the severity and "compare all sites"), waiting a random
+think time (exponential, with mean --think seconds) between changes.
+
+For every change, the time until each output that was redrawn arrives at the session
+(predicted_susceptibilities, plot, input_values) is recorded, and its 50th, 95th and 99th
+percentiles are reported per output, with the time for a new session to receive its first
+outputs (connect). The worker's CPU use and memory (RSS) are sampled throughout (needs
+psutil, or Linux), as is the CPU use of the load test itself: if it approaches 100%, the
+sessions are limited by the load test rather than by the app.
+
+Each number of sessions runs against a newly started app, for --duration seconds after
+every session has connected. Results are added to loadtest_results.csv, one row per output
+for each number of sessions, with the code and library versions, so that runs can be
+compared. Needs shiny (and its websockets dependency) installed.
+
+Usage:
+    python -m amr.loadtest --sessions 1 10 50 100 --duration 30 --think 1
+    python -m amr.loadtest --sessions 200 --think 0 --fast-start
+    python -m amr.loadtest --url ws://localhost:8000/websocket/ --pid 12345 --sessions 20
+'''
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+from amr import benchmark, training
+
+
+outputs = ['predicted_susceptibilities','plot','input_values']
+
+results_filename = 'loadtest_results.csv'
+
+result_columns = ['run','commit','python','numpy','pandas','processors',
+                  'sessions','think','duration','fast_start','output',
+                  'calls','p50_ms','p95_ms','p99_ms','max_ms','updates_per_second','errors',
+                  'worker_cpu_percent','worker_cpu_percent_max',
+                  'worker_rss_start_bytes','worker_rss_max_bytes','worker_rss_end_bytes',
+                  'client_cpu_percent']
+
+# Seconds between samples of the worker's CPU and memory
+sample_interval = 0.5
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1',0))
+        return s.getsockname()[1]
+
+
+def launch(directory=benchmark.app_directory, port=None, fast_start=False, timeout=60):
+    '''
+    Starts the app in a new uvicorn process, and waits until it serves its page
+    Returns the process and the websocket URL of the app
+    '''
+    port = port or free_port()
+
+    environment = dict(os.environ)
+    environment.pop('AMR_FAST_START', None)
+    if fast_start: environment['AMR_FAST_START'] = '1'
+
+    process = subprocess.Popen([sys.executable,'-m','uvicorn','shiny_core_regression:app',
+                                '--host','127.0.0.1','--port',str(port),'--log-level','warning'],
+                               cwd=directory, env=environment)
+
+    deadline = time.perf_counter()+timeout
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError('The app exited with code {} before serving'.format(process.returncode))
+        try:
+            urllib.request.urlopen('http://127.0.0.1:{}/'.format(port), timeout=1).read()
+            break
+        except OSError:
+            if time.perf_counter()>deadline:
+                process.terminate()
+                raise RuntimeError('The app did not serve within {} s'.format(timeout))
+            time.sleep(0.05)
+
+    return process, 'ws://127.0.0.1:{}/websocket/'.format(port)
+
+
+def usage(pid):
+    '''
+    Returns the CPU seconds used so far and the memory (RSS) in bytes of a process, or NaN where not available
+    '''
+    try:
+        import psutil
+        process = psutil.Process(pid)
+        cpu = process.cpu_times()
+        return cpu.user+cpu.system, process.memory_info().rss
+    except ImportError:
+        pass
+
+    # Linux, without psutil
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            fields = f.read().rsplit(')',1)[1].split()
+        with open('/proc/{}/statm'.format(pid)) as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return np.nan, np.nan
+
+    ticks = os.sysconf('SC_CLK_TCK')
+    return (int(fields[11])+int(fields[12]))/ticks, pages*os.sysconf('SC_PAGE_SIZE')
+
+
+def form_inputs(rng, app_encoding):
+    '''
+    Returns the values of every input of the form, random as in benchmark.py,
+        with the client data that tells shiny the outputs are visible
+    '''
+    values = benchmark.form_values(rng, app_encoding, training.antibiotic_list)
+    values = {i:str(j) for i, j in values.items()}
+    values['CompareSites'] = bool(rng.random()<0.2)
+    values['Severity']     = str(rng.choice(['80','90']))
+
+    # Hidden outputs are not computed
+    for output in outputs:
+        values['.clientdata_output_{}_hidden'.format(output)] = False
+    values['.clientdata_pixelratio'] = 1
+
+    return values
+
+
+def change(rng, app_encoding, values):
+    '''
+    Returns one to three inputs of a session's form changed to other random values
+    '''
+    new = form_inputs(rng, app_encoding)
+    names = [i for i in new if not i.startswith('.') and new[i]!=values[i]]
+
+    return {str(i):new[i] for i in rng.choice(names, size=min(len(names),rng.integers(1,4)), replace=False)}
+
+
+class Session:
+    '''
+    One clinician's session: a websocket, and the times its outputs took to arrive
+    '''
+
+    def __init__(self, url, seed, app_encoding):
+        self.url = url
+        self.rng = np.random.default_rng(seed)
+        self.app_encoding = app_encoding
+        self.values = form_inputs(self.rng, app_encoding)
+
+        # output: [seconds, ...], with 'connect' for the first outputs of the session
+        self.latencies = {i:[] for i in ['connect']+outputs}
+        self.updates = 0
+        self.errors  = 0
+
+    async def cycle(self, websocket, message, expected=None):
+        '''
+        Sends a message, and waits until the outputs it changes arrive: every output in expected,
+            or without expected, the first redrawn output (outputs redrawn together arrive in one message)
+        Returns the seconds until each output arrived
+        '''
+        start = time.perf_counter()
+        await websocket.send(json.dumps(message))
+
+        arrived = {}
+        while not arrived or (expected and not expected<=set(arrived)):
+            reply = json.loads(await asyncio.wait_for(websocket.recv(), 60))
+
+            # Each flush of the session ends in one message with the values of the outputs that were redrawn
+            if 'values' in reply:
+                seconds = time.perf_counter()-start
+                for output in reply['values']: arrived[output] = seconds
+                self.errors += len(reply.get('errors') or {})
+
+        return arrived
+
+    async def run(self, connected, stop, think):
+        import websockets
+
+        async with websockets.connect(self.url, max_size=None) as websocket:
+            arrived = await self.cycle(websocket, {'method':'init','data':self.values}, set(outputs))
+            self.latencies['connect'].append(max(arrived.values()))
+            connected()
+
+            while not stop.is_set():
+                if think: await asyncio.sleep(self.rng.exponential(think))
+                if stop.is_set(): break
+
+                changed = change(self.rng, self.app_encoding, self.values)
+                self.values.update(changed)
+
+                # Which outputs are redrawn depends on the change (e.g. the hospital is not shown when comparing sites)
+                arrived = await self.cycle(websocket, {'method':'update','data':changed})
+                for output, seconds in arrived.items():
+                    if output in self.latencies: self.latencies[output].append(seconds)
+                self.updates += 1
+
+
+async def drive(url, sessions, duration, think, seed, pid, app_encoding, log=print):
+    '''
+    Runs sessions concurrent sessions against the app at url, for duration seconds after all have connected
+    Returns the sessions, the samples of the worker's usage ([(time, CPU seconds, RSS bytes), ...]),
+        the seconds they ran for and the CPU use of the load test (%)
+    '''
+    stop = asyncio.Event()
+    all_connected = asyncio.Event()
+    count = [0]
+
+    def connected():
+        count[0] += 1
+        if count[0]==sessions: all_connected.set()
+
+    clients = [Session(url, [seed,i], app_encoding) for i in range(sessions)]
+    tasks = [asyncio.ensure_future(client.run(connected, stop, think)) for client in clients]
+
+    samples = []
+    async def sample():
+        while not stop.is_set():
+            samples.append((time.perf_counter(), *usage(pid)) if pid else (time.perf_counter(), np.nan, np.nan))
+            await asyncio.sleep(sample_interval)
+
+    sampler = asyncio.ensure_future(sample())
+
+    # Wait for every session to connect (or fail)
+    waiting = asyncio.ensure_future(all_connected.wait())
+    await asyncio.wait([waiting]+tasks, return_when=asyncio.FIRST_COMPLETED)
+    failed = [task for task in tasks if task.done() and task.exception()]
+    if failed:
+        stop.set()
+        raise RuntimeError('A session failed to connect') from failed[0].exception()
+
+    log('{:>5} sessions connected, running for {} s'.format(sessions, duration))
+    start = time.perf_counter()
+    client_start = time.process_time()
+    samples.clear()
+
+    await asyncio.sleep(duration)
+    stop.set()
+    # A session that loses its connection or waits a minute for an output counts as an error
+    for client, result in zip(clients, await asyncio.gather(*tasks, return_exceptions=True)):
+        if isinstance(result, Exception): client.errors += 1
+    sampler.cancel()
+    waiting.cancel()
+    samples.append((time.perf_counter(), *usage(pid)) if pid else (time.perf_counter(), np.nan, np.nan))
+
+    elapsed = time.perf_counter()-start
+    return clients, samples, elapsed, (time.process_time()-client_start)/elapsed*100
+
+
+def summarize(clients, samples, elapsed, client_cpu, sessions, think, duration, fast_start):
+    '''
+    Returns one record per output (and connect) with its latency percentiles, and the worker's usage
+    '''
+    samples = np.array(samples, dtype=float)
+    if len(samples)>1:
+        cpu_percent = np.diff(samples[:,1])/np.diff(samples[:,0])*100
+        worker = {'worker_cpu_percent':     (samples[-1,1]-samples[0,1])/(samples[-1,0]-samples[0,0])*100,
+                  'worker_cpu_percent_max': np.nanmax(cpu_percent) if np.isfinite(cpu_percent).any() else np.nan,
+                  'worker_rss_start_bytes': samples[0,2],
+                  'worker_rss_max_bytes':   np.nanmax(samples[:,2]) if np.isfinite(samples[:,2]).any() else np.nan,
+                  'worker_rss_end_bytes':   samples[-1,2]}
+    else:
+        worker = {}
+
+    updates = sum(client.updates for client in clients)
+    errors  = sum(client.errors  for client in clients)
+
+    records = []
+    for output in ['connect']+outputs:
+        milliseconds = np.array([i for client in clients for i in client.latencies[output]])*1000
+        record = {'sessions':sessions, 'think':think, 'duration':duration, 'fast_start':fast_start, 'output':output,
+                  'calls':len(milliseconds), 'updates_per_second':updates/elapsed, 'errors':errors,
+                  'client_cpu_percent':client_cpu, **worker}
+        if len(milliseconds):
+            record.update({'p50_ms':np.percentile(milliseconds,50), 'p95_ms':np.percentile(milliseconds,95),
+                           'p99_ms':np.percentile(milliseconds,99), 'max_ms':milliseconds.max()})
+        records.append(record)
+
+    return records
+
+
+def run(sessions=[1,10,50], duration=30, think=1.0, seed=0, fast_start=False, url=None, pid=None,
+        directory=benchmark.app_directory, log=print):
+    '''
+    Runs the load test for each number of sessions, each against a newly started app (or the app at url)
+    Returns the results as a DataFrame, with the columns of result_columns
+    '''
+    sys.path.insert(0, directory)
+    import encoding as app_encoding
+
+    records = []
+    for count in sessions:
+        process = None
+        if url is None: process, app_url = launch(directory, fast_start=fast_start)
+        else:           app_url = url
+
+        try:
+            clients, samples, elapsed, client_cpu = asyncio.run(
+                drive(app_url, count, duration, think, seed, process.pid if process else pid, app_encoding, log))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+        count_records = summarize(clients, samples, elapsed, client_cpu, count, think, duration, fast_start)
+        for record in count_records:
+            log('{:>5} sessions {:<27} {:>7} calls {:8.1f} ms p50 {:8.1f} ms p95 {:8.1f} ms p99'.format(
+                count, record['output'], record['calls'], record.get('p50_ms',np.nan),
+                record.get('p95_ms',np.nan), record.get('p99_ms',np.nan)))
+        record = count_records[0]
+        log('{:>5} sessions {:.1f} updates/s, worker {:.0f}% CPU (max {:.0f}%), {:.0f} MB RSS (max {:.0f} MB), '
+            'load test {:.0f}% CPU\n'.format(count, record['updates_per_second'],
+                                              record.get('worker_cpu_percent',np.nan), record.get('worker_cpu_percent_max',np.nan),
+                                              record.get('worker_rss_end_bytes',np.nan)/2**20,
+                                              record.get('worker_rss_max_bytes',np.nan)/2**20, record['client_cpu_percent']))
+        records += count_records
+
+    results = pd.DataFrame(records)
+    for column, value in benchmark.environment().items():
+        results[column] = value
+
+    return results.reindex(columns=result_columns)
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description='Load test one worker of the shiny app with concurrent sessions')
+    parser.add_argument('--sessions', nargs='+', type=int, default=[1,10,50], help='numbers of concurrent sessions to run')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run each number of sessions for')
+    parser.add_argument('--think', type=float, default=1.0,
+                        help='mean seconds between changes in each session (0 for as fast as possible)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the form values')
+    parser.add_argument('--fast-start', action='store_true', help='start the app with AMR_FAST_START set')
+    parser.add_argument('--url', help='websocket URL of an app that is already running, instead of starting one')
+    parser.add_argument('--pid', type=int, help='process id of the app at --url, for its CPU and memory use')
+    parser.add_argument('--output', default=results_filename, help='CSV file that results are added to')
+    arguments = parser.parse_args(arguments)
+
+    results = run(arguments.sessions, arguments.duration, arguments.think, arguments.seed, arguments.fast_start,
+                  arguments.url, arguments.pid)
+    benchmark.append_results(results, arguments.output)
+    print('Results added to {}'.format(arguments.output))
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+##################################
+#                                #
+# organisms.py                   #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Organism index shared by the imputation and regression stages
+
+Extracts hold a few hundred distinct organism names repeated over many episodes.
+Organism columns are stored as pandas categoricals, so that genus, species and
+Gram stain are worked out once per distinct organism and looked up by integer code.
+'''
+
+import numpy as np
+import pandas as pd
+
+
+organism_column_names = ['PriorGPOrg','PriorGNOrg','FINAL']
+
+# Placeholders used in organism columns when there was no culture
+no_organism = ['missing_data','not_applicable']
+
+gram_stains = {'Acinetobacter':'negative','Bacteroides':'negative','Campylobacter':'negative',
+               'Citrobacter':'negative','Enterobacter':'negative','Escherichia':'negative',
+               'Eschericia':'negative','Haemophilus':'negative','Hemophilus':'negative',
+               'Klebsiella':'negative','Moraxella':'negative','Morganella':'negative',
+               'Neisseria':'negative','Pantoea':'negative','Proteus':'negative',
+               'Providencia':'negative','Pseudomonas':'negative','Salmonella':'negative',
+               'Serratia':'negative','Shigella':'negative','Stenotrophomonas':'negative',
+               'Yersinia':'negative',
+
+               'Actinomyces':'positive','Clostridium':'positive','Corynebacterium':'positive',
+               'Enterococcus':'positive','Granulicatella':'positive','Lactobacillus':'positive',
+               'Listeria':'positive','Staphylococcus':'positive','Streptococcus':'positive',
+
+               'Candida':'fungus'
+              }
+
+
+def categorize(data, columns=organism_column_names):
+    '''
+    Converts the organism columns of an extract to categoricals
+    The no_organism placeholders are always categories, so they can be assigned later on
+    Returns the DataFrame
+    '''
+    for column in columns:
+        if column not in data.columns: continue
+        if not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype('category')
+        missing_categories = [i for i in no_organism if i not in data[column].cat.categories]
+        if missing_categories:
+            data[column] = data[column].cat.add_categories(missing_categories)
+
+    return data
+
+
+def organism_codes(organisms):
+    '''
+    Takes a column of organism names
+    Returns an array of integer codes (-1 for blanks) and the organism name of each code
+    '''
+    if isinstance(organisms.dtype, pd.CategoricalDtype):
+        return organisms.cat.codes.to_numpy(), organisms.cat.categories
+
+    codes, categories = pd.factorize(organisms)
+    return codes, categories
+
+
+def organism_table(categories):
+    '''
+    Takes the organism name of each code
+    Returns a DataFrame with the genus, species and Gram stain of each organism, in code order
+    '''
+    names = pd.Series(categories, dtype=object)
+    split = names.str.split(' ', n=1, expand=True).reindex(columns=[0,1])
+
+    table = pd.DataFrame({'organism':names,
+                          'genus':   split[0].fillna(''),
+                          'species': split[1].fillna('')})
+    table.loc[names.isin(no_organism),['genus','species']] = ''
+    table['gram_stain'] = table['genus'].map(gram_stains).fillna('')
+
+    return table
+
+
+def attributes(organisms):
+    '''
+    Takes a column of organism names
+    Returns a DataFrame with the genus, species and Gram stain of each row, blank where there is no organism
+    '''
+    codes, categories = organism_codes(organisms)
+    table = organism_table(categories)[['genus','species','gram_stain']]
+
+    # Blank organisms (code -1) read the row of blanks appended at the end
+    values = np.vstack([table.to_numpy(dtype=object), np.array([['','','']], dtype=object)])
+
+    return pd.DataFrame(values[codes], index=organisms.index, columns=table.columns)
+
+
+def lookup(categories, mask_function):
+    '''
+    Evaluates an organism condition once per distinct organism
+    mask_function takes a Series of organism names and returns a boolean array
+    Returns a boolean array indexed by organism code, with the blank (-1) result stored last
+    '''
+    names = pd.Series(np.append(np.asarray(categories, dtype=object), np.nan), dtype=object)
+    return mask_function(names)
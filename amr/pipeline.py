@@ -0,0 +1,345 @@
+##################################
+#                                #
+# pipeline.py                    #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+One pipeline for every site: ingest -> impute -> encode -> train -> export
+
+The same steps as the imputation and regression notebooks, with the parts that differ
+between sites taken from each module's per-site settings (ingest.cleaning, the rule
+tables in amr/rules, encoding.preprocessing, training.train_fraction).
+    ingest: reads the raw extract and cleans it                    <output>/<site>/extract.parquet
+    impute: imputes susceptibilities from the site's rule table    <output>/<site>/imputed.parquet (new and changed rows only)
+    encode: one-hot encodes the rows used for the models           <output>/<site>/regression.parquet
+    train:  fits the temporal and final models                     <output>/<site>/models/
+    export: copies the final models to the app                     <export directory>/<Antibiotic>_<Site>.json and .npy
+
+Each stage only depends on the stage before it for the same site, so sites run at the
+same time in separate processes, and a failure at one site does not stop the others.
+A stage is skipped if the contents of its input files, its settings and the source of the
+amr modules it uses are the same as when it last ran (recorded in <output>/<site>/manifest.json).
+So when one site's extract changes, only that site's stages are rerun, and they stop being
+rerun as soon as a stage writes the same output as before. Stage outputs are also kept in
+a content-addressed cache (see cache.py), so going back to an earlier extract, rule table
+or version of the code restores the earlier outputs instead of computing them again.
+
+With --timing, every stage and the steps within it (cleaning, imputation of each column and
+rule) are timed (see timing.py), and the latency histograms are written in the Prometheus
+text format.
+
+Usage:
+    python -m amr.pipeline --extract Sunnybrook AMR_data_Oct_2023_Sunnybrook.xlsx \
+                           --extract TOH "2024-09-19 AMR_data_TOH.xlsx" \
+                           --extract Trillium "2024-12-09 AMR_data_Trillium.xlsx" \
+                           --output-directory pipeline --export-directory "shiny core"
+    python -m amr.pipeline --extract TOH synthetic_TOH.parquet --timing pipeline_timing.prom
+'''
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import concurrent.futures
+
+from amr import artifact, cache, encoding, evaluation, features, imputation, ingest, organisms, storage, timing, training
+
+
+stages = ['ingest','impute','encode','train','export']
+
+manifest_filename = 'manifest.json'
+
+# Modules whose code each stage runs, part of the stage's cache key along with every amr module
+# they import (see cache.dependencies), so a change to any code a stage uses reruns it
+stage_modules = {'ingest':[ingest,storage],
+                 'impute':[ingest,imputation,organisms,storage],
+                 'encode':[encoding,features,storage,training],
+                 'train': [training,artifact,evaluation],
+                 'export':[]}
+
+# Exported models are copies of the trained models, so are not cached again
+cached_stages = ['ingest','impute','encode','train']
+
+
+def site_directory(config, site):
+    return os.path.join(config['output_directory'], site)
+
+
+def stage_files(config, site, stage):
+    '''
+    Takes a pipeline configuration (see configure), a site and a stage
+    Returns the input files, output files and settings of the stage
+    '''
+    directory   = site_directory(config, site)
+    antibiotics = config['antibiotics']
+
+    extract    = os.path.join(directory,'extract.parquet')
+    imputed    = os.path.join(directory,'imputed.parquet')
+    regression = os.path.join(directory,'regression.parquet')
+    # Both files of each model, the parameter array before the JSON file that refers to it
+    models     = [i for antibiotic in antibiotics for i in artifact.files(os.path.join(directory,'models'), antibiotic, site)]
+
+    if stage=='ingest':
+        return [config['extracts'][site]], [extract], {}
+
+    if stage=='impute':
+        rules = os.path.join(imputation.rules_directory, site+'.csv')
+        return [extract,rules], [imputed,ingest.rows_path(imputed)], {'columns':ingest.output_columns[site]}
+
+    if stage=='encode':
+        return [imputed], [regression], {'antibiotics':antibiotics}
+
+    if stage=='train':
+        metrics = os.path.join(directory,'models',training.metrics_filename)
+        # Per-model counts that training.refresh() refits from, which must match the restored models
+        statistics = [training.statistics_path(os.path.join(directory,'models'), antibiotic, site) for antibiotic in antibiotics]
+        return [regression], models+[metrics]+statistics, {'antibiotics':antibiotics,'train_fraction':training.train_fraction[site]}
+
+    if stage=='export':
+        exported = [i for antibiotic in antibiotics for i in artifact.files(config['export_directory'], antibiotic, site)]
+        return models, exported, {}
+
+    raise ValueError('Unknown stage {} (expected one of {})'.format(stage, stages))
+
+
+def run_ingest(config, site, inputs, outputs):
+    data = ingest.read_extract(inputs[0])
+    storage.write(ingest.cleaning[site](data), outputs[0])
+
+
+def run_impute(config, site, inputs, outputs):
+    # Only the rows that are new or changed since the last run are imputed
+    data = storage.read(inputs[0], categorical=False)
+    ingest.impute_incremental(data, outputs[0], site, imputation.load_rules(site), ingest.output_columns[site])
+
+
+def run_encode(config, site, inputs, outputs):
+    data = storage.read(inputs[0], columns=storage.regression_columns[site], categorical=False)
+    data = encoding.regression_rows(data, site).copy()
+
+    one_hot_data = encoding.encode(data, site, config['antibiotics'])
+    training.write_inputs(one_hot_data, outputs[0], config['antibiotics'], site)
+
+
+def run_train(config, site, inputs, outputs):
+    directory = os.path.dirname(outputs[0])
+    os.makedirs(directory, exist_ok=True)
+
+    data = training.read_inputs(inputs[0], config['antibiotics'])
+    training.train({site:data}, config['antibiotics'], directory, config['training_processes'])
+
+
+def run_export(config, site, inputs, outputs):
+    os.makedirs(config['export_directory'], exist_ok=True)
+
+    for model, exported in zip(inputs, outputs):
+        with open(model,'rb') as f:
+            storage.write_atomic(exported, f.read())
+
+
+stage_functions = {'ingest':run_ingest,
+                   'impute':run_impute,
+                   'encode':run_encode,
+                   'train': run_train,
+                   'export':run_export}
+
+
+def read_manifest(config, site):
+    '''
+    Returns the cache key of each stage when it last ran for a site, as a dict
+    '''
+    path = os.path.join(site_directory(config, site), manifest_filename)
+    if not os.path.exists(path): return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def run_stage(config, site, stage, force=False):
+    '''
+    Runs one stage of a site, unless its inputs, settings and code are unchanged since it last ran,
+        or its outputs for the same inputs, settings and code are in the cache
+    Returns 'ran', 'restored' (from the cache) or 'skipped', and the time taken in seconds
+    '''
+    start = time.perf_counter()
+    inputs, outputs, settings = stage_files(config, site, stage)
+
+    missing = [i for i in inputs if not os.path.exists(i)]
+    if missing:
+        raise FileNotFoundError('{} {} stage is missing its inputs: {}'.format(site, stage, missing))
+
+    key = cache.key(stage, inputs, settings, stage_modules[stage])
+    manifest = read_manifest(config, site)
+
+    if not force and manifest.get(stage)==key and all(os.path.exists(i) for i in outputs):
+        return 'skipped', time.perf_counter()-start
+
+    os.makedirs(site_directory(config, site), exist_ok=True)
+
+    cached = stage in cached_stages and config['cache_directory'] is not None
+    entry  = cache.lookup(key, config['cache_directory']) if cached and not force else None
+
+    if entry is not None and cache.restore(entry, outputs):
+        status = 'restored'
+    else:
+        stage_functions[stage](config, site, inputs, outputs)
+        if cached: cache.store(key, outputs, config['cache_directory'], config['cache_bytes'])
+        status = 'ran'
+
+    # Only this site's stages write its manifest, one at a time
+    manifest[stage] = key
+    storage.write_atomic(os.path.join(site_directory(config, site), manifest_filename),
+                         json.dumps(manifest, indent=1, sort_keys=True).encode())
+
+    seconds = time.perf_counter()-start
+    timing.record('pipeline_stage', seconds, site=site, stage=stage, status=status)
+
+    return status, seconds
+
+
+def run_stage_timed(config, site, stage, force=False):
+    '''
+    Runs a stage in a worker process
+    Returns the result of run_stage, and the spans timed while it ran (see timing.collect)
+    '''
+    timing.collect()
+    return run_stage(config, site, stage, force), timing.collect()
+
+
+def dependencies(config):
+    '''
+    Returns the stages to run as a dict of (site, stage): [(site, stage) it depends on], in the order they can run
+    '''
+    site_stages = stages if config['export_directory'] is not None else stages[:-1]
+
+    graph = {}
+    for site in config['extracts']:
+        for i, stage in enumerate(site_stages):
+            graph[(site,stage)] = [(site,site_stages[i-1])] if i>0 else []
+
+    return graph
+
+
+def configure(extracts, output_directory='pipeline', export_directory=None,
+              antibiotics=training.antibiotic_list, training_processes=None,
+              cache_directory=None, cache_bytes=cache.default_max_bytes):
+    '''
+    Takes a dict of site: path of its raw extract
+    Returns the pipeline configuration used by run()
+    The cache is kept in <output_directory>/cache unless cache_directory is given
+    '''
+    for site in extracts:
+        if site not in ingest.cleaning:
+            raise ValueError('Unknown site {} (expected one of {})'.format(site, list(ingest.cleaning)))
+
+    # Sites train at the same time, so share the CPUs between them
+    if training_processes is None: training_processes = max(1, (os.cpu_count() or 1)//len(extracts))
+
+    return {'extracts':         dict(extracts),
+            'output_directory': output_directory,
+            'export_directory': export_directory,
+            'antibiotics':      list(antibiotics),
+            'training_processes':training_processes,
+            'cache_directory':  cache_directory or os.path.join(output_directory,'cache'),
+            'cache_bytes':      cache_bytes}
+
+
+def run(config, processes=None, force=False, log=print):
+    '''
+    Runs every stage of every site, with sites running concurrently across processes
+    Stages after a failed stage of the same site are not run; other sites carry on
+    Returns a dict of (site, stage): 'ran', 'restored', 'skipped', 'failed' or 'not run'
+    Raises the first error once every other stage has finished
+    '''
+    graph    = dependencies(config)
+    status   = {}
+    errors   = {}
+    running  = {}
+    finished = ('ran','restored','skipped')
+
+    processes = processes or min(len(config['extracts']), os.cpu_count() or 1)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+
+        while len(status)<len(graph):
+
+            # Graph is in dependency order, so a failure is passed down a site's stages in one pass
+            for node, needs in graph.items():
+                if node in status or node in running.values(): continue
+
+                if any(status.get(i) in ('failed','not run') for i in needs):
+                    status[node] = 'not run'
+                elif all(status.get(i) in finished for i in needs):
+                    running[executor.submit(run_stage_timed, config, *node, force)] = node
+
+            if not running: break
+
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                site, stage = node = running.pop(future)
+                try:
+                    (status[node], seconds), spans = future.result()
+                    timing.merge(spans)
+                    log('{:<10} {:<6} {} in {:.2f} s'.format(site, stage, status[node], seconds))
+                except Exception as e:
+                    status[node] = 'failed'
+                    errors[node] = e
+                    log('{:<10} {:<6} failed: {!r}'.format(site, stage, e))
+
+    if errors:
+        (site, stage), error = next(iter(errors.items()))
+        raise RuntimeError('{} stage failed for {} (and {} other stages)'.format(stage, site, len(errors)-1)) from error
+
+    return status
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description='Run the imputation and regression pipeline of every site')
+    parser.add_argument('--extract', nargs=2, action='append', metavar=('SITE','PATH'), required=True,
+                        help='site and its raw extract, as Excel, CSV or Parquet (repeat for each site)')
+    parser.add_argument('--output-directory', default='pipeline', help='folder for the files of each stage')
+    parser.add_argument('--export-directory', default=None, help='folder to copy the final models to (e.g. "shiny core")')
+    parser.add_argument('--antibiotics', nargs='+', default=training.antibiotic_list, help='antibiotics to fit models for')
+    parser.add_argument('--processes', type=int, default=None, help='sites run at once (default: one per site)')
+    parser.add_argument('--training-processes', type=int, default=None,
+                        help='worker processes used to train each site (default: CPUs shared between sites)')
+    parser.add_argument('--cache-directory', default=None, help='folder of the stage cache (default: <output directory>/cache)')
+    parser.add_argument('--cache-size', type=float, default=cache.default_max_bytes/1024**3,
+                        help='GB kept in the cache before the least recently used outputs are removed (default 2)')
+    parser.add_argument('--force', action='store_true', help='rerun every stage, even if its inputs are unchanged or cached')
+    parser.add_argument('--timing', default=None, metavar='PATH',
+                        help='time every stage and step, logging each span and writing latency histograms to PATH')
+    arguments = parser.parse_args(arguments)
+
+    if arguments.timing:
+        timing.enable()
+        logging.basicConfig(format='%(message)s')
+        timing.logger.setLevel(logging.INFO)
+
+    try:
+        config = configure(dict(arguments.extract), arguments.output_directory, arguments.export_directory,
+                           arguments.antibiotics, arguments.training_processes,
+                           arguments.cache_directory, int(arguments.cache_size*1024**3))
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    status = run(config, arguments.processes, arguments.force)
+
+    counts = {i:sum(j==i for j in status.values()) for i in ['ran','restored','skipped']}
+    print('\nRan {ran} stages, restored {restored} from the cache and skipped {skipped}'.format(**counts),
+          'in {:.2f} s'.format(time.perf_counter()-start))
+
+    if arguments.timing:
+        timing.write(arguments.timing)
+        print('Timing histograms written to', arguments.timing)
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+##################################
+#                                #
+# storage.py                     #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Columnar intermediate files passed from the imputation notebooks to the regression notebooks
+
+Imputed extracts are written to Parquet (or Feather, by file extension) instead of Excel.
+Susceptibility and organism columns are stored as categoricals, so each cell is a small
+integer code, and the regression stage reads back only the columns it uses.
+Columns of numbers with a placeholder in their blanks (e.g. MRSA12months in the Sunnybrook
+extract, where every blank is missing_data) are stored as numbers, with the placeholder of
+each column in the file's metadata, and read() puts the placeholders back, so the file
+holds the same values as the Excel output.
+Excel is kept as an optional export for review by clinicians.
+Requires pyarrow.
+'''
+
+import os
+import json
+import tempfile
+
+import pandas as pd
+
+from amr import imputation, organisms
+
+
+# Values found in susceptibility columns, raw and imputed
+susceptibility_categories = ['SUSCEPTIBLE','INTERMEDIATE','RESISTANT',
+                             imputation.no_data]+organisms.no_organism
+
+# Key of the placeholders of number columns in DataFrame.attrs (kept in the file's metadata by pandas)
+placeholders_attribute = 'amr_placeholders'
+
+# Antibiotics whose prior gram negative susceptibility is used by the regression notebooks
+regression_antibiotics = ['Meropenem','Piptaz','Ceftazidime','Ceftriaxone','Ciprofloxacin','Tobramycin']
+
+# Columns of the imputed extract read by each regression notebook
+regression_common_columns = (['AgeCat','Sex','RecentHospitalization','ClinicalESBL',
+                              'PriorAMG','PriorCarbapenem','PriorCephalosporin',
+                              'PriorFQ','PriorOtherAbx','PriorPenicillin',
+                              'PriorGNOrg','FINAL']
+                             + [drug+'_FINAL_imp' for drug in imputation.imputed_drugs]
+                             + [drug+'_PGNO_imp'  for drug in regression_antibiotics])
+
+regression_columns = {'Sunnybrook': regression_common_columns+['Episode','YearOfAdmission',
+                                                               'Community(1), Hospital(2)','ICU Aquired',
+                                                               'Medical(1) Surgical (2) Admitting Service',
+                                                               'ICUExposure'],
+                      'TOH':        regression_common_columns+['Year (based on culture)','Acquisition','ADMIT_SVC'],
+                      'Trillium':   regression_common_columns+['Year','Acquisition','ADMIT_SVC']}
+
+
+def _is_feather(path):
+    return str(path).endswith('.feather')
+
+
+def _storable(column):
+    '''
+    Takes an object column, which Arrow can only store if it holds a single type
+    Returns the column as numbers and its placeholder, if its only text is one placeholder (e.g. missing_data)
+        in place of blanks, or otherwise the column as text and None
+    '''
+    kind = pd.api.types.infer_dtype(column, skipna=True)
+    if kind in ('string','empty','integer','floating','boolean'): return column, None
+
+    numbers = pd.to_numeric(column, errors='coerce')
+    text    = column[numbers.isna() & column.notna()].unique()
+    if len(text)==1 and text[0] in susceptibility_categories and column.notna().all(): return numbers, text[0]
+
+    return column.astype(str).where(column.notna()), None
+
+
+def encode(data):
+    '''
+    Converts an imputed extract to the types stored in the intermediate file
+    Susceptibility columns become categoricals of susceptibility_categories, and number columns
+        with a placeholder become numbers, with the placeholder of each column in data.attrs
+        (added to those already there, e.g. from read(..., placeholders=False))
+    Returns the DataFrame
+    '''
+    data = organisms.categorize(data)
+    placeholders = {i:j for i, j in data.attrs.get(placeholders_attribute,{}).items() if i in data.columns}
+
+    for column in data.columns:
+        if isinstance(data[column].dtype, pd.CategoricalDtype): continue
+        if pd.api.types.is_numeric_dtype(data[column]) or pd.api.types.is_datetime64_any_dtype(data[column]): continue
+
+        if data[column].dropna().isin(susceptibility_categories).all():
+            data[column] = pd.Categorical(data[column], categories=susceptibility_categories)
+        else:
+            data[column], placeholder = _storable(data[column])
+            if placeholder is not None: placeholders[column] = placeholder
+
+    data.attrs[placeholders_attribute] = placeholders
+
+    return data
+
+
+def _stored_placeholders(path, data):
+    '''
+    Returns the placeholders recorded in a file by write() or write_chunks()
+    '''
+    if _is_feather(path): return data.attrs.get(placeholders_attribute, {})
+
+    # write_chunks() adds them after the schema, so they are only in the file's own metadata
+    import pyarrow.parquet
+    metadata = pyarrow.parquet.read_metadata(path).metadata or {}
+    return json.loads(metadata.get(b'PANDAS_ATTRS', b'{}')).get(placeholders_attribute, {})
+
+
+def _restore_placeholders(data):
+    '''
+    Puts the placeholders recorded by encode() back into the blanks of their columns, in place
+    '''
+    for column, placeholder in data.attrs.pop(placeholders_attribute, {}).items():
+        if column in data.columns:
+            data[column] = data[column].astype(object).where(data[column].notna(), placeholder)
+
+
+def write(data, path):
+    '''
+    Writes an imputed extract to a Parquet or Feather file
+    '''
+    data = encode(data.reset_index(drop=True))
+
+    if _is_feather(path): data.to_feather(path)
+    else:                 data.to_parquet(path, index=False)
+
+
+def _chunk_table(chunk, schema):
+    '''
+    Converts a chunk of an extract to an Arrow table matching the schema of the first chunk
+    Numbers are stored as floats, so that a column with blanks in a later chunk still fits
+    Returns the table, the schema (set from this chunk if schema is None) and the placeholders of the chunk's columns
+    '''
+    import pyarrow as pa
+
+    chunk = encode(chunk.reset_index(drop=True))
+    placeholders = chunk.attrs.pop(placeholders_attribute)
+    for column in chunk.columns:
+        if pd.api.types.is_numeric_dtype(chunk[column]) and not pd.api.types.is_bool_dtype(chunk[column]):
+            chunk[column] = chunk[column].astype('float64')
+
+    table = pa.Table.from_pandas(chunk, preserve_index=False)
+
+    if schema is None:
+        # Columns that are blank in the first chunk are taken to be text,
+        # and categoricals get room for more categories than the first chunk has
+        fields = []
+        for field in table.schema:
+            if   pa.types.is_null(field.type):       field = field.with_type(pa.large_string())
+            elif pa.types.is_dictionary(field.type): field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+            fields.append(field)
+        schema = pa.schema(fields, metadata=table.schema.metadata)
+
+    if list(table.column_names)!=list(schema.names):
+        raise ValueError('Chunk columns do not match the first chunk: {}'.format(
+            sorted(set(table.column_names)^set(schema.names))))
+
+    return table.cast(schema), schema, placeholders
+
+
+def write_chunks(chunks, path):
+    '''
+    Writes an iterable of DataFrames to a single Parquet file, one row group per chunk,
+        so that only one chunk is held in memory at a time
+    Feather files cannot hold categoricals that change between chunks, so only Parquet is supported
+    Returns the number of rows written
+    '''
+    import pyarrow.parquet
+
+    if _is_feather(path): raise ValueError('Chunked output must be a Parquet file: {}'.format(path))
+
+    writer = None
+    schema = None
+    rows   = 0
+    placeholders = {}
+    try:
+        for chunk in chunks:
+            table, schema, chunk_placeholders = _chunk_table(chunk, schema)
+            if writer is None: writer = pyarrow.parquet.ParquetWriter(path, schema)
+            writer.write_table(table)
+            rows += table.num_rows
+
+            for column, placeholder in chunk_placeholders.items():
+                if placeholders.setdefault(column, placeholder)!=placeholder:
+                    raise ValueError('Column {} has the placeholders {} and {}'.format(column, placeholders[column], placeholder))
+
+        # Only known once every chunk is written, so added to the metadata at the end, where pandas reads it as attrs
+        if writer is not None:
+            writer.add_key_value_metadata({'PANDAS_ATTRS':json.dumps({placeholders_attribute:placeholders})})
+    finally:
+        if writer is not None: writer.close()
+
+    return rows
+
+
+def read(path, columns=None, categorical=True, placeholders=True):
+    '''
+    Reads an intermediate file written by write()
+    columns limits the columns read from disk (e.g. regression_columns['TOH']); absent columns are skipped
+        and the columns keep their order in the file
+    With categorical=False, susceptibility columns are returned as text, as they were read from Excel
+    With placeholders=False, number columns keep blanks in place of their placeholder (as stored), and the
+        placeholders are left in data.attrs, for writing back with write()
+    Returns a DataFrame
+    '''
+    if columns is not None:
+        import pyarrow.parquet, pyarrow.feather
+
+        if _is_feather(path): available = pyarrow.feather.read_table(path, memory_map=True).column_names
+        else:                 available = pyarrow.parquet.read_schema(path).names
+
+        wanted  = set(columns)
+        columns = [i for i in available if i in wanted]
+
+    if _is_feather(path): data = pd.read_feather(path, columns=columns)
+    else:                 data = pd.read_parquet(path, columns=columns)
+
+    if not categorical:
+        for column in data.columns:
+            if (isinstance(data[column].dtype, pd.CategoricalDtype)
+                and list(data[column].cat.categories)==susceptibility_categories):
+                data[column] = data[column].astype(object)
+
+    data.attrs[placeholders_attribute] = {i:j for i, j in _stored_placeholders(path, data).items() if i in data.columns}
+    if placeholders: _restore_placeholders(data)
+
+    return organisms.categorize(data)
+
+
+def export_excel(data, path):
+    '''
+    Writes an extract to Excel for review, with the header row frozen
+    '''
+    data.to_excel(path, freeze_panes=(1,0), index=False)
+
+
+def write_atomic(path, contents):
+    '''
+    Writes bytes to a file through a temporary file in the same folder, which is then renamed over path
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+
+    # Temporary files are only readable by their owner; give the file the permissions open() would
+    umask = os.umask(0)
+    os.umask(umask)
+
+    with tempfile.NamedTemporaryFile(dir=directory, prefix='.'+os.path.basename(path)+'.', delete=False) as f:
+        try:
+            f.write(contents)
+            f.flush()
+            os.fsync(f.fileno())
+            os.chmod(f.name, 0o666 & ~umask)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+
+    os.replace(f.name, path)
@@ -0,0 +1,757 @@
+##################################
+#                                #
+# synthetic.py                   #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Synthetic raw extracts with the same columns as each site's AMR_data extract, for benchmarks and
+load tests without patient data
+
+The columns, their order and the way values are written (e.g. Female/Male and Susceptible
+at TOH and Trillium, SUSCEPTIBLE and 0/1 at Sunnybrook, organism names in capitals at
+Trillium) follow the extracts read by the imputation notebooks, so that ingest.cleaning,
+the imputation rules, encoding and training run on them as on the real data.
+
+Values are drawn so that the extracts look like the real ones:
+    organisms:      drawn with the frequencies of gram negative bacteremia (E. coli about half)
+    patients:       age, acquisition, admitting service, recent hospitalization and prior antibiotic
+                    exposures, which are more likely after contact with hospitals
+    antibiograms:   each isolate has resistance mechanisms (ESBL, AmpC, carbapenemase, fluoroquinolone, ...),
+                    more likely after prior exposure to the class, contact with hospitals and a clinical
+                    history of ESBL, and with co-resistance. Its results follow from the mechanisms and the
+                    intrinsic resistance of the organism, so that they agree with the imputation rules
+                    (an isolate resistant to a broader beta-lactam is resistant to the narrower ones)
+    prior cultures: more likely after a recent hospitalization, and often the same strain as the final isolate
+
+Large extracts are written in chunks, so only one chunk per process is held in memory at a time.
+
+Usage:
+    from amr import synthetic
+    data = synthetic.extract('TOH', 100000)
+
+    python -m amr.synthetic --site TOH --rows 100000000 --output synthetic_TOH.parquet --processes 8
+    python -m amr.synthetic --site TOH --rows 10000000 --output patients.parquet --patients
+'''
+
+import sys
+import time
+import argparse
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+from amr import encoding, imputation, ingest, organisms, training
+
+
+# Antibiograms of each culture, in the order of the columns of each extract
+antibiograms = {'Sunnybrook':{'_PGNO': ['AMIKACIN','AMOXICILLIN/CLAVULANIC ACID','AMPICILLIN','AMPICILLIN/SULBACTAM',
+                                       'AZTREONAM','CEFAZOLIN','CEFIXIME','CEFOTAXIME','CEFOXITIN','CEFTAZIDIME',
+                                       'CEFTOLOZANE / TAZOBACTAM','CEFTRIAXONE','CEPHALOTHIN','CIPROFLOXACIN',
+                                       'CLINDAMYCIN','COLISTIN','ERTAPENEM','FOSFOMYCIN','GENTAMICIN','LEVOFLOXACIN',
+                                       'MEROPENEM','METRONIDAZOLE','NITROFURANTOIN','PENICILLIN',
+                                       'PIPERACILLIN / TAZOBACTAM','TETRACYCLINE','TIGECYCLINE','TOBRAMYCIN',
+                                       'TRIMETHOPRIM/SULFA','MOXIFLOXACIN'],
+                              '_PGPO': ['AMPICILLIN','BETA-LACTAMASE','CEFAZOLIN','CEFOXITIN','CEFOXITIN SCREEN',
+                                       'CEFTRIAXONE','CEPHALOTHIN','CIPROFLOXACIN','CLINDAMYCIN','CLOXACILLIN',
+                                       'ERYTHROMYCIN','FOSFOMYCIN','GENTAMICIN','GENTAMICIN 500',
+                                       'INDUCIBLE CLINDAMYCIN RESISTAN','LEVOFLOXACIN','LINEZOLID','MEROPENEM',
+                                       'METRONIDAZOLE','MOXIFLOXACIN','NITROFURANTOIN','PENICILLIN',
+                                       'PIPERACILLIN / TAZOBACTAM','QUINUPRISTIN/DALFOPRISTIN','RIFAMPIN',
+                                       'TETRACYCLINE','TIGECYCLINE','TRIMETHOPRIM/SULFA','VANCOMYCIN','DAPTOMYCIN'],
+                              '_FINAL':['AMIKACIN','AMOXICILLIN/CLAVULANIC ACID','AMPICILLIN','AMPICILLIN/SULBACTAM',
+                                       'AZITHROMYCIN','AZTREONAM','BETA-LACTAMASE','CASPOFUNGIN','CEFAZOLIN','CEFIXIME',
+                                       'CEFOTAXIME','CEFOXITIN','CEFOXITIN SCREEN','CEFTAZIDIME',
+                                       'CEFTOLOZANE / TAZOBACTAM','CEFTRIAXONE','CEFTRIAXONE (MENINGITIS)','CEFUROXIME',
+                                       'CEPHALOTHIN','CHLORAMPHENICOL','CIPROFLOXACIN','CLARITHROMYCIN','CLINDAMYCIN',
+                                       'CLOXACILLIN','COLISTIN','DAPTOMYCIN','DOXYCYCLINE','ERTAPENEM','ERYTHROMYCIN',
+                                       'ETHAMBUTOL','FLUCONAZOLE','FOSFOMYCIN','GENTAMICIN','GENTAMICIN 500','IMIPENEM',
+                                       'INDUCIBLE CLINDAMYCIN RESISTAN','ISONIAZID','LEVOFLOXACIN','LINEZOLID',
+                                       'MEROPENEM','METHOD','METRONIDAZOLE','MICAFUNGIN','MINOCYCLINE','MOXIFLOXACIN',
+                                       'MUPIROCIN','NALIDIXIC ACID','NITROFURANTOIN','OFLOXACIN','PENICILLIN',
+                                       'PIPERACILLIN','PIPERACILLIN / TAZOBACTAM','PYRAZINAMIDE',
+                                       'QUINUPRISTIN/DALFOPRISTIN','RIFAMPIN','SENSITIVITY TESTING IS NOT DON',
+                                       'SPECTINOMYCIN','STREPTOMYCIN 2000','TETRACYCLINE','TIGECYCLINE','TOBRAMYCIN',
+                                       'TRIMETHOPRIM/SULFA','VANCOMYCIN','VORICONAZOLE']},
+                'TOH':       {'_FINAL':['AMIKACIN','AMOXICILLIN/CLAVULANIC ACID','AMPICILLIN','AZITHROMYCIN','AZTREONAM',
+                                       'CEFAZOLIN','CEFEPIME','CEFIDEROCOL','CEFIXIME','CEFOTAXIME','CEFOXITIN',
+                                       'CEFPODOXIME','CEFTAZIDIME','CEFTAZIDIME/AVIBACTAM','CEFTOLOZANE / TAZOBACTAM',
+                                       'CEFTRIAXONE','CEFUROXIME','CHLORAMPHENICOL','CIPROFLOXACIN','COLISTIN',
+                                       'CLARITHROMYCIN','ERTAPENEM','DOXYCYCLINE','FOSFOMYCIN','GENTAMICIN',
+                                       'LEVOFLOXACIN','MEROPENEM','MINOCYCLINE','NITROFURANTOIN','PENICILLIN',
+                                       'PIPERACILLIN / TAZOBACTAM','RIFAMPIN','TRIMETHOPRIM/SULFA','TETRACYCLINE',
+                                       'TOBRAMYCIN'],
+                              '_PGNO': ['AMIKACIN','AMOXICILLIN/CLAVULANIC ACID','AMPC','AMPICILLIN','AZTREONAM',
+                                       'CEFAZOLIN','CEFEPIME','CEFIXIME','CEFOXITIN','CEFTAZIDIME',
+                                       'CEFTAZIDIME/AVIBACTAM','CEFTOLOZANE / TAZOBACTAM','CEFTRIAXONE','CEFUROXIME',
+                                       'CIPROFLOXACIN','COLISTIN','ERTAPENEM','GENTAMICIN','MEROPENEM',
+                                       'NITROFURANTOIN','PIPERACILLIN / TAZOBACTAM','TRIMETHOPRIM/SULFA','TOBRAMYCIN']},
+                'Trillium':  {'_FINAL':['AMIKACIN','AMOXICILLIN/CLAVULANIC ACID','AMPICILLIN','CEFAZOLIN','CEFIXIME',
+                                       'CEFOTAXIME','CEFTAZIDIME','CEFTOLOZANE / TAZOBACTAM','CEFTRIAXONE',
+                                       'CIPROFLOXACIN','ERTAPENEM','FOSFOMYCIN','GENTAMICIN','LEVOFLOXACIN','MEROPENEM',
+                                       'NITROFURANTOIN','PENICILLIN','PIPERACILLIN / TAZOBACTAM','TRIMETHOPRIM/SULFA',
+                                       'TETRACYCLINE','TOBRAMYCIN','VANCOMYCIN'],
+                              '_PGNO': ['AMIKACIN','AMOXICILLIN/CLAVULANIC ACID','AMPICILLIN','CEFAZOLIN','CEFIXIME',
+                                       'CEFOTAXIME','CEFTAZIDIME','CEFTOLOZANE / TAZOBACTAM','CEFTRIAXONE',
+                                       'CIPROFLOXACIN','ERTAPENEM','FOSFOMYCIN','GENTAMICIN','LEVOFLOXACIN','MEROPENEM',
+                                       'NITROFURANTOIN','PENICILLIN','PIPERACILLIN / TAZOBACTAM','TRIMETHOPRIM/SULFA',
+                                       'TETRACYCLINE','TOBRAMYCIN','VANCOMYCIN']}}
+
+# Columns added to the extracts by hand, which are always blank
+blank_columns = {'Sunnybrook':[],
+                 'TOH':       ['MOXIFLOXACIN_FINAL','MOXIFLOXACIN_PGNO','PENICILLIN_PGNO','CLOXACILLIN_FINAL',
+                               'CLOXACILLIN_PGNO','LEVOFLOXACIN_FINAL.1','LEVOFLOXACIN_PGNO'],
+                 'Trillium':  ['CLOXACILLIN_FINAL','CLOXACILLIN_PGNO','MOXIFLOXACIN_FINAL','MOXIFLOXACIN_PGNO']}
+
+# Columns whose names end with a space in the extract (removed by ingest.cleaning)
+padded_columns = {'Sunnybrook':[],
+                  'TOH':       ['AMOXICILLIN/CLAVULANIC ACID_PGNO','AZTREONAM_PGNO','CEFTRIAXONE_PGNO','CEFUROXIME_PGNO',
+                                'ERTAPENEM_PGNO','MEROPENEM_PGNO','NITROFURANTOIN_PGNO','TOBRAMYCIN_PGNO'],
+                  'Trillium':  []}
+
+
+def antibiogram_columns(site, suffix):
+    return [drug+suffix for drug in antibiograms[site][suffix]]
+
+
+def column_order(site):
+    '''
+    Returns the columns of a site's extract, in order, without the spaces of padded_columns
+    '''
+    if site=='Sunnybrook':
+        return (['Anonymous_ID','Episode','AgeCat','Sex','YearOfAdmission','NumberOfBacteremiasLastYear',
+                 'Community(1), Hospital(2)','ICU Aquired','Medical(1) Surgical (2) Admitting Service',
+                 'MRSA12months','VRE12months','ESBL12months','MRSA7days','VRE7days','ESBL7days',
+                 'ClincalMRAS','ClinicalVRE','ClinicalESBL','RecentHospitalization','ICUExposure']
+                + encoding.prior_columns[:4] + ['PriorOtherAbx','PriorPenicillin']
+                + ['PriorGNOrg'] + antibiogram_columns(site,'_PGNO')
+                + ['PriorGPOrg'] + antibiogram_columns(site,'_PGPO')
+                + ['culture_test_cd','organism','FINAL','GNB Group'] + antibiogram_columns(site,'_FINAL'))
+
+    if site=='TOH':
+        return (['AgeCat','Sex','Year (based on culture)','CULTURE_DESCRIPTION','FINAL','PriorGNOrg',
+                 'ADMIT_SVC','Acquisition','RecentHospitalization','ClinicalESBL']
+                + encoding.prior_columns
+                + antibiogram_columns(site,'_FINAL')[:2] + ['AMP-C'] + antibiogram_columns(site,'_FINAL')[2:]
+                + antibiogram_columns(site,'_PGNO') + blank_columns[site])
+
+    if site=='Trillium':
+        return (['AgeCat','Sex','FINAL','Year','ADMIT_SVC','Acquisition','RecentHospitalization','ClinicalESBL',
+                 'PriorGNOrg'] + encoding.prior_columns
+                + antibiogram_columns(site,'_FINAL') + antibiogram_columns(site,'_PGNO') + blank_columns[site])
+
+    raise ValueError('Unknown site {} (expected one of {})'.format(site, encoding.hospital_list))
+
+
+def columns(site):
+    '''
+    Returns the columns of a site's raw extract, in order
+    '''
+    return [i+' ' if i in padded_columns[site] else i for i in column_order(site)]
+
+
+# Susceptibility results as written in each extract
+results = {'Sunnybrook':['SUSCEPTIBLE','INTERMEDIATE','RESISTANT'],
+           'TOH':       ['Susceptible','Intermediate','Resistant'],
+           'Trillium':  ['Susceptible','Intermediate','Resistant']}
+
+# Years of isolates in each extract
+years = {'Sunnybrook':(2012,2021),'TOH':(2019,2024),'Trillium':(2020,2024)}
+
+# Episodes of the Sunnybrook extract, of which the models use those up to encoding.last_episode
+episodes = 13587
+
+
+# Relative frequency of each organism among final (gram negative) isolates and prior gram negative cultures,
+# and among the prior gram positive cultures of the Sunnybrook extract
+gram_negative_frequencies = {'Escherichia coli':48,'Klebsiella pneumoniae':15,'Pseudomonas aeruginosa':9,
+                             'Proteus mirabilis':5,'Enterobacter cloacae':5,'Klebsiella oxytoca':4,
+                             'Serratia marcescens':2.5,'Citrobacter freundii':2,'Enterobacter aerogenes':1.5,
+                             'Morganella morganii':1.5,'Stenotrophomonas maltophilia':1,'Acinetobacter baumannii':1,
+                             'Bacteroides fragilis':1,'Citrobacter koseri':1,'Providencia stuartii':0.5,
+                             'Salmonella enterica':0.5,'Haemophilus influenzae':0.5}
+
+gram_positive_frequencies = {'Staphylococcus aureus':35,'Staphylococcus epidermidis':20,'Enterococcus faecalis':15,
+                             'Streptococcus mitis (viridans group)':7,'Enterococcus faecium':5,
+                             'Streptococcus agalactiae':5,'Streptococcus pneumoniae':5,'Streptococcus pyogenes':3,
+                             'Corynebacterium striatum':3,'Staphylococcus lugdunensis':2}
+
+organism_list = list(gram_negative_frequencies) + list(gram_positive_frequencies)
+
+
+# Antibiotics in the same group are made resistant by the same mechanisms
+# Antibiotics without a group (antifungals, antimycobacterials, screening tests) are left blank
+antibiotic_groups = {'AMPICILLIN':'penicillin','PENICILLIN':'penicillin','PIPERACILLIN':'penicillin',
+                     'AMOXICILLIN/CLAVULANIC ACID':'inhibitor','AMPICILLIN/SULBACTAM':'inhibitor',
+                     'PIPERACILLIN / TAZOBACTAM':'piptaz',
+                     'CEFAZOLIN':'cefazolin','CEPHALOTHIN':'cefazolin','CEFOXITIN':'cefoxitin','CEFUROXIME':'cefuroxime',
+                     'CEFTRIAXONE':'ceftriaxone','CEFTRIAXONE (MENINGITIS)':'ceftriaxone','CEFOTAXIME':'ceftriaxone',
+                     'CEFIXIME':'ceftriaxone','CEFPODOXIME':'ceftriaxone',
+                     'CEFTAZIDIME':'ceftazidime','AZTREONAM':'ceftazidime','CEFEPIME':'cefepime',
+                     'CEFTOLOZANE / TAZOBACTAM':'novel','CEFTAZIDIME/AVIBACTAM':'novel','CEFIDEROCOL':'novel',
+                     'ERTAPENEM':'ertapenem','MEROPENEM':'carbapenem','IMIPENEM':'carbapenem',
+                     'CIPROFLOXACIN':'fluoroquinolone','LEVOFLOXACIN':'fluoroquinolone','MOXIFLOXACIN':'fluoroquinolone',
+                     'OFLOXACIN':'fluoroquinolone','NALIDIXIC ACID':'fluoroquinolone',
+                     'GENTAMICIN':'aminoglycoside','TOBRAMYCIN':'aminoglycoside','GENTAMICIN 500':'aminoglycoside',
+                     'STREPTOMYCIN 2000':'aminoglycoside','AMIKACIN':'amikacin',
+                     'TRIMETHOPRIM/SULFA':'tmpsmx','NITROFURANTOIN':'nitrofurantoin','FOSFOMYCIN':'fosfomycin',
+                     'TETRACYCLINE':'tetracycline','DOXYCYCLINE':'tetracycline','MINOCYCLINE':'tetracycline',
+                     'TIGECYCLINE':'tetracycline','COLISTIN':'colistin','CHLORAMPHENICOL':'chloramphenicol',
+                     'METRONIDAZOLE':'metronidazole',
+                     'CLOXACILLIN':'cloxacillin','CEFOXITIN SCREEN':'cloxacillin','VANCOMYCIN':'vancomycin',
+                     'ERYTHROMYCIN':'macrolide','AZITHROMYCIN':'macrolide','CLARITHROMYCIN':'macrolide',
+                     'CLINDAMYCIN':'clindamycin','DAPTOMYCIN':'other','LINEZOLID':'other','RIFAMPIN':'other',
+                     'QUINUPRISTIN/DALFOPRISTIN':'other','MUPIROCIN':'other'}
+
+group_list = list(dict.fromkeys(antibiotic_groups.values()))
+
+# Groups made resistant by each resistance mechanism
+# The beta-lactam mechanisms make a ladder, so an isolate resistant to a broader agent is resistant to the narrower ones,
+# as the imputation rules assume (e.g. E. coli resistant to ceftriaxone is resistant to amoxicillin-clavulanate)
+mechanisms = {'penicillin':     ['penicillin'],
+              'inhibitor':      ['penicillin','inhibitor'],
+              'AmpC':           ['penicillin','inhibitor','piptaz','cefazolin','cefoxitin','cefuroxime','ceftriaxone',
+                                 'ceftazidime'],
+              'ESBL':           ['penicillin','inhibitor','cefazolin','cefuroxime','ceftriaxone','ceftazidime','cefepime'],
+              'carbapenemase':  ['penicillin','inhibitor','piptaz','cefazolin','cefoxitin','cefuroxime','ceftriaxone',
+                                 'ceftazidime','cefepime','ertapenem','carbapenem','novel'],
+              'porin':          ['ertapenem','carbapenem'],
+              'methicillin':    ['penicillin','inhibitor','piptaz','cefazolin','cefoxitin','cefuroxime','ceftriaxone',
+                                 'ertapenem','carbapenem','cloxacillin'],
+              'fluoroquinolone':['fluoroquinolone'],
+              'aminoglycoside': ['aminoglycoside'],
+              'amikacin':       ['aminoglycoside','amikacin'],
+              'tmpsmx':         ['tmpsmx'],
+              'tetracycline':   ['tetracycline'],
+              'nitrofurantoin': ['nitrofurantoin'],
+              'fosfomycin':     ['fosfomycin'],
+              'colistin':       ['colistin'],
+              'chloramphenicol':['chloramphenicol'],
+              'metronidazole':  ['metronidazole'],
+              'macrolide':      ['macrolide'],
+              'clindamycin':    ['macrolide','clindamycin'],
+              'vancomycin':     ['vancomycin'],
+              'other':          ['other']}
+
+mechanism_list = list(mechanisms)
+
+# Probability of each mechanism in an isolate of a community patient without recent antibiotics, for every
+# gram negative and gram positive organism, and where an organism differs
+mechanism_rates = {'negative':                    {'penicillin':0.3,'inhibitor':0.05,'ESBL':0.02,'carbapenemase':0.003,
+                                                   'fluoroquinolone':0.08,'aminoglycoside':0.04,'amikacin':0.005,
+                                                   'tmpsmx':0.12,'tetracycline':0.15,'nitrofurantoin':0.05,
+                                                   'fosfomycin':0.03,'colistin':0.01,'chloramphenicol':0.05,
+                                                   'metronidazole':1},
+                   'positive':                    {'penicillin':0.8,'fluoroquinolone':0.1,'aminoglycoside':0.05,
+                                                   'tmpsmx':0.05,'tetracycline':0.1,'macrolide':0.2,'clindamycin':0.1,
+                                                   'other':0.01},
+                   'Escherichia coli':            {'penicillin':0.4,'inhibitor':0.08,'ESBL':0.04,'AmpC':0.01,
+                                                   'fluoroquinolone':0.12,'aminoglycoside':0.05,'tmpsmx':0.18,
+                                                   'tetracycline':0.25,'nitrofurantoin':0.03},
+                   'Klebsiella pneumoniae':       {'inhibitor':0.06,'ESBL':0.05,'carbapenemase':0.004,'fluoroquinolone':0.06,
+                                                   'aminoglycoside':0.03,'tmpsmx':0.1,'nitrofurantoin':0.3,
+                                                   'fosfomycin':0.3},
+                   'Klebsiella oxytoca':          {'inhibitor':0.1,'ESBL':0.03,'fluoroquinolone':0.03},
+                   'Pseudomonas aeruginosa':      {'ESBL':0,'AmpC':0.1,'porin':0.1,'carbapenemase':0.005,
+                                                   'fluoroquinolone':0.15,'aminoglycoside':0.05,'amikacin':0.02},
+                   'Proteus mirabilis':           {'penicillin':0.2,'ESBL':0.03,'fluoroquinolone':0.15,
+                                                   'aminoglycoside':0.08,'tmpsmx':0.25},
+                   'Enterobacter cloacae':        {'AmpC':0.2,'ESBL':0.05,'carbapenemase':0.01,'fluoroquinolone':0.06,
+                                                   'tmpsmx':0.1},
+                   'Enterobacter aerogenes':      {'AmpC':0.2,'ESBL':0.03,'carbapenemase':0.01,'fluoroquinolone':0.04},
+                   'Citrobacter freundii':        {'AmpC':0.2,'ESBL':0.03,'carbapenemase':0.01,'fluoroquinolone':0.06,
+                                                   'tmpsmx':0.1},
+                   'Serratia marcescens':         {'AmpC':0.1,'ESBL':0.02,'fluoroquinolone':0.04},
+                   'Morganella morganii':         {'AmpC':0.2,'fluoroquinolone':0.15,'tmpsmx':0.2},
+                   'Providencia stuartii':        {'AmpC':0.2,'fluoroquinolone':0.2,'tmpsmx':0.2},
+                   'Citrobacter koseri':          {'ESBL':0.02},
+                   'Stenotrophomonas maltophilia':{'fluoroquinolone':0.2,'tmpsmx':0.05},
+                   'Acinetobacter baumannii':     {'carbapenemase':0.05,'fluoroquinolone':0.1,'aminoglycoside':0.1,
+                                                   'tmpsmx':0.1},
+                   'Bacteroides fragilis':        {'penicillin':0.95,'clindamycin':0.3,'metronidazole':0.01},
+                   'Salmonella enterica':         {'penicillin':0.2,'fluoroquinolone':0.1},
+                   'Haemophilus influenzae':      {'penicillin':0.2},
+                   'Staphylococcus aureus':       {'methicillin':0.15,'fluoroquinolone':0.25,'tmpsmx':0.03,'macrolide':0.3,
+                                                   'clindamycin':0.15},
+                   'Staphylococcus epidermidis':  {'penicillin':0.9,'methicillin':0.6,'fluoroquinolone':0.4,'tmpsmx':0.3,
+                                                   'macrolide':0.5,'clindamycin':0.3},
+                   'Staphylococcus lugdunensis':  {'penicillin':0.3,'methicillin':0.05},
+                   'Enterococcus faecalis':       {'penicillin':0.01,'aminoglycoside':0.3,'tetracycline':0.6,
+                                                   'vancomycin':0.01},
+                   'Enterococcus faecium':        {'penicillin':0.85,'aminoglycoside':0.4,'vancomycin':0.1},
+                   'Streptococcus mitis (viridans group)':{'penicillin':0.2,'macrolide':0.4},
+                   'Streptococcus agalactiae':    {'penicillin':0.01,'macrolide':0.3,'clindamycin':0.2},
+                   'Streptococcus pneumoniae':    {'penicillin':0.1,'macrolide':0.25},
+                   'Streptococcus pyogenes':      {'penicillin':0,'macrolide':0.1},
+                   'Corynebacterium striatum':    {'penicillin':0.9,'fluoroquinolone':0.8,'clindamycin':0.8}}
+
+# Groups every isolate of an organism is resistant to, in addition to those of its Gram stain
+ampc_intrinsic = ['penicillin','inhibitor','cefazolin','cefoxitin']
+enterococcus_intrinsic = ['cefazolin','cefoxitin','cefuroxime','ceftriaxone','cefepime','ertapenem','cloxacillin',
+                          'clindamycin','tmpsmx']
+
+intrinsic_resistance = {'negative':                    ['cloxacillin','vancomycin','macrolide','clindamycin','other'],
+                        'positive':                    ['ceftazidime','colistin','metronidazole'],
+                        'Klebsiella pneumoniae':       ['penicillin'],
+                        'Klebsiella oxytoca':          ['penicillin'],
+                        'Citrobacter koseri':          ['penicillin'],
+                        'Enterobacter cloacae':        ampc_intrinsic+['cefuroxime'],
+                        'Enterobacter aerogenes':      ampc_intrinsic,
+                        'Citrobacter freundii':        ampc_intrinsic,
+                        'Serratia marcescens':         ampc_intrinsic+['cefuroxime','colistin','nitrofurantoin'],
+                        'Morganella morganii':         ampc_intrinsic+['cefuroxime','colistin','nitrofurantoin',
+                                                                       'tetracycline'],
+                        'Providencia stuartii':        ampc_intrinsic+['colistin','nitrofurantoin','tetracycline',
+                                                                       'aminoglycoside'],
+                        'Proteus mirabilis':           ['colistin','nitrofurantoin','tetracycline'],
+                        'Pseudomonas aeruginosa':      ['penicillin','inhibitor','cefazolin','cefoxitin','cefuroxime',
+                                                        'ceftriaxone','ertapenem','tmpsmx','tetracycline','nitrofurantoin',
+                                                        'chloramphenicol'],
+                        'Stenotrophomonas maltophilia':['penicillin','inhibitor','piptaz','cefazolin','cefoxitin',
+                                                        'cefuroxime','ceftriaxone','cefepime','ertapenem','carbapenem',
+                                                        'aminoglycoside','amikacin','fosfomycin'],
+                        'Acinetobacter baumannii':     ['penicillin','cefazolin','cefoxitin','cefuroxime','ertapenem',
+                                                        'fosfomycin','nitrofurantoin','chloramphenicol'],
+                        'Bacteroides fragilis':        ['penicillin','cefazolin','cefuroxime','ceftriaxone','ceftazidime',
+                                                        'cefepime','aminoglycoside','amikacin'],
+                        'Enterococcus faecalis':       enterococcus_intrinsic,
+                        'Enterococcus faecium':        enterococcus_intrinsic}
+
+# Probability that a group is reported on an antibiogram, by Gram stain
+tested_rates = {'negative':{'penicillin':0.9,'inhibitor':0.85,'piptaz':0.9,'cefazolin':0.85,'cefoxitin':0.4,
+                            'cefuroxime':0.4,'ceftriaxone':0.85,'ceftazidime':0.8,'cefepime':0.5,'novel':0.05,
+                            'ertapenem':0.8,'carbapenem':0.9,'fluoroquinolone':0.85,'aminoglycoside':0.9,'amikacin':0.6,
+                            'tmpsmx':0.9,'nitrofurantoin':0.5,'fosfomycin':0.2,'tetracycline':0.3,'colistin':0.05,
+                            'chloramphenicol':0.05},
+                'positive':{'penicillin':0.8,'inhibitor':0.2,'piptaz':0.2,'cefazolin':0.6,'cefoxitin':0.3,
+                            'ceftriaxone':0.3,'carbapenem':0.1,'cloxacillin':0.7,'vancomycin':0.9,'macrolide':0.7,
+                            'clindamycin':0.8,'fluoroquinolone':0.4,'aminoglycoside':0.3,'tmpsmx':0.7,'tetracycline':0.4,
+                            'nitrofurantoin':0.2,'other':0.3}}
+
+# New beta-lactam combinations are mostly tested when an isolate is resistant to third generation cephalosporins
+# or carbapenems
+novel_tested_resistant = 0.6
+
+# Proportion of resistant results reported as intermediate, and of results that disagree with the mechanisms
+intermediate = 0.1
+discordant   = 0.005
+
+
+# Proportion of isolates in each age category (in the order of encoding.age_categories), of men,
+# and acquired in the community, in hospital and in the ICU
+age_probabilities = [0.10,0.04,0.05,0.07,0.08,0.10,0.11,0.12,0.11,0.09,0.08,0.05]
+male = 0.55
+acquisition_probabilities = [0.65,0.25,0.10]
+
+# Proportion of surgical admissions and of recent hospitalizations, by acquisition
+surgical = [0.2,0.35,0.35]
+recent_hospitalization = [0.25,0.6,0.7]
+
+# Proportion of community patients without a recent hospitalization exposed to each antibiotic class,
+# and the change in log odds of exposure with a recent hospitalization and with hospital acquisition
+exposure_rates = {'PriorAMG':0.03,'PriorCarbapenem':0.03,'PriorCephalosporin':0.15,'PriorFQ':0.1,
+                  'PriorPenicillin':0.15,'PriorOtherAbx':0.12}
+exposure_hospital_effects = {'RecentHospitalization':1.2,'Hospital':0.8}
+
+# Antibiotics named in the prior antibiotic columns of the Trillium extract
+prior_antibiotics = {'PriorAMG':          ['gentamicin','tobramycin'],
+                     'PriorCarbapenem':   ['meropenem','ertapenem'],
+                     'PriorCephalosporin':['cefazolin','ceftriaxone','cephalexin'],
+                     'PriorFQ':           ['ciprofloxacin','levofloxacin'],
+                     'PriorPenicillin':   ['amoxicillin','amoxicillin-clavulanate','piperacillin-tazobactam'],
+                     'PriorOtherAbx':     ['trimethoprim-sulfamethoxazole','nitrofurantoin','doxycycline']}
+
+# Change in the log odds of each mechanism with prior exposure to each antibiotic class
+exposure_effects = {'PriorAMG':          {'aminoglycoside':0.9,'amikacin':0.9},
+                    'PriorCarbapenem':   {'carbapenemase':1.5,'porin':1.5},
+                    'PriorCephalosporin':{'ESBL':0.9,'AmpC':0.9,'methicillin':0.5},
+                    'PriorFQ':           {'fluoroquinolone':1.3},
+                    'PriorPenicillin':   {'penicillin':0.5,'inhibitor':0.7,'AmpC':0.4},
+                    'PriorOtherAbx':     {'tmpsmx':0.7,'tetracycline':0.3,'nitrofurantoin':0.3}}
+
+# Change in the log odds of every acquired mechanism with contact with hospitals
+hospital_effects = {'RecentHospitalization':0.5,'Hospital':0.4,'ICU':0.8}
+acquired_mechanisms = [i for i in mechanism_list if i!='metronidazole']
+
+# Change in the log odds of other mechanisms in isolates with ESBL or a carbapenemase (co-resistance on the same plasmids)
+co_resistance = {'ESBL':         {'fluoroquinolone':1.5,'aminoglycoside':1.2,'tmpsmx':1.0},
+                 'carbapenemase':{'fluoroquinolone':2.0,'aminoglycoside':1.5,'amikacin':1.0,'tmpsmx':1.0}}
+
+# Yearly change in the log odds of a mechanism since the first year of the extract
+yearly_trend = {'ESBL':0.05,'carbapenemase':0.08}
+
+# Proportion of isolates with a prior gram negative culture (and the increase after a recent hospitalization),
+# of prior cultures with the same organism, and of those with the same strain (the same mechanisms)
+prior_culture = 0.12
+prior_culture_hospital = 0.2
+same_organism = 0.6
+same_strain   = 0.6
+
+# Proportion of Sunnybrook isolates with a prior gram positive culture (and the increase after a recent hospitalization)
+prior_gram_positive = 0.06
+prior_gram_positive_hospital = 0.06
+
+# Proportion of patients with a clinical history of ESBL, with and without ESBL on a prior culture,
+# and the change in log odds of ESBL with a clinical history
+clinical_esbl_known = 0.8
+clinical_esbl_rate  = 0.02
+clinical_esbl_effect = 3.5
+
+
+def _logit(p):
+    with np.errstate(divide='ignore'):
+        return np.log(p) - np.log1p(-np.asarray(p, dtype=float))
+
+
+def _expit(x):
+    with np.errstate(over='ignore'):
+        return 1/(1+np.exp(-x))
+
+
+def organism_tables():
+    '''
+    Returns, for every organism of organism_list, the log odds of each mechanism (organisms x mechanisms),
+        whether it is intrinsically resistant to each group and the probability that each group is tested
+        (organisms x groups)
+    '''
+    log_odds  = np.empty((len(organism_list),len(mechanism_list)))
+    intrinsic = np.zeros((len(organism_list),len(group_list)), dtype=bool)
+    tested    = np.zeros((len(organism_list),len(group_list)))
+
+    for row, organism in enumerate(organism_list):
+        gram_stain = organisms.gram_stains[organism.split(' ')[0]]
+
+        rates = {**mechanism_rates[gram_stain], **mechanism_rates.get(organism, {})}
+        log_odds[row] = _logit(np.array([rates.get(i, 0) for i in mechanism_list]))
+
+        for group in intrinsic_resistance[gram_stain] + intrinsic_resistance.get(organism, []):
+            intrinsic[row,group_list.index(group)] = True
+
+        tested[row] = [tested_rates[gram_stain].get(i, 0) for i in group_list]
+
+    return log_odds, intrinsic, tested
+
+
+_log_odds, _intrinsic, _tested = organism_tables()
+
+# Groups made resistant by each mechanism, as a matrix (mechanisms x groups)
+_mechanism_groups = np.array([[group in mechanisms[i] for group in group_list] for i in mechanism_list], dtype=np.int32)
+
+_gram_negative_probabilities = np.array(list(gram_negative_frequencies.values()))/sum(gram_negative_frequencies.values())
+_gram_positive_probabilities = np.array(list(gram_positive_frequencies.values()))/sum(gram_positive_frequencies.values())
+
+
+def draw_mechanisms(rng, organism, shift):
+    '''
+    Takes the index in organism_list of each isolate's organism, and the change in log odds of each mechanism
+        for each isolate (isolates x mechanisms)
+    Returns whether each isolate has each mechanism, as a boolean array (isolates x mechanisms)
+    '''
+    log_odds = _log_odds[organism] + shift
+    drawn = rng.random(log_odds.shape)
+    present = drawn < _expit(log_odds)
+
+    for mechanism, effects in co_resistance.items():
+        for other, effect in effects.items():
+            log_odds[:,mechanism_list.index(other)] += effect*present[:,mechanism_list.index(mechanism)]
+
+    return drawn < _expit(log_odds)
+
+
+def resistance(organism, present):
+    '''
+    Takes the index in organism_list of each isolate's organism and its mechanisms from draw_mechanisms()
+    Returns whether each isolate is resistant to each group, as a boolean array (isolates x groups)
+    '''
+    return _intrinsic[organism] | ((present.astype(np.int32) @ _mechanism_groups) > 0)
+
+
+def antibiogram(rng, site, suffix, organism, present):
+    '''
+    Takes the index in organism_list of the organism of a culture (-1 where there was none) and its mechanisms
+    Returns the antibiogram columns of the culture, as written in a site's extract
+    '''
+    rows = len(organism)
+    resistant = resistance(organism, present)
+    cultured = organism>=0
+    names = np.array(results[site], dtype=object)
+
+    # Resistance that leads to testing of the new beta-lactam combinations
+    reflex = resistant[:,[group_list.index(i) for i in ['ceftriaxone','ceftazidime','carbapenem']]].any(axis=1)
+
+    # Organisms that can be cultured for the antibiogram
+    gram_negative = len(gram_negative_frequencies)
+    possible = slice(gram_negative, None) if suffix=='_PGPO' else slice(0, gram_negative)
+
+    data = {}
+    for drug in antibiograms[site][suffix]:
+
+        # Antibiotics never reported for these organisms are blank columns, which are read from Excel as numbers
+        group = group_list.index(antibiotic_groups[drug]) if drug in antibiotic_groups else None
+        if group is None or _tested[possible,group].max()==0:
+            data[drug+suffix] = np.nan
+            continue
+
+        tested_rate = _tested[organism,group]
+        if antibiotic_groups[drug]=='novel': tested_rate = np.where(reflex, novel_tested_resistant, tested_rate)
+
+        result = resistant[:,group] ^ (rng.random(rows)<discordant)
+        code   = np.where(result, np.where(rng.random(rows)<intermediate, 1, 2), 0)
+        data[drug+suffix] = np.where(cultured & (rng.random(rows)<tested_rate), names[code], None)
+
+    return data
+
+
+def extract(site, rows, seed=0, start=0, total=None):
+    '''
+    Returns a synthetic raw extract of a site with the given number of rows, as read by ingest.read_extract
+    start and total place the rows in a larger extract written in chunks (see chunks()): patient identifiers,
+        episodes and years increase through the whole extract, as in the real extracts
+    The same seed and start always give the same rows
+    '''
+    order = column_order(site)
+    total = total or rows
+
+    rng = np.random.default_rng([seed,start])
+    position = start + np.arange(rows)
+    binary = lambda p: (rng.random(rows)<p).astype(int)
+
+    data = {}
+
+    # Patients
+    age_categories = np.array(list(encoding.age_categories), dtype=object)
+    data['AgeCat'] = age_categories[rng.choice(len(age_categories), rows, p=age_probabilities)]
+    is_male = rng.random(rows)<male
+
+    # Community (0), hospital (1) and ICU (2) acquisition
+    acquisition = rng.choice(3, rows, p=acquisition_probabilities)
+    is_surgical = rng.random(rows)<np.asarray(surgical)[acquisition]
+    recent      = rng.random(rows)<np.asarray(recent_hospitalization)[acquisition]
+    data['RecentHospitalization'] = recent.astype(int)
+
+    first, last = years[site]
+    year = first + position*(last-first+1)//total
+    data[encoding.year_columns[site]] = year
+
+    # Prior antibiotic exposures, more likely after contact with hospitals
+    exposures = {}
+    for column, rate in exposure_rates.items():
+        log_odds = (_logit(rate) + exposure_hospital_effects['RecentHospitalization']*recent
+                                 + exposure_hospital_effects['Hospital']*(acquisition>0))
+        exposures[column] = rng.random(rows)<_expit(log_odds)
+
+    # Change in the log odds of each mechanism
+    shift = np.zeros((rows,len(mechanism_list)))
+    hospital = (hospital_effects['RecentHospitalization']*recent + hospital_effects['Hospital']*(acquisition==1)
+                + hospital_effects['ICU']*(acquisition==2))
+    shift[:,[mechanism_list.index(i) for i in acquired_mechanisms]] += hospital[:,None]
+
+    for column, effects in exposure_effects.items():
+        for mechanism, effect in effects.items():
+            shift[:,mechanism_list.index(mechanism)] += effect*exposures[column]
+
+    for mechanism, trend in yearly_trend.items():
+        shift[:,mechanism_list.index(mechanism)] += trend*(year-first)
+
+    # Final and prior gram negative cultures
+    gram_negative = len(gram_negative_frequencies)
+    final = rng.choice(gram_negative, rows, p=_gram_negative_probabilities)
+
+    has_prior = rng.random(rows) < prior_culture + prior_culture_hospital*recent
+    same      = rng.random(rows)<same_organism
+    prior = np.where(has_prior, np.where(same, final, rng.choice(gram_negative, rows, p=_gram_negative_probabilities)), -1)
+    prior_present = draw_mechanisms(rng, prior, shift)
+
+    # A clinical history of ESBL mostly comes from a prior culture, and makes ESBL more likely
+    esbl = mechanism_list.index('ESBL')
+    clinical_esbl = rng.random(rows) < np.where(has_prior & prior_present[:,esbl], clinical_esbl_known, clinical_esbl_rate)
+    data['ClinicalESBL'] = clinical_esbl.astype(int)
+    shift[:,esbl] += clinical_esbl_effect*clinical_esbl
+
+    present = draw_mechanisms(rng, final, shift)
+
+    # A prior culture of the same strain has the same mechanisms
+    same_strain_rows = has_prior & same & (rng.random(rows)<same_strain)
+    present[same_strain_rows] = prior_present[same_strain_rows]
+
+    names = np.array(organism_list + [None], dtype=object)
+    if site=='Trillium': names = np.array([i.upper() for i in organism_list] + [None], dtype=object)
+
+    data['FINAL']      = names[final]
+    data['PriorGNOrg'] = names[prior]
+    data.update(antibiogram(rng, site, '_FINAL', final, present))
+    data.update(antibiogram(rng, site, '_PGNO', prior, prior_present))
+
+    if site=='Sunnybrook':
+        data['Anonymous_ID'] = 1 + position*max(total*4//5,1)//total
+        data['Episode']      = 1 + position*episodes//total
+        data['Sex']          = np.where(is_male, 'M', 'F').astype(object)
+
+        data['Community(1), Hospital(2)']                 = 1 + (acquisition>0)
+        data['ICU Aquired']                               = (acquisition==2).astype(int)
+        data['Medical(1) Surgical (2) Admitting Service'] = 1 + is_surgical
+        data['NumberOfBacteremiasLastYear']               = rng.poisson(0.1 + 0.5*has_prior)
+        data['ICUExposure'] = ((acquisition==2) | (recent & (rng.random(rows)<0.15))).astype(int)
+        for column in encoding.prior_columns:
+            data[column] = exposures[column].astype(int)
+
+        # Prior gram positive cultures
+        has_gram_positive = rng.random(rows) < prior_gram_positive + prior_gram_positive_hospital*recent
+        gram_positive = np.where(has_gram_positive,
+                                 gram_negative + rng.choice(len(gram_positive_frequencies), rows,
+                                                            p=_gram_positive_probabilities), -1)
+        gram_positive_present = draw_mechanisms(rng, gram_positive, shift)
+        data['PriorGPOrg'] = names[gram_positive]
+        data.update(antibiogram(rng, site, '_PGPO', gram_positive, gram_positive_present))
+
+        mrsa = ((gram_positive==organism_list.index('Staphylococcus aureus'))
+                & gram_positive_present[:,mechanism_list.index('methicillin')])
+        data['ClincalMRAS'] = (mrsa | (rng.random(rows)<0.02)).astype(int)
+        data['ClinicalVRE'] = binary(0.01)
+
+        # Screening results, blank for patients who were not screened
+        screened = {'MRSA':data['ClincalMRAS'], 'VRE':data['ClinicalVRE'], 'ESBL':data['ClinicalESBL']}
+        for organism, history in screened.items():
+            twelve_months = np.where(rng.random(rows)<0.5, history, np.nan)
+            data[organism+'12months'] = twelve_months
+            data[organism+'7days']    = np.where(rng.random(rows)<0.5, twelve_months*binary(0.3), np.nan)
+
+        data['culture_test_cd'] = np.array(['BC','UR','WD'], dtype=object)[rng.choice(3, rows, p=[0.6,0.3,0.1])]
+        data['organism']        = data['FINAL']
+        data['GNB Group']       = np.nan
+    else:
+        data['Sex']         = np.where(is_male, 'Male', 'Female').astype(object)
+        data['ADMIT_SVC']   = np.where(is_surgical, 'Surgical', 'Medical').astype(object)
+        data['Acquisition'] = np.array(['Community','Hospital','ICU'], dtype=object)[acquisition]
+
+    if site=='TOH':
+        data['CULTURE_DESCRIPTION'] = np.array(['BLOOD CULTURE','URINE CULTURE (ADULT)'], dtype=object)[binary(0.5)]
+        data['AMP-C'] = np.nan
+        for column in encoding.prior_columns:
+            data[column] = exposures[column].astype(int)
+
+    if site=='Trillium':
+        # Prior antibiotics are given by name
+        for column in encoding.prior_columns:
+            drugs = np.array(prior_antibiotics[column], dtype=object)
+            data[column] = np.where(exposures[column], drugs[rng.integers(0, len(drugs), rows)], None)
+
+    for column in blank_columns[site]:
+        data[column] = np.nan
+
+    return pd.DataFrame(data)[order].set_axis(columns(site), axis=1)
+
+
+def chunks(site, rows, chunksize=100000, seed=0):
+    '''
+    Yields a synthetic extract of a site, chunksize rows at a time
+    '''
+    for start in range(0, rows, chunksize):
+        yield extract(site, min(chunksize, rows-start), seed, start, rows)
+
+
+def patients(site, rows, seed=0, start=0, total=None, antibiotics=training.antibiotic_list):
+    '''
+    Returns synthetic isolates of a site as the patient file read by batch_score.py: an Isolate number and
+        the regression inputs of the models of each antibiotic, from a synthetic extract after cleaning,
+        imputation and encoding
+    '''
+    data = ingest.impute_chunk(extract(site, rows, seed, start, total), site, imputation.load_rules(site))
+    data = data.astype({i:object for i in organisms.organism_column_names if i in data.columns})
+    data = encoding.encode(data, site, antibiotics)
+
+    # Encoded categories that do not occur in a chunk are added as zeros
+    inputs = list(dict.fromkeys(i for antibiotic in antibiotics for i in training.regression_inputs(antibiotic)))
+    inputs = data.reindex(columns=inputs, fill_value=0).astype(float).reset_index(drop=True)
+    inputs.insert(0, 'Isolate', start + np.arange(rows))
+
+    return inputs
+
+
+def _parquet_table(chunk, schema):
+    '''
+    Converts a chunk to an Arrow table matching the schema of the first chunk, where blank columns are text
+    Returns the table, and the schema (set from this chunk if schema is None)
+    '''
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(chunk, preserve_index=False)
+    if schema is None:
+        schema = pa.schema([i.with_type(pa.large_string()) if pa.types.is_null(i.type) else i for i in table.schema],
+                           metadata=table.schema.metadata)
+
+    return table.cast(schema), schema
+
+
+def write(site, rows, path, chunksize=100000, seed=0, patient_inputs=False, processes=1):
+    '''
+    Writes a synthetic extract of a site (or with patient_inputs, the output of patients()) to a CSV or Parquet file,
+        chunksize rows at a time, with chunks generated in parallel across processes
+    The file is the same for any number of processes
+    Returns the number of rows written
+    '''
+    function = patients if patient_inputs else extract
+    parquet  = str(path).endswith('.parquet')
+    writer = None
+    schema = None
+    written = 0
+
+    def write_chunk(chunk):
+        nonlocal writer, schema, written
+        if parquet:
+            import pyarrow.parquet
+            table, schema = _parquet_table(chunk, schema)
+            if writer is None: writer = pyarrow.parquet.ParquetWriter(path, schema)
+            writer.write_table(table)
+        else:
+            chunk.to_csv(path, mode='w' if written==0 else 'a', header=(written==0), index=False)
+
+        written += len(chunk)
+
+    starts = range(0, rows, chunksize)
+    try:
+        if processes==1:
+            for start in starts:
+                write_chunk(function(site, min(chunksize, rows-start), seed, start, rows))
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+
+                # Keep a few chunks in flight per process, so that finished chunks do not pile up in memory
+                in_flight = []
+                for start in starts:
+                    in_flight.append(executor.submit(function, site, min(chunksize, rows-start), seed, start, rows))
+                    if len(in_flight)>=2*processes:
+                        write_chunk(in_flight.pop(0).result())
+
+                for future in in_flight:
+                    write_chunk(future.result())
+    finally:
+        if writer is not None: writer.close()
+
+    return written
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description='Write a synthetic extract of a site, chunk by chunk')
+    parser.add_argument('--site', choices=encoding.hospital_list, required=True)
+    parser.add_argument('--rows', type=int, required=True, help='number of isolates')
+    parser.add_argument('--output', required=True, help='CSV or Parquet file to write')
+    parser.add_argument('--chunksize', type=int, default=100000, help='rows generated at a time')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=1, help='worker processes generating chunks')
+    parser.add_argument('--patients', action='store_true',
+                        help='write the regression inputs of the isolates, for batch_score.py, instead of a raw extract')
+    arguments = parser.parse_args(arguments)
+
+    start = time.perf_counter()
+    rows = write(arguments.site, arguments.rows, arguments.output, arguments.chunksize, arguments.seed,
+                 arguments.patients, arguments.processes)
+
+    print('Wrote {} rows to {} in {:.1f} s'.format(rows, arguments.output, time.perf_counter()-start))
+
+
+if __name__=='__main__':
+    sys.exit(main())
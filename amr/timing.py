@@ -0,0 +1,183 @@
+##################################
+#                                #
+# timing.py                      #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Timing spans for the pipeline stages, ingest and the imputation rules
+
+Timing is off unless the AMR_TIMING environment variable is set (or enable() is called),
+and a span then costs one check of a module variable. When timing is on, each span is:
+    logged as a JSON line on the 'amr.timing' logger (span, labels and seconds), at INFO level
+    added to a latency histogram of its name and labels
+Histograms are returned in the Prometheus text format by prometheus_text(), written to a file
+by write() (e.g. for a node exporter textfile collector), and written to AMR_TIMING_FILE
+when the main process exits.
+
+Pipeline stages run in worker processes, which return their spans with collect() for the
+main process to merge().
+
+Usage:
+    from amr import timing
+    with timing.span('impute', site='TOH'):
+        ...
+
+    AMR_TIMING=1 python -m amr.pipeline ...
+    python -m amr.pipeline ... --timing pipeline_timing.prom
+'''
+
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+import contextlib
+import multiprocessing
+
+
+# Upper bounds of the histogram buckets, in seconds (the last bucket, +Inf, is added)
+buckets = [0.0001,0.00025,0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,300]
+
+metric_name = 'amr_span_seconds'
+
+logger = logging.getLogger('amr.timing')
+
+enabled = bool(os.environ.get('AMR_TIMING') or os.environ.get('AMR_TIMING_FILE'))
+
+# (span name, ((label, value), ...)): [observations in each bucket, count, sum of seconds]
+_histograms = {}
+_lock = threading.Lock()
+
+
+def enable(on=True):
+    '''
+    Turns timing on or off, in this process and in worker processes started afterwards
+    '''
+    global enabled
+    enabled = on
+
+    if on: os.environ['AMR_TIMING'] = '1'
+    else:  os.environ.pop('AMR_TIMING', None)
+
+
+def record(name, seconds, **labels):
+    '''
+    Adds a time in seconds to the histogram of a span, and logs it
+    '''
+    if not enabled: return
+
+    key = (name, tuple(sorted((i, str(j)) for i, j in labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None: histogram = _histograms[key] = [[0]*(len(buckets)+1), 0, 0.0]
+
+        histogram[0][bisect.bisect_left(buckets, seconds)] += 1
+        histogram[1] += 1
+        histogram[2] += seconds
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'span':name, **labels, 'seconds':round(seconds,6)}, default=str))
+
+
+class _Span:
+
+    __slots__ = ('name','labels','start')
+
+    def __init__(self, name, labels):
+        self.name   = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        record(self.name, time.perf_counter()-self.start, **self.labels)
+
+
+# Returned by span() while timing is off
+_disabled = contextlib.nullcontext()
+
+
+def span(name, **labels):
+    '''
+    Returns a context manager that times its block as a span with the given name and labels
+    '''
+    if not enabled: return _disabled
+    return _Span(name, labels)
+
+
+def collect():
+    '''
+    Returns the histograms recorded in this process, and clears them (see merge())
+    '''
+    global _histograms
+    with _lock:
+        histograms, _histograms = _histograms, {}
+
+    return histograms
+
+
+def merge(histograms):
+    '''
+    Adds histograms returned by collect() in another process to this process's histograms
+    '''
+    with _lock:
+        for key, (counts, count, total) in histograms.items():
+            histogram = _histograms.setdefault(key, [[0]*(len(buckets)+1), 0, 0.0])
+            histogram[0] = [i+j for i, j in zip(histogram[0], counts)]
+            histogram[1] += count
+            histogram[2] += total
+
+
+def reset():
+    collect()
+
+
+def _label_text(labels):
+    return ','.join('{}="{}"'.format(i, j.replace('\\','\\\\').replace('"','\\"').replace('\n','\\n'))
+                    for i, j in labels)
+
+
+def prometheus_text():
+    '''
+    Returns the histogram of every span in the Prometheus text exposition format
+    '''
+    with _lock:
+        histograms = sorted((key, [list(counts), count, total]) for key, (counts, count, total) in _histograms.items())
+
+    lines = ['# HELP {} Time spent in each span of the amr pipeline'.format(metric_name),
+             '# TYPE {} histogram'.format(metric_name)]
+
+    for (name, labels), (counts, count, total) in histograms:
+        labels = _label_text((('span',name),) + labels)
+
+        cumulative = 0
+        for bound, observations in zip(buckets+['+Inf'], counts):
+            cumulative += observations
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric_name, labels, bound, cumulative))
+        lines.append('{}_sum{{{}}} {!r}'.format(metric_name, labels, total))
+        lines.append('{}_count{{{}}} {}'.format(metric_name, labels, count))
+
+    return '\n'.join(lines)+'\n'
+
+
+def write(path):
+    '''
+    Writes prometheus_text() to a file, replacing it in one step so that a collector never reads half a file
+    '''
+    # Imported here, as storage imports the modules that are timed
+    from amr import storage
+    storage.write_atomic(path, prometheus_text().encode())
+
+
+def _write_at_exit():
+    # Worker processes return their spans to the main process instead
+    if os.environ.get('AMR_TIMING_FILE') and multiprocessing.parent_process() is None:
+        write(os.environ['AMR_TIMING_FILE'])
+
+atexit.register(_write_at_exit)
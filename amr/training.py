@@ -0,0 +1,442 @@
+##################################
+#                                #
+# training.py                    #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Fits the logistic regression models of every site and antibiotic in parallel
+
+The regression notebooks save their encoded inputs with write_inputs() (one row per
+isolate, in temporal order). For each (site, antibiotic), two models are fitted, the
+same as in the notebooks:
+    temporal: trained on the first part of the data and tested on the rest (80/20 for Sunnybrook, 75/25 otherwise)
+    final:    trained on all of the data, and saved as <Antibiotic>_<Site>.json and .npy (see artifact.py),
+              with its training window and the test metrics of the temporal model
+Each site's inputs are copied once into shared memory, and every worker process reads
+them from there, so the data is not copied for each fit.
+Models and the metrics file are written to a temporary file and then renamed,
+so that a reader (e.g. the shiny app) never sees a half-written file.
+
+Every regression input is binary, except for age which takes 12 values, so a model's data
+comes down to the number of isolates, and of resistant isolates, for each combination of
+its inputs (at most 12 x 2^10). A logistic regression fitted to these counts as weights has
+the same likelihood as one fitted to every isolate. train() saves the counts of each final
+model as <Antibiotic>_<Site>_statistics.parquet, and refresh() adds the counts of new
+isolates to them and refits, starting from the previous coefficients. A monthly refresh
+then costs the same however long the history is, and is compared with a full refit.
+
+Usage:
+    python -m amr.training --data Sunnybrook "2024-05-19 AMR_regression_Sunnybrook.parquet" \
+                           --data TOH "2024-12-14 AMR_regression_TOH.parquet" --output-directory "shiny core"
+    python -m amr.training --refresh --data TOH "2025-01 AMR_regression_TOH new isolates.parquet" \
+                           --output-directory "shiny core"
+'''
+
+import os
+import sys
+import time
+import argparse
+import warnings
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from amr import artifact, encoding, evaluation, storage
+
+
+antibiotic_list = ['Meropenem','Piptaz','Ceftazidime','Ceftriaxone','Ciprofloxacin']
+
+antibiotic_classes = {'Cefazolin':'Cephalosporin','Ceftriaxone':'Cephalosporin','Ceftazidime':'Cephalosporin',
+                      'Piptaz':'Penicillin','Meropenem':'Carbapenem','Ciprofloxacin':'FQ','Tobramycin':'AMG',
+                      'TMPSMX':'OtherAbx','Piptaz_or_Tobramycin':'Penicillin_or_AMG'}
+
+# Fraction of each site's data in the training set of the temporal split
+train_fraction = {'Sunnybrook':0.8,'TOH':0.75,'Trillium':0.75}
+
+splits = ['temporal','final']
+
+# Bootstrap resamples of the test set for the confidence interval of its AUC (see evaluation.py)
+bootstrap_replicates = 1000
+
+metrics_filename = 'training_metrics.csv'
+refresh_metrics_filename = 'refresh_metrics.csv'
+
+
+def regression_inputs(antibiotic):
+    '''
+    Returns the regression inputs of an antibiotic's model, in the order used by the notebooks
+    '''
+    return ['Age','sex_M',
+            'acquisition_ICU','acquisition_ward',
+            'adm_service_surgical','RecentHospitalization',
+
+            'Prior'+antibiotic_classes[antibiotic],
+            'PriorNon'+antibiotic_classes[antibiotic],
+             antibiotic+'Resistance_susceptible',antibiotic+'Resistance_nonsusceptible',
+
+            'ClinicalESBL']
+
+
+def outcome(antibiotic):
+    '''
+    Returns the column of imputed susceptibility (0 = susceptible, 1 = resistant) that a model predicts
+    '''
+    return antibiotic+'_FINAL_imp'
+
+
+def regression_columns(antibiotics=antibiotic_list):
+    '''
+    Returns every input and outcome column used by the models of a list of antibiotics
+    '''
+    columns = []
+    for antibiotic in antibiotics:
+        for column in regression_inputs(antibiotic)+[outcome(antibiotic)]:
+            if column not in columns: columns.append(column)
+
+    return columns
+
+
+def write_inputs(data, path, antibiotics=antibiotic_list, site=None):
+    '''
+    Takes the encoded data of a regression notebook (one_hot_data)
+    Writes the regression inputs and outcomes to a Parquet file, as numbers, keeping the order of the rows
+    With a site, the year of each isolate is also written, as 'year', for the training window of the models
+    '''
+    inputs = data[regression_columns(antibiotics)].astype(float)
+    if site is not None: inputs['year'] = data[encoding.year_columns[site]].astype(float)
+
+    inputs.reset_index(drop=True).to_parquet(path, index=False)
+
+
+def read_inputs(path, antibiotics=antibiotic_list):
+    '''
+    Reads a file written by write_inputs()
+    Returns a DataFrame, with the 'year' column if it was written
+    '''
+    import pyarrow.parquet
+
+    columns = regression_columns(antibiotics)
+    if 'year' in pyarrow.parquet.read_schema(path).names: columns = columns+['year']
+
+    return pd.read_parquet(path, columns=columns)
+
+
+def fit(X, y, sample_weight=None, start=None, tol=1e-4):
+    '''
+    Returns a logistic regression fitted as in the regression notebooks
+    start optionally gives a fitted model whose coefficients the fit starts from
+    '''
+    from sklearn import linear_model
+
+    # As in the notebooks, which ignore FutureWarnings (e.g. about penalty=None)
+    with warnings.catch_warnings():
+        warnings.simplefilter(action='ignore', category=FutureWarning)
+        reg = linear_model.LogisticRegression(max_iter=500,penalty=None,tol=tol,warm_start=start is not None)
+        if start is not None:
+            reg.coef_      = start.coef_.copy()
+            reg.intercept_ = start.intercept_.copy()
+        reg.fit(X, y, sample_weight=sample_weight)
+
+    return reg
+
+
+def auc(y, decision):
+    '''
+    Returns the area under the ROC curve, or NaN if only one class is present
+    '''
+    return evaluation.auc(y, decision)
+
+
+def statistics(data, antibiotic):
+    '''
+    Takes regression inputs and outcomes (e.g. from read_inputs)
+    Returns the number of isolates (rows) and of resistant isolates (resistant) for each combination of
+        an antibiotic's regression inputs
+    '''
+    inputs = regression_inputs(antibiotic)
+
+    counts = data[inputs].astype(float).assign(rows=1, resistant=data[outcome(antibiotic)].astype(int))
+    return counts.groupby(inputs, as_index=False, sort=True)[['rows','resistant']].sum()
+
+
+def add_statistics(*tables):
+    '''
+    Returns the sum of tables from statistics() for the same antibiotic
+    '''
+    combined = pd.concat(tables, ignore_index=True)
+    inputs = [i for i in combined.columns if i not in ('rows','resistant')]
+
+    return combined.groupby(inputs, as_index=False, sort=True)[['rows','resistant']].sum()
+
+
+def fit_statistics(table, start=None, tol=1e-8):
+    '''
+    Takes a table from statistics()
+    Returns a logistic regression fitted to the counts, which has the same likelihood as fitting every isolate
+    The table is small, so the fit is run to a tighter tolerance than the notebooks' (1e-4), so that a fit
+        started from previous coefficients ends at the same model as a fit from scratch
+    '''
+    inputs = [i for i in table.columns if i not in ('rows','resistant')]
+
+    # Each combination of inputs is a resistant row and a susceptible row, weighted by their counts
+    resistant   = table[inputs].assign(outcome=1, weight=table['resistant'])
+    susceptible = table[inputs].assign(outcome=0, weight=table['rows']-table['resistant'])
+    rows = pd.concat([resistant,susceptible], ignore_index=True)
+    rows = rows[rows['weight']>0]
+
+    return fit(rows[inputs], rows['outcome'], rows['weight'].to_numpy(dtype=float), start, tol)
+
+
+def statistics_path(output_directory, antibiotic, site):
+    return os.path.join(output_directory, antibiotic+'_'+site+'_statistics.parquet')
+
+
+def write_statistics(table, path):
+    storage.write_atomic(path, table.to_parquet(index=False))
+
+
+def coefficients(reg):
+    '''
+    Returns the intercept and coefficients of a model as a Series
+    '''
+    return pd.Series(np.concatenate([reg.intercept_, reg.coef_[0]]), index=['intercept']+list(reg.feature_names_in_))
+
+
+# Views of each site's shared matrix in a worker process, set once by _attach
+# {site: (array, columns, shared memory block)}
+_matrices = {}
+
+def _attach(shared):
+    '''
+    Opens the shared matrices of every site in a worker process
+    '''
+    for site, (name, shape, columns) in shared.items():
+        # The parent process owns the memory, and removes it when training is done
+        block = shared_memory.SharedMemory(name=name)
+        _matrices[site] = (np.ndarray(shape, dtype=float, buffer=block.buf), columns, block)
+
+
+def _fit_task(site, antibiotic, split):
+    '''
+    Fits one model in a worker process
+    Returns the fitted model and a dict of metrics
+    '''
+    matrix, columns, _ = _matrices[site]
+    inputs = regression_inputs(antibiotic)
+
+    missing = [i for i in inputs+[outcome(antibiotic)] if i not in columns]
+    if missing:
+        raise ValueError('{} data is missing columns for {}: {}'.format(site, antibiotic, missing))
+
+    X = pd.DataFrame(matrix[:,[columns.index(i) for i in inputs]], columns=inputs)
+    y = matrix[:,columns.index(outcome(antibiotic))].astype(int)
+
+    if split=='temporal': train = int(train_fraction[site]*len(X))
+    else:                 train = len(X)
+
+    start = time.perf_counter()
+    reg = fit(X[:train], y[:train])
+    seconds = time.perf_counter()-start
+
+    if train<len(X):
+        # The worker is already one of the training processes, so the bootstrap runs in it
+        test = evaluation.bootstrap(y[train:], reg.predict_proba(X[train:])[:,0], bootstrap_replicates,
+                                    cutoffs=[], processes=1).set_index('metric')
+    else:
+        test = pd.DataFrame({'estimate':np.nan,'lower':np.nan,'upper':np.nan}, index=['AUC'])
+
+    metrics = {'site':           site,
+               'antibiotic':     antibiotic,
+               'split':          split,
+               'train_rows':     train,
+               'test_rows':      len(X)-train,
+               'train_resistant':y[:train].mean(),
+               'train_AUC':      auc(y[:train], reg.decision_function(X[:train])),
+               'test_AUC':       test.loc['AUC','estimate'],
+               'test_AUC_lower': test.loc['AUC','lower'],
+               'test_AUC_upper': test.loc['AUC','upper'],
+               'iterations':     int(reg.n_iter_[0]),
+               'seconds':        seconds}
+
+    return reg, metrics
+
+
+def model_path(output_directory, antibiotic, site):
+    return artifact.path(output_directory, antibiotic, site)
+
+
+def model_metrics(final, temporal):
+    '''
+    Takes the metrics of the final and temporal fits of a model
+    Returns the metrics saved with the final model: its own fit, and the test set of the temporal model
+    '''
+    return {'train_rows':     final['train_rows'],
+            'train_resistant':final['train_resistant'],
+            'train_AUC':      final['train_AUC'],
+            'iterations':     final['iterations'],
+            'test_rows':      temporal['test_rows'],
+            'test_AUC':       temporal['test_AUC'],
+            'test_AUC_lower': temporal['test_AUC_lower'],
+            'test_AUC_upper': temporal['test_AUC_upper']}
+
+
+def train(datasets, antibiotics=antibiotic_list, output_directory='.', processes=None):
+    '''
+    Takes a dict of site: DataFrame of regression inputs (e.g. from read_inputs)
+    Fits the temporal and final model of every site and antibiotic across processes
+    Writes each final model to <Antibiotic>_<Site>.json and .npy (see artifact.py), its statistics to
+        <Antibiotic>_<Site>_statistics.parquet (for refresh), and the metrics of every fit to training_metrics.csv,
+        in output_directory
+    Returns the metrics as a DataFrame
+    '''
+    columns = regression_columns(antibiotics)
+    processes = processes or os.cpu_count()
+
+    # Copy each site's inputs into shared memory once
+    blocks = []
+    shared = {}
+    try:
+        for site, data in datasets.items():
+            site_columns = [i for i in columns if i in data.columns]
+            values = data[site_columns].to_numpy(dtype=float)
+
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes,1))
+            blocks.append(block)
+            np.ndarray(values.shape, dtype=float, buffer=block.buf)[:] = values
+            shared[site] = (block.name, values.shape, site_columns)
+
+        tasks = [(site, antibiotic, split) for site in datasets for antibiotic in antibiotics for split in splits]
+
+        metrics = []
+        models  = {}
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+                                                    initializer=_attach,
+                                                    initargs=(shared,)) as executor:
+
+            futures = {executor.submit(_fit_task, *task): task for task in tasks}
+
+            for future in concurrent.futures.as_completed(futures):
+                site, antibiotic, split = futures[future]
+                model, task_metrics = future.result()
+                metrics.append(task_metrics)
+
+                if split=='final': models[(site, antibiotic)] = model
+
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    # Same order as the tasks, whatever order they finished in
+    metrics = pd.DataFrame(metrics)
+    order = {task:i for i, task in enumerate(tasks)}
+    metrics = metrics.iloc[np.argsort([order[task] for task in zip(metrics['site'],metrics['antibiotic'],metrics['split'])])]
+    metrics = metrics.reset_index(drop=True)
+
+    storage.write_atomic(os.path.join(output_directory, metrics_filename), metrics.to_csv(index=False).encode())
+
+    split_metrics = {(i['site'],i['antibiotic'],i['split']):i for i in metrics.to_dict('records')}
+
+    for site, data in datasets.items():
+        window = artifact.training_window(data)
+        for antibiotic in antibiotics:
+            artifact.write(output_directory, models[(site, antibiotic)], antibiotic, site, window,
+                           model_metrics(split_metrics[(site,antibiotic,'final')], split_metrics[(site,antibiotic,'temporal')]))
+            write_statistics(statistics(data, antibiotic), statistics_path(output_directory, antibiotic, site))
+
+    return metrics
+
+
+def refresh(datasets, antibiotics=antibiotic_list, output_directory='.'):
+    '''
+    Takes a dict of site: DataFrame of regression inputs of new isolates only (e.g. from read_inputs)
+    Adds them to the statistics saved by train() (or a previous refresh) in output_directory, and refits
+        each final model from the updated statistics, starting from the coefficients of the saved model
+    Writes the refreshed models and statistics over the previous ones, and the metrics to refresh_metrics.csv
+    Returns the metrics as a DataFrame, with the coefficient drift of each model:
+        drift:            largest change of a coefficient from the previous model
+        refit_difference: largest difference of a coefficient from a full refit from scratch on the same isolates
+    '''
+    metrics = []
+
+    for site, data in datasets.items():
+        for antibiotic in antibiotics:
+            saved = artifact.read(model_path(output_directory, antibiotic, site), mmap=False)
+            previous = artifact.to_model(saved)
+
+            table = add_statistics(pd.read_parquet(statistics_path(output_directory, antibiotic, site)),
+                                   statistics(data, antibiotic))
+
+            start = time.perf_counter()
+            reg = fit_statistics(table, start=previous)
+            seconds = time.perf_counter()-start
+
+            start = time.perf_counter()
+            refit = fit_statistics(table)
+            refit_seconds = time.perf_counter()-start
+
+            metrics.append({'site':            site,
+                            'antibiotic':      antibiotic,
+                            'new_rows':        len(data),
+                            'rows':            int(table['rows'].sum()),
+                            'iterations':      int(reg.n_iter_[0]),
+                            'refit_iterations':int(refit.n_iter_[0]),
+                            'drift':           (coefficients(reg)-coefficients(previous)).abs().max(),
+                            'refit_difference':(coefficients(reg)-coefficients(refit)).abs().max(),
+                            'seconds':         seconds,
+                            'refit_seconds':   refit_seconds})
+
+            window = saved['window'].copy()
+            window['isolates'] = metrics[-1]['rows']
+            if 'year' in data.columns and len(data):
+                window['first_year'] = int(min(window.get('first_year',np.inf), data['year'].min()))
+                window['last_year']  = int(max(window.get('last_year',-np.inf), data['year'].max()))
+
+            # The test metrics are still those of the temporal model fitted alongside the first saved model,
+            # and the training AUC needs every isolate, so is dropped
+            refreshed = {i:j for i, j in saved['metrics'].items() if i!='train_AUC'}
+            refreshed.update(train_rows=metrics[-1]['rows'], train_resistant=table['resistant'].sum()/table['rows'].sum(),
+                             iterations=metrics[-1]['iterations'], refresh_rows=len(data),
+                             drift=metrics[-1]['drift'], refit_difference=metrics[-1]['refit_difference'])
+
+            artifact.write(output_directory, reg, antibiotic, site, window, refreshed)
+            write_statistics(table, statistics_path(output_directory, antibiotic, site))
+
+    metrics = pd.DataFrame(metrics)
+    storage.write_atomic(os.path.join(output_directory, refresh_metrics_filename), metrics.to_csv(index=False).encode())
+
+    return metrics
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description='Fit the regression models of every site and antibiotic in parallel')
+    parser.add_argument('--data', nargs=2, action='append', metavar=('SITE','PATH'), required=True,
+                        help='site and regression inputs written by training.write_inputs (repeat for each site)')
+    parser.add_argument('--antibiotics', nargs='+', default=antibiotic_list, help='antibiotics to fit models for')
+    parser.add_argument('--output-directory', default='.', help='folder to write the models and metrics to')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--refresh', action='store_true',
+                        help='add the data (new isolates only) to the saved models instead of fitting from scratch')
+    arguments = parser.parse_args(arguments)
+
+    for site, _ in arguments.data:
+        if site not in train_fraction: parser.error('unknown site {} (expected one of {})'.format(site, list(train_fraction)))
+
+    datasets = {site:read_inputs(path, arguments.antibiotics) for site, path in arguments.data}
+
+    start = time.perf_counter()
+    if arguments.refresh: metrics = refresh(datasets, arguments.antibiotics, arguments.output_directory)
+    else:                 metrics = train(datasets, arguments.antibiotics, arguments.output_directory, arguments.processes)
+
+    print(metrics.to_string(index=False, float_format=lambda x: '{:.3g}'.format(x) if abs(x)<0.001 else '{:.3f}'.format(x)))
+    print('\n{} {} models in {:.2f} s'.format('Refreshed' if arguments.refresh else 'Fitted', len(metrics),
+                                              time.perf_counter()-start))
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+##################################
+#                                #
+# api.py                         #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Requests and responses of the JSON prediction endpoint of shiny_core_regression.py
+
+POST /api/predict takes the inputs of the sidebar for one patient (a JSON object), or for
+a batch of patients (a JSON array of objects), with the same ids and values as the form:
+    {"Hospital": "TOH", "Age": "60-64", "SexCat": "Female", "Acquisition": "ICU",
+     "MedVsSurgAdmission": "Medical", "RecentHospitalization": 1, "ClinicalESBL": 0,
+     "PriorCephalosporin": 1, "PriorCiprofloxacinResistance": 2}
+Hospital, Age, SexCat, Acquisition and MedVsSurgAdmission are required (Hospital can be left
+out with "CompareSites": true). The other inputs are 0 (No, or no previous isolate) unless given.
+It returns the probability of susceptibility (0-1) to each antibiotic at the hospital, or at
+every hospital with "CompareSites": true, as an object (or an array, for a batch):
+    {"TOH": {"Meropenem": 0.987, "Piptaz": 0.912, ...}}
+Invalid requests get a 400 response with {"error": message}.
+
+Predictions come from the models the app has loaded, through the same encoding and
+precomputed predictions as the app's table, so they match the app exactly.
+'''
+
+import json
+
+import encoding
+import model_registry
+
+
+# Most patients in one request, so that a batch does not hold up the app's sessions for long
+max_batch = 1000
+
+age_categories = list(encoding.age_values)
+
+# Values each input of the form can take, as the form sends them
+choices = {'Hospital':           model_registry.hospital_list,
+           'Age':                age_categories,
+           'SexCat':             ['Male','Female'],
+           'Acquisition':        ['Community','Hospital non-ICU','ICU'],
+           'MedVsSurgAdmission': ['Medical','Surgical']}
+
+required = list(choices)
+
+
+def input_choices(antibiotic_list):
+    '''
+    Returns the values that each input used by patient_features() can take, for a list of antibiotics
+    '''
+    inputs = dict(choices)
+    for i in encoding.form_inputs:
+        if i not in inputs: inputs[i] = ['0','1']
+    for i in encoding.resistance_inputs(antibiotic_list):
+        inputs[i] = ['0','1','2']
+
+    return inputs
+
+
+def patient_values(patient, inputs):
+    '''
+    Takes the JSON object of one patient, and the inputs from input_choices()
+    Returns the form values of the patient (as given by encoding.form_values), and whether to compare sites
+    Raises ValueError for inputs that are missing, unknown or have a value the form does not offer
+    '''
+    if not isinstance(patient, dict):
+        raise ValueError('Each patient should be a JSON object of form inputs')
+
+    compare_sites = patient.get('CompareSites', False)
+    if not isinstance(compare_sites, bool):
+        raise ValueError('CompareSites should be true or false')
+
+    unknown = [i for i in patient if i not in inputs and i!='CompareSites']
+    if unknown:
+        raise ValueError('Unknown inputs: {}'.format(', '.join(unknown)))
+
+    missing = [i for i in required if i not in patient and not (i=='Hospital' and compare_sites)]
+    if missing:
+        raise ValueError('Missing inputs: {}'.format(', '.join(missing)))
+
+    values = {}
+    for i, allowed in inputs.items():
+        value = patient.get(i, allowed[0])
+
+        # Yes/no inputs can also be given as true/false or numbers
+        if isinstance(value, bool): value = int(value)
+        if isinstance(value, int):  value = str(value)
+
+        if value not in allowed:
+            raise ValueError('{} should be one of {}, not {}'.format(i, ', '.join(allowed), json.dumps(value)))
+        values[i] = value
+
+    return values, compare_sites
+
+
+def patients(body, antibiotic_list):
+    '''
+    Takes the body of a request
+    Returns a list of (form values, compare sites) for each patient, and whether the request was a batch
+    Raises ValueError if the body is not valid
+    '''
+    try:
+        request = json.loads(body)
+    except ValueError:
+        raise ValueError('Request body should be JSON')
+
+    batch = isinstance(request, list)
+    if not batch: request = [request]
+
+    if len(request)>max_batch:
+        raise ValueError('At most {} patients can be predicted in one request'.format(max_batch))
+
+    inputs = input_choices(antibiotic_list)
+    return [patient_values(patient, inputs) for patient in request], batch
+
+
+def prediction(table, susceptibilities, hospitals):
+    '''
+    Takes the scoring table, the probability of susceptibility for each of its models, and the hospitals to return
+    Returns {hospital: {antibiotic: probability of susceptibility}}
+    '''
+    result = {hospital:{} for hospital in hospitals}
+    for (antibiotic, hospital), susceptibility in zip(table['keys'], susceptibilities):
+        if hospital in result: result[hospital][antibiotic] = float(susceptibility)
+
+    return result
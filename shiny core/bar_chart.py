@@ -0,0 +1,110 @@
+##################################
+#                                #
+# bar_chart.py                   #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Bar chart of the predicted susceptibilities, drawn as SVG for shiny_core_regression.py
+
+The chart used to be a matplotlib figure rasterized to a PNG on the server for every
+change of the form, and the figures were never closed. It is now a few kilobytes of SVG
+text, drawn by the browser, so there is no figure to close and no image to render.
+Charts are cached by their values and cutoff (the form can only produce a limited number
+of predictions), so the same chart is never drawn twice, and the cache has a fixed size,
+so memory stays the same however long sessions last.
+
+The layout follows the matplotlib figure: one bar per antibiotic (side by side for each
+hospital when comparing sites), labelled with its whole percentage, and a horizontal line
+at the 80% or 90% cutoff. The legend is a row above the bars, so that it never covers them.
+'''
+
+import functools
+from xml.sax.saxutils import escape
+
+
+width  = 400
+height = 400
+
+# Space around the plot area, for the axis labels and the rotated antibiotic names
+left, right, top, bottom = 50, 10, 30, 120
+
+# matplotlib's tab:blue, tab:green and tab:purple for the hospitals, and orange for the cutoff line
+colours       = ['#1f77b4','#2ca02c','#9467bd']
+cutoff_colour = '#ffa500'
+
+font = 'font-family="sans-serif" font-size="11"'
+
+
+def data(df):
+    '''
+    Takes the DataFrame of susceptibility_outputs_f
+    Returns its antibiotics, hospital columns and values as tuples, the arguments of svg() other than the cutoff
+    '''
+    columns = tuple(df.columns[1:])
+    return tuple(df['Antibiotic']), columns, tuple(tuple(float(i) for i in df[column]) for column in columns)
+
+
+def _y(value):
+    return top + (height-top-bottom)*(1-value/100)
+
+
+@functools.lru_cache(maxsize=2048)
+def svg(antibiotics, columns, values, cutoff):
+    '''
+    Takes tuples of antibiotic names, column names (e.g. 'Predicted susceptibility (%)' or 'TOH (%)'),
+        and susceptibilities (%) for each column and antibiotic, and the cutoff (%)
+    Returns the bar chart as SVG text
+    '''
+    plot_width = width-left-right
+    slot = plot_width/len(antibiotics)
+    bar  = 0.8*slot/len(columns)
+
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {} {}" width="100%" style="max-width:{}px" '
+             'role="img" aria-label="Predicted susceptibility (%) of each antibiotic">'.format(width, height, width)]
+
+    # y axis, with ticks every 20%
+    parts.append('<line x1="{0}" y1="{1}" x2="{0}" y2="{2}" stroke="black"/>'.format(left, top, height-bottom))
+    for tick in range(0,101,20):
+        parts.append('<line x1="{0}" y1="{1:.1f}" x2="{2}" y2="{1:.1f}" stroke="black"/>'
+                     '<text x="{3}" y="{1:.1f}" {4} text-anchor="end" dominant-baseline="middle">{5}</text>'
+                     .format(left-4, _y(tick), left, left-6, font, tick))
+    parts.append('<text transform="translate(12,{:.1f}) rotate(-90)" {} text-anchor="middle">Susceptibility (%)</text>'
+                 .format(_y(50), font))
+
+    # x axis, with the antibiotic names rotated below it
+    parts.append('<line x1="{0}" y1="{1}" x2="{2}" y2="{1}" stroke="black"/>'.format(left, height-bottom, width-right))
+    for i, antibiotic in enumerate(antibiotics):
+        x = left + (i+0.5)*slot
+        parts.append('<text transform="translate({:.1f},{}) rotate(-80)" {} text-anchor="end" dominant-baseline="middle">'
+                     '{}</text>'.format(x, height-bottom+6, font, escape(antibiotic)))
+    parts.append('<text x="{:.1f}" y="{}" {} text-anchor="middle">Antibiotic</text>'.format(left+plot_width/2, height-4, font))
+
+    # Bars, side by side when comparing hospitals, each labelled with its whole percentage
+    for j, column in enumerate(columns):
+        for i, value in enumerate(values[j]):
+            x = left + (i+0.5)*slot + (j-(len(columns)-1)/2)*bar - bar/2
+            parts.append('<rect x="{:.1f}" y="{:.1f}" width="{:.1f}" height="{:.1f}" fill="{}"/>'
+                         '<text x="{:.1f}" y="{:.1f}" {} text-anchor="middle">{:d}</text>'
+                         .format(x, _y(value), bar, _y(0)-_y(value), colours[j],
+                                 x+bar/2, _y(value)-3, font, int(value)))
+
+    parts.append('<line x1="{0}" y1="{1:.1f}" x2="{2}" y2="{1:.1f}" stroke="{3}" stroke-width="1.5"/>'
+                 .format(left, _y(cutoff), width-right, cutoff_colour))
+
+    # Legend of the hospitals (when comparing) and the cutoff, in a row above the bars so that it never covers them
+    entries = [(column[:-len(' (%)')], colours[j], 'rect') for j, column in enumerate(columns) if len(columns)>1]
+    entries.append(('{}%'.format(cutoff), cutoff_colour, 'line'))
+
+    x, y = left+5, top/2
+    for label, colour, shape in entries:
+        if shape=='rect': parts.append('<rect x="{}" y="{}" width="16" height="8" fill="{}"/>'.format(x, y-4, colour))
+        else:             parts.append('<line x1="{0}" y1="{1}" x2="{2}" y2="{1}" stroke="{3}" stroke-width="1.5"/>'
+                                       .format(x, y, x+16, colour))
+        parts.append('<text x="{}" y="{}" {} dominant-baseline="middle">{}</text>'.format(x+21, y, font, escape(label)))
+        x += 21+7*len(label)+15
+
+    parts.append('</svg>')
+
+    return ''.join(parts)
@@ -0,0 +1,168 @@
+##################################
+#                                #
+# batch_score.py                 #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Scores a whole cohort of patients with every antibiotic and hospital model
+
+Takes a CSV or Parquet file with one row per patient and one column per regression
+input, named as in the regression notebooks (Age, sex_M, acquisition_ICU, ...,
+PriorCarbapenem, PriorNonCarbapenem, MeropenemResistance_susceptible, ...).
+Writes the same rows with a Predicted<Antibiotic>Susceptibility_<Hospital> column
+(0-1, as in the notebooks' QA data) for every model. Other columns (e.g. Anonymous_ID)
+are copied through, and regression input columns are left out.
+
+The file is read in chunks, and chunks are scored in parallel across processes.
+
+Usage:
+    python batch_score.py patients.csv predictions.parquet
+    python batch_score.py patients.parquet predictions.csv --chunksize 50000 --processes 4
+'''
+
+import os
+import sys
+import time
+import argparse
+import concurrent.futures
+
+import pandas as pd
+
+import model_registry
+import scorer
+
+
+# Coefficient table of the worker process, set once by _set_table
+_table = None
+
+def _set_table(table):
+    global _table
+    _table = table
+
+
+def _score(x):
+    return scorer.susceptibility(_table, x)
+
+
+def prediction_columns(table):
+    '''
+    Returns the name of the prediction column of each model, in the order of table['keys']
+    '''
+    return ['Predicted'+antibiotic+'Susceptibility_'+hospital for antibiotic, hospital in table['keys']]
+
+
+def read_chunks(path, chunksize):
+    '''
+    Reads a CSV or Parquet file, chunksize rows at a time
+    Yields DataFrames
+    '''
+    if str(path).endswith('.parquet'):
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            yield chunk
+
+
+def feature_matrix(table, chunk):
+    '''
+    Takes a chunk of patients
+    Returns a 2D array of their regression inputs in the order of table['features']
+    '''
+    missing = [i for i in table['features'] if i not in chunk.columns]
+    if missing:
+        raise ValueError('Patient file is missing regression inputs: {}'.format(missing))
+
+    return chunk[table['features']].to_numpy(dtype=float)
+
+
+def predictions(table, chunk, susceptibilities):
+    '''
+    Returns a chunk with its regression inputs replaced by the predicted susceptibilities
+    '''
+    kept = chunk.drop(columns=table['features']).reset_index(drop=True)
+    predicted = pd.DataFrame(susceptibilities, columns=prediction_columns(table))
+
+    return pd.concat([kept,predicted], axis=1)
+
+
+def score_frame(table, data):
+    '''
+    Scores a DataFrame of patients in this process
+    Returns a DataFrame of predictions, as written by score_file()
+    '''
+    return predictions(table, data, scorer.susceptibility(table, feature_matrix(table, data)))
+
+
+def score_file(input_path, output_path, table, chunksize=50000, processes=None):
+    '''
+    Scores a CSV or Parquet file of patients, chunk by chunk, with chunks spread across processes
+    Writes predictions to output_path (Parquet if it ends in .parquet, otherwise CSV)
+    Returns the number of rows scored
+    '''
+    writer = None
+    rows   = 0
+    processes = processes or os.cpu_count()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+                                                initializer=_set_table,
+                                                initargs=(table,)) as executor:
+
+        # Keep a few chunks in flight per process, so that reading does not outrun scoring
+        in_flight = []
+        max_in_flight = 2*processes
+
+        def write(chunk, future):
+            nonlocal writer, rows
+            output = predictions(table, chunk, future.result())
+
+            if str(output_path).endswith('.parquet'):
+                import pyarrow, pyarrow.parquet
+                output = pyarrow.Table.from_pandas(output, preserve_index=False)
+                if writer is None: writer = pyarrow.parquet.ParquetWriter(output_path, output.schema)
+                writer.write_table(output)
+            else:
+                output.to_csv(output_path, mode='w' if rows==0 else 'a', header=(rows==0), index=False)
+
+            rows += len(chunk)
+
+        try:
+            for chunk in read_chunks(input_path, chunksize):
+                in_flight.append((chunk, executor.submit(_score, feature_matrix(table, chunk))))
+                if len(in_flight)>=max_in_flight:
+                    write(*in_flight.pop(0))
+
+            for chunk, future in in_flight:
+                write(chunk, future)
+
+        finally:
+            if writer is not None: writer.close()
+
+    return rows
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description='Predict antibiotic susceptibility for a file of patients')
+    parser.add_argument('input',  help='CSV or Parquet file of regression inputs, one row per patient')
+    parser.add_argument('output', help='CSV or Parquet file to write predictions to')
+    parser.add_argument('--chunksize', type=int, default=50000, help='rows scored at a time (default 50000)')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+    arguments = parser.parse_args(arguments)
+
+    table = scorer.export(model_registry.load(model_registry.available()))
+
+    start = time.perf_counter()
+    rows = score_file(arguments.input, arguments.output, table,
+                      chunksize=arguments.chunksize, processes=arguments.processes)
+    seconds = time.perf_counter()-start
+
+    print('Scored {} rows with {} models in {:.2f} s ({:,.0f} rows/second)'.format(
+        rows, len(table['keys']), seconds, rows/seconds if seconds else float('nan')))
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+##################################
+#                                #
+# encoding.py                    #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Converts the values of the shiny form into the regression inputs of the models
+
+The features of every antibiotic model are put into one dict, since models share
+most of their inputs (e.g. Age) and the rest have different names for each
+antibiotic (e.g. PriorCarbapenem, MeropenemResistance_susceptible).
+'''
+
+
+antibiotic_classes = {'Cefazolin':'Cephalosporin','Ceftriaxone':'Cephalosporin','Ceftazidime':'Cephalosporin',
+                      'Piptaz':'Penicillin','Meropenem':'Carbapenem','Ciprofloxacin':'FQ','Tobramycin':'AMG',
+                      'TMPSMX':'OtherAbx','Piptaz_or_Tobramycin':'Penicillin_or_AMG'
+                     }
+
+# Age used by the models for each age category of the form
+age_values = {'<40'  :30,
+              '40-44':42.5,
+              '45-49':47.5,
+              '50-54':52.5,
+              '55-59':57.5,
+              '60-64':62.5,
+              '65-69':67.5,
+              '70-74':72.5,
+              '75-79':77.5,
+              '80-84':82.5,
+              '85-89':87.5,
+              '>90'  :95
+             }
+
+# Form inputs that do not depend on the antibiotics shown
+form_inputs = ['Hospital','Age','SexCat','Acquisition','MedVsSurgAdmission',
+               'RecentHospitalization','ClinicalESBL',
+               'PriorPenicillin','PriorCephalosporin','PriorCarbapenem',
+               'PriorFQ','PriorAMG','PriorOtherAbx']
+
+
+def resistance_inputs(antibiotic_list):
+    '''
+    Returns the ids of the prior resistance inputs used for a list of antibiotics
+    '''
+    inputs = []
+    for antibiotic in antibiotic_list:
+        if antibiotic=='Piptaz_or_Tobramycin': antibiotics = ['Piptaz','Tobramycin']
+        else:                                  antibiotics = [antibiotic]
+        for i in antibiotics:
+            if 'Prior'+i+'Resistance' not in inputs: inputs.append('Prior'+i+'Resistance')
+
+    return inputs
+
+
+def form_values(input, antibiotic_list):
+    '''
+    Takes shiny input values
+    Returns a dict of input id: value, for the inputs used by patient_features()
+    '''
+    return {i:input[i]() for i in form_inputs+resistance_inputs(antibiotic_list)}
+
+
+def patient_features(values, antibiotic_list):
+    '''
+    Takes a dict of form values, as given by form_values()
+    Returns a dict of regression input: value for the models of every antibiotic in antibiotic_list
+        Inputs that are not set are 0
+    '''
+    features = {}
+
+    if   values['Acquisition']=='Hospital non-ICU': features['acquisition_ward'] = 1
+    elif values['Acquisition']=='ICU':              features['acquisition_ICU']  = 1
+
+    features['Age'] = age_values[values['Age']]
+
+    if values['SexCat']=='Male':                features['sex_M'] = 1
+    if values['MedVsSurgAdmission']=='Surgical': features['adm_service_surgical'] = 1
+
+    features['RecentHospitalization'] = float(values['RecentHospitalization'])
+    features['ClinicalESBL']          = float(values['ClinicalESBL'])
+
+    for antibiotic in antibiotic_list:
+
+        # Special handling for combined piperacillin-tazobactam and tobramycin
+        if antibiotic=='Piptaz_or_Tobramycin':
+
+            # Prior class exposure
+            if int(values['PriorPenicillin'])==1 or int(values['PriorAMG'])==1:
+                features['PriorPenicillin_or_AMG'] = 1
+            else: features['PriorPenicillin_or_AMG'] = 0
+
+            # Prior non-class exposure
+            if (int(values['PriorCephalosporin'])==1
+             or int(values['PriorCarbapenem'])==1
+             or int(values['PriorFQ'])==1
+             or int(values['PriorAMG'])==1
+             or int(values['PriorOtherAbx'])==1):
+                features['PriorNonPenicillin_or_AMG'] = 1
+            else: features['PriorNonPenicillin_or_AMG'] = 0
+
+            # Prior resistance
+            piptaz     = int(values['PriorPiptazResistance'])
+            tobramycin = int(values['PriorTobramycinResistance'])
+            if   (piptaz==0 and tobramycin==0):
+                pass
+            elif (piptaz==0 or  tobramycin==0):
+                features['Piptaz_or_TobramycinResistance_susceptible'] = 1
+            elif (piptaz==1 or  tobramycin==1):
+                features['Piptaz_or_TobramycinResistance_susceptible'] = 1
+            elif (piptaz==2 and tobramycin==2):
+                features['Piptaz_or_TobramycinResistance_nonsusceptible'] = 1
+
+            else: raise ValueError('Something went wrong with combined pip-tazo/tobra susceptibility')
+
+        # Handling all other antibiotics
+        else:
+            antibiotic_class = antibiotic_classes[antibiotic]
+
+            # Prior class exposure
+            features['Prior'+antibiotic_class] = int(values['Prior'+antibiotic_class])
+
+            # Prior non-class exposure: 1 if there was exposure to any other class
+            # (Penicillin_or_AMG has no input of its own)
+            prior_nonclasses = set(i for i in antibiotic_classes.values()
+                                   if i not in (antibiotic_class,'Penicillin_or_AMG'))
+            if any(int(values['Prior'+abx_class])>=1 for abx_class in prior_nonclasses):
+                features['PriorNon'+antibiotic_class] = 1
+            else: features['PriorNon'+antibiotic_class] = 0
+
+            # Prior antibiotic resistance
+            if   int(values['Prior'+antibiotic+'Resistance'])==1: features[antibiotic+'Resistance_susceptible']    = 1
+            elif int(values['Prior'+antibiotic+'Resistance'])==2: features[antibiotic+'Resistance_nonsusceptible'] = 1
+
+    return features
@@ -0,0 +1,104 @@
+##################################
+#                                #
+# lookup.py                      #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Precomputed susceptibilities for every combination of form inputs
+
+Each model has 11 inputs, and the form only lets each of them take a few values:
+one of 12 ages, and 0 or 1 for the rest. So every model is scored once for each
+combination of its inputs (12 x 2^10 = 12,288 rows), when the models are loaded.
+A prediction is then an index calculation and an array lookup per model.
+Inputs with a value the form cannot produce are scored with scorer.py instead, as are
+all inputs until the table is built (which takes a few hundred milliseconds, so a newly
+started app can build it in the background, see shiny_core_regression.py).
+'''
+
+import itertools
+
+import numpy as np
+
+import encoding
+import scorer
+
+
+def feature_levels(name):
+    '''
+    Returns the values that a regression input can take in the form
+    '''
+    if name=='Age': return sorted(set(float(i) for i in encoding.age_values.values()))
+    else:           return [0.,1.]
+
+
+def build(table):
+    '''
+    Takes a table of model coefficients from scorer.export
+    Returns the same table with the precomputed susceptibilities added:
+        levels:           values of each input in table['features'], one row per input (padded with NaN)
+        strides:          step in each model's rows (columns) for each input (rows), 0 for inputs a model does not use
+        offsets:          first row of each model in susceptibilities
+        susceptibilities: probability of susceptibility for every combination of each model's inputs
+    '''
+    levels = [feature_levels(name) for name in table['features']]
+
+    strides = np.zeros((len(levels)+1,len(table['keys'])), dtype=np.intp)
+    offsets = np.zeros(len(table['keys']), dtype=np.intp)
+    susceptibilities = []
+    size = 0
+
+    for row in range(len(table['keys'])):
+
+        # Padding inputs (index past the last feature) are always 0, and have a single level
+        index = table['feature_index'][row]
+        model_levels = [levels[i] if i<len(levels) else [0.] for i in index]
+
+        # Row-major strides: the last input changes fastest, as in itertools.product
+        counts = [len(i) for i in model_levels]
+        strides[index,row] = [int(np.prod(counts[i+1:])) for i in range(len(counts))]
+        offsets[row] = size
+
+        # Stacked (1 x inputs) @ (inputs x 1) products give the same result as scoring one patient
+        grid = np.array(list(itertools.product(*model_levels)))
+        decision = (grid[:,None,:] @ table['coefficients'][row][:,None])[:,0,0] + table['intercepts'][row]
+        susceptibilities.append(1-scorer.expit(decision))
+        size += len(grid)
+
+    table = dict(table)
+    table['levels']  = np.full((len(levels),max(len(i) for i in levels)), np.nan)
+    for i, values in enumerate(levels):
+        table['levels'][i,:len(values)] = values
+    table['strides'] = strides[:-1]
+    table['offsets'] = offsets
+    table['susceptibilities'] = np.concatenate(susceptibilities)
+
+    return table
+
+
+def positions(table, x):
+    '''
+    Takes a feature vector
+    Returns the position of each input among its levels, or None if any value is off the grid
+    '''
+    # Levels of an input are distinct, so each input matches once at most
+    inputs, position = np.nonzero(table['levels']==np.asarray(x, dtype=float)[:,None])
+    if len(inputs)<len(x): return None
+
+    return position
+
+
+def susceptibility(table, x):
+    '''
+    Takes a table from build() (or from scorer.export, before build() has run) and a feature vector
+    Returns the probability of susceptibility for every model, from the precomputed table where possible
+    '''
+    if 'susceptibilities' not in table: return scorer.susceptibility(table, x)
+
+    position = positions(table, x)
+    if position is None: return scorer.susceptibility(table, x)
+
+    index = table['offsets'] + position@table['strides']
+
+    return table['susceptibilities'][index]
@@ -0,0 +1,167 @@
+##################################
+#                                #
+# model_registry.py              #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+In-memory cache of the regression models used by shiny_core_regression.py
+
+Every model is loaded once per process and kept by (antibiotic, hospital), so predictions
+do not touch the disk. A model is two files written by amr/artifact.py:
+    <Antibiotic>_<Hospital>.json: format version, feature names, training window, metrics,
+                                  and the SHA-256 of the parameter array
+    <Antibiotic>_<Hospital>.npy:  [intercept, coefficients...] as float64
+Loading runs no code from the files and does not import scikit-learn, so it takes
+milliseconds and does not depend on the version of scikit-learn the models were fitted with.
+refresh() reloads a model only when its JSON file changes, so a retrained model
+can be dropped into the folder while the app is running.
+'''
+
+import io
+import os
+import json
+import hashlib
+
+import numpy as np
+
+
+model_directory = os.path.dirname(os.path.abspath(__file__))
+
+hospital_list = ['Sunnybrook','TOH','Trillium']
+
+# Model files this version of the app can read
+format_name    = 'amr-logistic-regression'
+format_version = 1
+
+# (antibiotic, hospital): model, a dict of the JSON file's contents plus
+#     intercept:    float
+#     coefficients: array of the coefficients of model['features']
+models = {}
+
+# (antibiotic, hospital): (modification time, size, SHA-256) of the JSON file that was loaded
+_loaded = {}
+
+
+def model_path(antibiotic, hospital):
+    return os.path.join(model_directory, antibiotic+'_'+hospital+'.json')
+
+
+def available(hospitals=hospital_list):
+    '''
+    Returns the antibiotics that have a model for every hospital, in alphabetical order
+    '''
+    filenames = os.listdir(model_directory)
+    antibiotics = set(i[:-len('_'+hospitals[0]+'.json')] for i in filenames
+                      if i.endswith('_'+hospitals[0]+'.json'))
+
+    return sorted(i for i in antibiotics
+                  if all(i+'_'+hospital+'.json' in filenames for hospital in hospitals))
+
+
+def signatures():
+    '''
+    Returns the modification time and size of the JSON file of every model
+    Cheap enough to poll; only changes when a model is replaced
+        (its parameter array is written first, and the JSON file holds the array's hash)
+    '''
+    signature = []
+    for antibiotic, hospital in sorted(models):
+        try:
+            status = os.stat(model_path(antibiotic, hospital))
+            signature.append((antibiotic, hospital, status.st_mtime_ns, status.st_size))
+        except FileNotFoundError:
+            signature.append((antibiotic, hospital, None, None))
+
+    return tuple(signature)
+
+
+def read(path, contents=None):
+    '''
+    Reads a model's JSON file (or takes its contents, as bytes) and its parameter array
+    Raises ValueError if the file is of another format or version, or the array does not match it
+    Returns the model (see models)
+    '''
+    if contents is None:
+        with open(path,'rb') as f:
+            contents = f.read()
+    model = json.loads(contents)
+
+    if model.get('format')!=format_name or model.get('version')!=format_version:
+        raise ValueError('{} is not a model file this app can read (format {!r}, version {!r})'.format(
+                         path, model.get('format'), model.get('version')))
+
+    with open(os.path.join(os.path.dirname(path), model['parameters']['file']),'rb') as f:
+        array = f.read()
+    if hashlib.sha256(array).hexdigest()!=model['parameters']['sha256']:
+        raise ValueError('The parameter array of {} does not match it'.format(path))
+
+    parameters = np.load(io.BytesIO(array), allow_pickle=False)
+    if parameters.shape!=(len(model['features'])+1,):
+        raise ValueError('The parameter array of {} has shape {}, for {} features'.format(
+                         path, parameters.shape, len(model['features'])))
+
+    model['intercept']    = float(parameters[0])
+    model['coefficients'] = parameters[1:].astype(float)
+    return model
+
+
+def _load(antibiotic, hospital):
+    '''
+    Loads a model if its JSON file differs from the model in memory
+    Returns True if the model was (re)loaded
+    '''
+    path = model_path(antibiotic, hospital)
+    status = os.stat(path)
+    key = (antibiotic, hospital)
+
+    if key in _loaded and _loaded[key][:2]==(status.st_mtime_ns, status.st_size):
+        return False
+
+    with open(path,'rb') as f:
+        contents = f.read()
+    digest = hashlib.sha256(contents).hexdigest()
+
+    if key in _loaded and _loaded[key][2]==digest:
+        _loaded[key] = (status.st_mtime_ns, status.st_size, digest)
+        return False
+
+    models[key]  = read(path, contents)
+    _loaded[key] = (status.st_mtime_ns, status.st_size, digest)
+    return True
+
+
+def load(antibiotic_list, hospitals=hospital_list):
+    '''
+    Loads the models for every antibiotic and hospital
+    Returns the models dict
+    '''
+    for hospital in hospitals:
+        for antibiotic in antibiotic_list:
+            _load(antibiotic, hospital)
+
+    return models
+
+
+def refresh():
+    '''
+    Reloads any loaded model whose JSON file has changed
+    A model that is missing or unreadable (e.g. its new array is copied, but not yet its JSON file)
+        keeps its current model, and is tried again on the next refresh
+    Returns the models dict
+    '''
+    for antibiotic, hospital in list(models):
+        try:
+            _load(antibiotic, hospital)
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+    return models
+
+
+def get(antibiotic, hospital):
+    '''
+    Returns the cached model for an antibiotic and hospital
+    '''
+    return models[(antibiotic, hospital)]
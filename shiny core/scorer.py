@@ -0,0 +1,105 @@
+##################################
+#                                #
+# scorer.py                      #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Scores the logistic regression models from their coefficients alone
+
+A fitted LogisticRegression is a dot product and a sigmoid, so the coefficients,
+intercepts and feature names of every model (from model_registry.py) are put into arrays once, and all
+models are then scored together with NumPy. For one patient, results are bit-for-bit
+identical to predict_proba: each model's inputs are multiplied in the same order as
+scikit-learn, and the sigmoid uses the C library exp, like scipy.special.expit.
+For many patients at once, results can differ from predict_proba in the last
+digit (about 1e-16), as predict_proba itself does between batch sizes.
+'''
+
+import math
+
+import numpy as np
+
+
+def export(models):
+    '''
+    Takes a dict of (antibiotic, hospital): model from model_registry (features, classes, intercept, coefficients)
+    Returns a table (dict) of NumPy arrays:
+        keys:          (antibiotic, hospital) of each model, in the order of the rows below
+        features:      every regression input used by any model
+        feature_index: position in features of each model's inputs, in the model's own order
+        coefficients:  coefficients of each model's inputs
+        intercepts:    intercept of each model
+    '''
+    keys = list(models)
+
+    features = []
+    for key in keys:
+        for name in models[key]['features']:
+            if name not in features: features.append(name)
+
+    # Models with fewer inputs are padded with a zero coefficient on an extra input that is always 0
+    width = max(len(models[key]['features']) for key in keys)
+    feature_index = np.full((len(keys),width), len(features), dtype=np.intp)
+    coefficients  = np.zeros((len(keys),width))
+    intercepts    = np.zeros(len(keys))
+
+    for row, key in enumerate(keys):
+        model = models[key]
+        if list(model['classes'])!=[0,1]:
+            raise ValueError('Model {} should have classes [0, 1] (susceptible, resistant)'.format(key))
+
+        names = model['features']
+        feature_index[row,:len(names)] = [features.index(name) for name in names]
+        coefficients [row,:len(names)] = model['coefficients']
+        intercepts[row] = model['intercept']
+
+    return {'keys':          keys,
+            'features':      features,
+            'feature_index': feature_index,
+            'coefficients':  coefficients,
+            'intercepts':    intercepts}
+
+
+def feature_vector(table, features):
+    '''
+    Takes a dict of regression input: value (e.g. from encoding.patient_features)
+    Returns an array of the inputs in the order of table['features'], with 0 for inputs not given
+    '''
+    return np.array([features.get(name,0) for name in table['features']], dtype=float)
+
+
+_exp = np.frompyfunc(math.exp, 1, 1)
+
+def expit(x):
+    '''
+    Logistic sigmoid, using the C library exp so that results match scipy.special.expit exactly
+    '''
+    return 1/(1+_exp(-x).astype(float))
+
+
+def decision_function(table, x):
+    '''
+    Takes a feature vector, or a 2D array with one feature vector per row
+    Returns the log-odds of resistance for every model (the last axis follows table['keys'])
+    '''
+    x = np.asarray(x, dtype=float)
+    rows = np.atleast_2d(x)
+
+    # The extra column of zeros is the padding input
+    rows = np.concatenate([rows, np.zeros((len(rows),1))], axis=1)
+
+    # Stacked (1 x inputs) @ (inputs x 1) products multiply in the same order as scikit-learn
+    inputs   = rows[:,table['feature_index']][:,:,None,:]
+    decision = (inputs @ table['coefficients'][None,:,:,None])[:,:,0,0] + table['intercepts']
+
+    return decision[0] if x.ndim==1 else decision
+
+
+def susceptibility(table, x):
+    '''
+    Takes a feature vector, or a 2D array with one feature vector per row
+    Returns the probability of susceptibility (predict_proba(...)[:,0]) for every model
+    '''
+    return 1-expit(decision_function(table, x))
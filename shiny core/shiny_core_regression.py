@@ -6,13 +6,37 @@
 #                                #
 ##################################
 
+# Startup:
+#     pandas takes most of a second to import, and is only imported by the outputs that use
+#     it. Set AMR_FAST_START=1 to start serving as soon as the models are loaded (a few hundred
+#     milliseconds), with the precomputed predictions (lookup.py) built and pandas imported
+#     in a background thread. Until the predictions are built, the models are scored
+#     directly, with the same results.
+#     Without AMR_FAST_START, all of this is done before the app starts serving.
+
+import time
+_import_start = time.perf_counter()
+
+import os
+import threading
 
 from shiny import App, reactive, render, ui
-import pickle
-import warnings
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Mount, Route
+
+import model_registry
+import encoding
+import scorer
+import lookup
+import timing
+import bar_chart
+import api
+
+timing.record('startup', time.perf_counter()-_import_start, step='import')
+
+fast_start = bool(os.environ.get('AMR_FAST_START'))
 
 
 # Common variables used throughout
@@ -32,11 +56,6 @@ antibiotic_dict = {'Pencillins':     {'Piptaz':'Piperacillin-tazobactam'},
                    'Combinations':   {'Piptaz_or_Tobramycin':'Piperacillin-tazobactam and tobramycin'}
                   }
 
-antibiotic_classes = {'Cefazolin':'Cephalosporin','Ceftriaxone':'Cephalosporin','Ceftazidime':'Cephalosporin',
-                      'Piptaz':'Penicillin','Meropenem':'Carbapenem','Ciprofloxacin':'FQ','Tobramycin':'AMG',
-                      'TMPSMX':'OtherAbx','Piptaz_or_Tobramycin':'Penicillin_or_AMG'
-                     }
-
 age_categories = ['<40',  '40-44','45-49','50-54','55-59', 
                   '60-64','65-69','70-74','75-79','80-84',
                   '85-89','>90'
@@ -44,135 +63,133 @@ age_categories = ['<40',  '40-44','45-49','50-54','55-59',
                  
 prior_resistance_history = {0:'No isolate or unknown',1:'Susceptible',2:'Nonsusceptible'}  
 
+# Load every antibiotic and hospital model once, when the app starts
+with timing.span('model_load'):
+    model_registry.load(antibiotic_list)
 
-def susceptibility_outputs_f(input):
+# Seconds between checks of the model files for replaced models
+model_poll_seconds = 10
+
+# Scoring table of the loaded models, shared by every session
+# {model signatures: table}, rebuilt only when a model changes
+_scoring_table = {}
+_scoring_table_lock = threading.Lock()
+
+def add_lookup(table):
     '''
-    Function that takes in shiny input values and a particular antibiotic
-        (or combination piperacillin-tazobactam and tobramycin)
-    Returns a Pandas DataFrame containing susceptibility outputs
+    Adds the precomputed predictions of lookup.build to a scoring table, in place,
+        so that sessions already holding the table use them from then on
     '''
-    susceptibility_outputs = []
+    with timing.span('lookup_build'):
+        built = lookup.build(table)
+
+    # lookup.susceptibility only uses the precomputed predictions once they are added, so they go last
+    for key in ['levels','strides','offsets','susceptibilities']:
+        table[key] = built[key]
+
+
+def scoring_table(signature):
+    '''
+    Takes the signatures of the model files (from model_registry.signatures)
+    Returns the coefficients and precomputed predictions of every antibiotic and hospital model
+        (with fast_start, the predictions are added to the table in a background thread)
+    '''
+    with _scoring_table_lock:
+        if signature not in _scoring_table:
+            _scoring_table.clear()
+            with timing.span('model_refresh'):
+                models = model_registry.refresh()
+            table = _scoring_table[signature] = scorer.export(models)
+
+            if fast_start: threading.Thread(target=add_lookup, args=(table,), daemon=True).start()
+            else:          add_lookup(table)
+
+        return _scoring_table[signature]
+
+
+# Scoring table of the API, and when the model files were last checked for it
+_api_table   = None
+_api_checked = float('-inf')
+
+def api_scoring_table():
+    '''
+    Returns the scoring table of the loaded models, checking the model files at most
+        every model_poll_seconds (as sessions do), rather than for every request
+    '''
+    global _api_table, _api_checked
+
+    if time.monotonic()-_api_checked>=model_poll_seconds:
+        _api_table   = scoring_table(model_registry.signatures())
+        _api_checked = time.monotonic()
+
+    return _api_table
+
 
+def import_outputs():
+    '''
+    Imports the libraries that only the outputs use
+    '''
+    with timing.span('startup', step='import_outputs'):
+        import pandas
+
+
+def model_susceptibilities(values, table):
+    '''
+    Takes form values (from encoding.form_values) and the table of model coefficients and
+        precomputed predictions (from lookup.build)
+    Returns the probability of susceptibility of every model, in the order of table['keys']
+    '''
+    # Regression inputs of every antibiotic's model, looked up in one go for every hospital
+    with timing.span('encode_features'):
+        features = encoding.patient_features(values, antibiotic_list)
+    with timing.span('lookup'):
+        return lookup.susceptibility(table, scorer.feature_vector(table, features))
+
+
+def susceptibility_predictions(values, table, hospitals=None):
+    '''
+    Takes form values (from encoding.form_values) and the table of model coefficients and
+        precomputed predictions (from lookup.build)
+    Returns a list of [antibiotic, susceptibility (%) at each hospital], without pandas,
+        for the selected hospital or every hospital in hospitals
+    '''
+    if hospitals is None: hospitals = [values['Hospital']]
+
+    susceptibilities = model_susceptibilities(values, table)
+
+    susceptibility_outputs = []
     for antibiotic in antibiotic_list:
+        rows = [table['keys'].index((antibiotic,hospital)) for hospital in hospitals]
+        susceptibility_outputs.append([antibiotic]+[susceptibilities[row]*100 for row in rows])
 
-        # Create a DataFrame of regression inputs that are all zeros
-        regression_inputs = ['Age','sex_M',
-                             
-                             'acquisition_ICU','acquisition_ward',
-                             'adm_service_surgical','RecentHospitalization',
-                             
-                             'Prior'+antibiotic_classes[antibiotic],
-                             'PriorNon'+antibiotic_classes[antibiotic],
-                              antibiotic+'Resistance_susceptible',antibiotic+'Resistance_nonsusceptible',
-                             
-                             'ClinicalESBL']        
-                             
-        df = pd.DataFrame(np.zeros(shape=(1,len(regression_inputs))),columns=regression_inputs)
+    return susceptibility_outputs
 
-        # Start populating the DataFrame
-        
-        if input.Acquisition()=='Hospital non-ICU':
-            df['acquisition_ward'] = 1
-        elif input.Acquisition()=='ICU':
-            df['acquisition_ICU'] = 1
-        
-        warnings.simplefilter(action='ignore', category=UserWarning)
-        # A match-case structure may be better here
-        if   input.Age()=='<40'  : df['Age'] = 30
-        elif input.Age()=='40-44': df['Age'] = 42.5
-        elif input.Age()=='45-49': df['Age'] = 47.5
-        elif input.Age()=='50-54': df['Age'] = 52.5
-        elif input.Age()=='55-59': df['Age'] = 57.5
-        elif input.Age()=='60-64': df['Age'] = 62.5
-        elif input.Age()=='65-69': df['Age'] = 67.5
-        elif input.Age()=='70-74': df['Age'] = 72.5
-        elif input.Age()=='75-79': df['Age'] = 77.5
-        elif input.Age()=='80-84': df['Age'] = 82.5
-        elif input.Age()=='85-89': df['Age'] = 87.5
-        elif input.Age()=='>90'  : df['Age'] = 95
-        
-        if input.SexCat()=='Male': df['sex_M'] = 1
-        if input.MedVsSurgAdmission()=='Surgical': df['adm_service_surgical'] = 1
-        
-        df['RecentHospitalization'] = input.RecentHospitalization()
-        df['ClinicalESBL']          = input.ClinicalESBL()
-        
-                             
-        # Handling prior exposure and resistance history
-        
-        # Special handling for combined piperacillin-tazobactam and tobramycin
-        if antibiotic=='Piptaz_or_Tobramycin':
-        
-            # Prior class exposure
-            if int(input.PriorPenicillin())==1 or int(input.PriorAMG())==1:
-                df['PriorPenicillin_or_AMG'] = 1
-            else: df['PriorPenicillin_or_AMG'] = 0
-            
-            # Prior non-class exposure
-            if (int(input.PriorCephalosporin())==1 
-             or int(input.PriorCarbapenem())==1
-             or int(input.PriorFQ())==1
-             or int(input.PriorAMG())==1
-             or int(input.PriorOtherAbx())==1):
-                df['PriorNonPenicillin_or_AMG'] = 1
-            else: df['PriorNonPenicillin_or_AMG'] = 0
-            
-            # Prior resistance
-            if   (int(input.PriorPiptazResistance())==0 and int(input.PriorTobramycinResistance())==0):
-                pass
-            elif (int(input.PriorPiptazResistance())==0 or  int(input.PriorTobramycinResistance())==0):
-                df['Piptaz_or_TobramycinResistance_susceptible'] = 1
-            elif (int(input.PriorPiptazResistance())==1 or  int(input.PriorTobramycinResistance())==1):
-                df['Piptaz_or_TobramycinResistance_susceptible'] = 1                
-            elif (int(input.PriorPiptazResistance())==2 and int(input.PriorTobramycinResistance())==2):
-                df['Piptaz_or_TobramycinResistance_nonsusceptible'] = 1
-                
-            else: raise ValueError('Something went wrong with combined pip-tazo/tobra susceptibility')
-            
-        # Handling all other antibiotics
-        else:
-            
-            # Prior class exposure
-            df['Prior'+antibiotic_classes[antibiotic]] = int(input['Prior'+antibiotic_classes[antibiotic]]())
-            
-            
-            # Prior non-class exposure
-            # Remove the antibiotic class from the set of antibiotic classes to check
-            prior_nonclasses = set(i for i in antibiotic_classes.values() if i!=antibiotic_classes[antibiotic])
-            
-            # Remove Penicillin_or_AMG from the set of antibiotic classes as we do not have input for it
-            # (it was handled separately)
-            prior_nonclasses.remove('Penicillin_or_AMG')
-           
-            # If any of the prior exposures in the set is 1, the resulting value is 1
-            # Sum the number of non-class antibiotic exposures
-            i = 0
-            for abx_class in prior_nonclasses: 
-                 i+=int(input['Prior'+abx_class]())
-            if   i==0: df['PriorNon'+antibiotic_classes[antibiotic]] = 0
-            elif i>=1: df['PriorNon'+antibiotic_classes[antibiotic]] = 1
-            else: raise ValueError('The number of prior non class exposures is not zero or a positive integer')
-            
-            
-            # Prior antibiotic resistance
-            if int(input['Prior'+antibiotic+'Resistance']())==1:
-                df[antibiotic+'Resistance_susceptible'] = 1
-            elif int(input['Prior'+antibiotic+'Resistance']())==2:
-                df[antibiotic+'Resistance_nonsusceptible'] = 1
-        
-        with open(antibiotic+'_'+input.Hospital()+'.pickle','rb') as f:
-            reg = pickle.load(f)
-                
-        susceptibility_outputs.append((antibiotic,reg.predict_proba(df)[0][0]*100))
-    
-    # Convert to a pandas dataframe and add column names
-    df = pd.DataFrame(susceptibility_outputs)
-    df = df.rename(columns={0:'Antibiotic',1:'Predicted susceptibility (%)'})
 
-    # Rename certain antibiotics
-    df = df.replace('Piptaz_or_Tobramycin','PipTazo+Tobramycin')
-    df = df.replace('Piptaz','PipTazo')    
-        
+def susceptibility_outputs_f(values, table, hospitals=None):
+    '''
+    Function that takes in form values (from encoding.form_values) and the table of model
+        coefficients and precomputed predictions (from lookup.build), and predicts susceptibility to each antibiotic
+        (or combination piperacillin-tazobactam and tobramycin) at the selected hospital,
+        or at every hospital in hospitals
+    Returns a Pandas DataFrame containing susceptibility outputs, with one column per hospital
+        when comparing hospitals
+    '''
+    if hospitals is None: hospitals = [values['Hospital']]
+
+    susceptibility_outputs = susceptibility_predictions(values, table, hospitals)
+
+    with timing.span('dataframe'):
+        import pandas as pd
+
+        # Convert to a pandas dataframe and add column names
+        df = pd.DataFrame(susceptibility_outputs)
+        if len(hospitals)==1: df.columns = ['Antibiotic','Predicted susceptibility (%)']
+        else:                 df.columns = ['Antibiotic']+[hospital+' (%)' for hospital in hospitals]
+
+        # Rename certain antibiotics
+        df = df.replace('Piptaz_or_Tobramycin','PipTazo+Tobramycin')
+        df = df.replace('Piptaz','PipTazo')
+
     return df
     
     
@@ -186,7 +203,8 @@ app_ui = ui.page_fluid(
             
             ui.card(
                 ui.input_radio_buttons('Hospital','Hospital:',
-                                      ['Sunnybrook','TOH','Trillium'],inline=True)
+                                      ['Sunnybrook','TOH','Trillium'],inline=True),
+                ui.input_checkbox('CompareSites','Compare all sites',False)
             ),
             
             ui.card(
@@ -270,7 +288,7 @@ app_ui = ui.page_fluid(
                         ui.input_radio_buttons('Severity','Clinical severity (affects 80 vs 90% cutoff):',{80:'qSOFA<=2',90:'qSOFA=3 or vasopressor support'},inline=True),
                     ),
                     
-                    ui.output_plot('plot'),
+                    ui.output_ui('plot'),
                     
                     open='open' # Keep sidebar open by default
                 ),
@@ -288,12 +306,28 @@ app_ui = ui.page_fluid(
 
 def server(input, output, session):
     
+    # Reload a model when its file is replaced, which also reruns the outputs below
+    # Returns the coefficients of every model, for scoring without scikit-learn,
+    # and every model's prediction for every combination of form inputs
+    @reactive.poll(model_registry.signatures, model_poll_seconds)
+    def models():
+        return scoring_table(model_registry.signatures())
+    
+    # Predictions shared by the table and the plot, for the selected hospital or every hospital
+    # Only recomputed when an input used by the models changes (not Severity)
+    @reactive.Calc
+    @timing.timed('calc', calc='susceptibility_outputs')
+    def susceptibility_outputs():
+        if input.CompareSites(): hospitals = model_registry.hospital_list
+        else:                    hospitals = [input.Hospital()]
+        return susceptibility_outputs_f(encoding.form_values(input, antibiotic_list), models(), hospitals)
+    
     @output
     @render.data_frame
-
+    @timing.timed('output', output='predicted_susceptibilities')
     def predicted_susceptibilities():
         
-        df = susceptibility_outputs_f(input)
+        df = susceptibility_outputs().copy()
         
         # Add colons after each antibiotic
         df['Antibiotic'] = df['Antibiotic'] + ':'
@@ -301,50 +335,28 @@ def server(input, output, session):
         # Round numbers to n digits before outputting
         return(df.round(0))
     
-    @output
-    @render.plot
+    # Bar chart of the predictions, drawn as SVG by bar_chart.py, with a cutoff line set by Severity
+    # Charts are cached by their values, so changing the severity back and forth draws nothing new
+    @reactive.Calc
+    @timing.timed('calc', calc='bar_chart_data')
+    def bar_chart_data():
+        return bar_chart.data(susceptibility_outputs())
     
+    @output
+    @render.ui
+    @timing.timed('output', output='plot')
     def plot():
-        
-        df = susceptibility_outputs_f(input)
-
-        # Create a plot       
-        fig, ax = plt.subplots()
-        ax.clear()
-        
-        # Format the plot
-        ax.set_xlabel('Antibiotic')
-        ax.set_ylabel('Susceptibility (%)')
-        ax.set_ylim(0,100)
-        ax.tick_params('x',rotation = 80)
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        
-        # x = [i[0] for i in susceptibility_outputs]
-        # y = [i[1]*100 for i in susceptibility_outputs]
-        x = df['Antibiotic']
-        y = df['Predicted susceptibility (%)']
-        
-        # Plot points
-        bars = ax.bar(x,y)
-        ax.bar_label(bars,fmt='')        
-        ax.bar_label(bars,fmt='%d')
-        
-        # Plot an 80% or 90% horizontal line based on clinical severity
-        cutoff = int(input.Severity())
-        plt.axhline(y=cutoff,color='orange',label='{}%'.format(cutoff))
-        
-        ax.legend()
-        
-        return fig
+        return ui.HTML(bar_chart.svg(*bar_chart_data(), int(input.Severity())))
 
     
     # Code to display input values
     @output
     @render.data_frame
+    @timing.timed('output', output='input_values')
     def input_values():
+        import pandas as pd
         
-        df = pd.DataFrame(data=[input.Hospital(),
+        df = pd.DataFrame(data=['All sites' if input.CompareSites() else input.Hospital(),
                                 input.Age(),
                                 input.SexCat(),
                                 input.Acquisition(),
@@ -414,3 +426,47 @@ def server(input, output, session):
  
 app = App(app_ui, server)
 
+# Build the scoring table and import the outputs' libraries now, or in the background with fast_start
+scoring_table(model_registry.signatures())
+if fast_start: threading.Thread(target=import_outputs, daemon=True).start()
+else:          import_outputs()
+
+timing.record('startup', time.perf_counter()-_import_start, step='ready')
+
+# Predictions for other programs, as JSON (see api.py)
+def api_predictions(body):
+    '''
+    Takes the body of a request to /api/predict
+    Returns the predictions for its patients, or an error, and the status code of the response
+    '''
+    try:
+        patients, batch = api.patients(body, antibiotic_list)
+    except ValueError as error:
+        return {'error':str(error)}, 400
+
+    table = api_scoring_table()
+    predictions = []
+    for values, compare_sites in patients:
+        hospitals = model_registry.hospital_list if compare_sites else [values['Hospital']]
+        predictions.append(api.prediction(table, model_susceptibilities(values, table), hospitals))
+
+    return (predictions if batch else predictions[0]), 200
+
+
+async def predict(request):
+    with timing.span('api', route='predict'):
+        body = await request.body()
+        result, status = await run_in_threadpool(api_predictions, body)
+        return JSONResponse(result, status_code=status)
+
+routes = [Route('/api/predict', predict, methods=['POST'])]
+
+# With timing on, the latency histograms of timing.py are served at /metrics
+if timing.enabled:
+    def metrics(request):
+        return PlainTextResponse(timing.prometheus_text(), media_type='text/plain; version=0.0.4')
+
+    routes.append(Route('/metrics', metrics))
+
+app = Starlette(routes=routes+[Mount('/', app=app)])
+
@@ -0,0 +1,167 @@
+##################################
+#                                #
+# timing.py                      #
+# Created 2026-10-18             #
+#                                #
+##################################
+
+'''
+Timing spans for shiny_core_regression.py
+
+Shows whether a slow response comes from loading the models, building the lookup table,
+encoding the form, looking up predictions, building the DataFrames or drawing the plot.
+
+Timing is off unless the AMR_TIMING environment variable is set, and a span then costs
+one check of a module variable. When timing is on, each span is logged as a JSON line on
+the 'app.timing' logger, and added to a latency histogram of its name and labels. The app
+then serves the histograms at /metrics in the Prometheus text format, and writes them to
+AMR_TIMING_FILE (if set) when it exits.
+
+Usage:
+    import timing
+    with timing.span('lookup'):
+        ...
+
+    @timing.timed('output', output='plot')
+    def plot(): ...
+
+    AMR_TIMING=1 shiny run shiny_core_regression.py
+'''
+
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import tempfile
+import functools
+import threading
+import contextlib
+
+
+# Upper bounds of the histogram buckets, in seconds (the last bucket, +Inf, is added)
+buckets = [0.00005,0.0001,0.00025,0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10]
+
+metric_name = 'app_span_seconds'
+
+logger = logging.getLogger('app.timing')
+
+enabled = bool(os.environ.get('AMR_TIMING') or os.environ.get('AMR_TIMING_FILE'))
+
+# (span name, ((label, value), ...)): [observations in each bucket, count, sum of seconds]
+_histograms = {}
+_lock = threading.Lock()
+
+
+def record(name, seconds, **labels):
+    '''
+    Adds a time in seconds to the histogram of a span, and logs it
+    '''
+    if not enabled: return
+
+    key = (name, tuple(sorted((i, str(j)) for i, j in labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None: histogram = _histograms[key] = [[0]*(len(buckets)+1), 0, 0.0]
+
+        histogram[0][bisect.bisect_left(buckets, seconds)] += 1
+        histogram[1] += 1
+        histogram[2] += seconds
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'span':name, **labels, 'seconds':round(seconds,6)}, default=str))
+
+
+class _Span:
+
+    __slots__ = ('name','labels','start')
+
+    def __init__(self, name, labels):
+        self.name   = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        record(self.name, time.perf_counter()-self.start, **self.labels)
+
+
+# Returned by span() while timing is off
+_disabled = contextlib.nullcontext()
+
+
+def span(name, **labels):
+    '''
+    Returns a context manager that times its block as a span with the given name and labels
+    '''
+    if not enabled: return _disabled
+    return _Span(name, labels)
+
+
+def timed(name, **labels):
+    '''
+    Decorator that times every call of a function as a span
+    Goes directly above the function, below Shiny's @render decorators
+    '''
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled: return function(*args, **kwargs)
+            with _Span(name, labels):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def _label_text(labels):
+    return ','.join('{}="{}"'.format(i, j.replace('\\','\\\\').replace('"','\\"').replace('\n','\\n'))
+                    for i, j in labels)
+
+
+def prometheus_text():
+    '''
+    Returns the histogram of every span in the Prometheus text exposition format
+    '''
+    with _lock:
+        histograms = sorted((key, [list(counts), count, total]) for key, (counts, count, total) in _histograms.items())
+
+    lines = ['# HELP {} Time spent in each span of the app'.format(metric_name),
+             '# TYPE {} histogram'.format(metric_name)]
+
+    for (name, labels), (counts, count, total) in histograms:
+        labels = _label_text((('span',name),) + labels)
+
+        cumulative = 0
+        for bound, observations in zip(buckets+['+Inf'], counts):
+            cumulative += observations
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric_name, labels, bound, cumulative))
+        lines.append('{}_sum{{{}}} {!r}'.format(metric_name, labels, total))
+        lines.append('{}_count{{{}}} {}'.format(metric_name, labels, count))
+
+    return '\n'.join(lines)+'\n'
+
+
+def write(path):
+    '''
+    Writes prometheus_text() to a file, through a temporary file renamed over path
+    '''
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(path)), delete=False) as f:
+        f.write(prometheus_text())
+    os.replace(f.name, path)
+
+
+def _write_at_exit():
+    if os.environ.get('AMR_TIMING_FILE'): write(os.environ['AMR_TIMING_FILE'])
+
+atexit.register(_write_at_exit)
@@ -0,0 +1,83 @@
+'''
+Cache keys of stage outputs, and eviction of the least recently used entries
+'''
+
+import os
+import sys
+import time
+import importlib
+
+import pytest
+
+from amr import cache, evaluation, imputation, organisms, pipeline
+
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    '''
+    A package whose first module imports the second, which imports the third inside a function
+    '''
+    directory = tmp_path/'cachetest'
+    directory.mkdir()
+    (directory/'__init__.py').write_text('')
+    (directory/'first.py').write_text('from cachetest import second\n')
+    (directory/'second.py').write_text('def run():\n    import cachetest.third\n')
+    (directory/'third.py').write_text('value = 1\n')
+    (directory/'other.py').write_text('value = 1\n')
+
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield directory
+    for name in [i for i in sys.modules if i.startswith('cachetest')]: del sys.modules[name]
+
+
+def test_dependencies(package):
+    first = importlib.import_module('cachetest.first')
+    assert [i.__name__ for i in cache.dependencies([first])] == ['cachetest.first','cachetest.second','cachetest.third']
+
+
+def test_key_changes_with_imported_module(package, tmp_path):
+    first = importlib.import_module('cachetest.first')
+    inputs = [tmp_path/'input.txt']
+    inputs[0].write_text('rows')
+
+    before = cache.key('stage', inputs, {'site':'TOH'}, [first])
+    assert cache.key('stage', inputs, {'site':'TOH'}, [first])==before
+
+    (package/'other.py').write_text('value = 22\n')
+    assert cache.key('stage', inputs, {'site':'TOH'}, [first])==before
+
+    (package/'third.py').write_text('value = 22\n')
+    assert cache.key('stage', inputs, {'site':'TOH'}, [first])!=before
+
+
+def test_stage_dependencies():
+    def modules(stage):
+        return cache.dependencies(pipeline.stage_modules[stage])
+
+    assert {imputation, organisms} <= set(modules('ingest'))
+    assert evaluation in modules('train')
+
+
+def test_store_restore_and_evict(tmp_path):
+    directory = tmp_path/'cache'
+    outputs = []
+    for i in range(3):
+        path = tmp_path/'output{}.txt'.format(i)
+        path.write_bytes(bytes(1000))
+        outputs.append(path)
+
+    first  = cache.store('first',  [outputs[0]], directory)
+    second = cache.store('second', [outputs[1]], directory)
+
+    # Using the first entry makes the second the least recently used
+    os.utime(first, (time.time()-20,)*2)
+    os.utime(second, (time.time()-10,)*2)
+    assert cache.lookup('first', directory)==first
+
+    cache.store('third', [outputs[2]], directory, max_bytes=2500)
+    assert cache.lookup('second', directory) is None
+    assert cache.lookup('third', directory) is not None
+
+    restored = tmp_path/'restored'/'output0.txt'
+    assert cache.restore(cache.lookup('first', directory), [restored])
+    assert restored.read_bytes()==bytes(1000)
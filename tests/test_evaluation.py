@@ -0,0 +1,56 @@
+'''
+The evaluation of test predictions against scikit-learn's metrics
+'''
+
+import numpy as np
+import pytest
+
+from amr import evaluation
+
+metrics = pytest.importorskip('sklearn.metrics')
+
+
+def predictions(seed, rows=2000, distinct=None):
+    '''
+    Returns random outcomes, and scores that increase with resistance, with ties if distinct is given
+    '''
+    rng = np.random.default_rng(seed)
+    y = rng.integers(0, 2, rows)
+    score = y + rng.normal(0, 1.5, rows)
+    if distinct: score = np.round(score*distinct)/distinct
+
+    return y, score
+
+
+@pytest.mark.parametrize('distinct', [None,10,1])
+def test_auc(distinct):
+    y, score = predictions(1, distinct=distinct)
+    assert evaluation.auc(y, score)==pytest.approx(metrics.roc_auc_score(y, score), abs=1e-12)
+
+    # evaluate() takes predictions of susceptibility, which decrease with resistance
+    assert evaluation.evaluate(y, 1/(1+np.exp(score)), cutoffs=[])['AUC']==pytest.approx(metrics.roc_auc_score(y, score), abs=1e-12)
+
+
+def test_auc_one_class():
+    assert np.isnan(evaluation.auc(np.zeros(10), np.arange(10)))
+
+
+@pytest.mark.parametrize('distinct', [None,10])
+def test_roc_curve(distinct):
+    y, score = predictions(2, distinct=distinct)
+    expected = metrics.roc_curve(y, score, drop_intermediate=False)
+
+    for value, expected_value in zip(evaluation.roc_curve(y, score), expected):
+        np.testing.assert_allclose(value, expected_value, rtol=0, atol=1e-12)
+
+
+def test_bootstrap_independent_of_processes():
+    y, score = predictions(3, rows=500, distinct=20)
+    susceptibility = 1/(1+np.exp(score))
+
+    one = evaluation.bootstrap(y, susceptibility, replicates=600, seed=4, processes=1, chunksize=250)
+    two = evaluation.bootstrap(y, susceptibility, replicates=600, seed=4, processes=2, chunksize=250)
+    assert one.equals(two)
+
+    auc = one.set_index('metric').loc['AUC']
+    assert auc['lower']<auc['estimate']<auc['upper']
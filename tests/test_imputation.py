@@ -0,0 +1,110 @@
+'''
+The compiled, vectorized rules of imputation.py against applying each rule row by row
+'''
+
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from amr import imputation, organisms
+
+
+results = ['SUSCEPTIBLE','RESISTANT',np.nan]
+
+
+def organism_matches(name, match, organism):
+    if match=='':           return True
+    if not isinstance(name, str): return match=='not_equals'
+    if match=='equals':     return name==organism
+    if match=='not_equals': return name!=organism
+    if match=='startswith': return name.startswith(organism)
+    if match=='contains':   return re.search(organism, name) is not None
+    if match=='icontains':  return organism.lower() in name.lower()
+    raise ValueError(match)
+
+
+def antibiogram_matches(row, condition):
+    if condition is None: return True
+    columns, result = condition
+    if result=='missing': return all(pd.isna(row[i]) for i in columns)
+    return any(row[i]==result for i in columns)
+
+
+def impute_rows(data, site, rules):
+    '''
+    Applies every rule to every row in turn, the last matching rule of a column setting its value
+    '''
+    imputed = {}
+    rows = data.to_dict('records')
+
+    for suffix, organism_column, targets in imputation.compile_rules(rules, imputation.imputed_suffixes[site], data.columns):
+        for column, drug_rules in targets:
+            values = []
+            for row in rows:
+                value = imputation.no_data
+                for (match, organism), antibiogram, outcome, _ in drug_rules:
+                    if organism_matches(row[organism_column], match, organism) and antibiogram_matches(row, antibiogram):
+                        value = outcome
+                values.append(value)
+            imputed[column] = values
+
+    return imputed
+
+
+def fuzzed_extract(site, rules, rows, seed):
+    '''
+    Returns an extract with the organism and antibiogram columns the site's rules use, with organisms
+        that match the rules in every way (and some that match none), and random antibiogram results
+    '''
+    rng = np.random.default_rng(seed)
+
+    names = sorted(set(rule['organism'] for rule in rules if rule['organism']))
+    names = (names + [i+' fuzzii' for i in names] + [i.upper() for i in names]
+             + ['Unmatched organism']+organisms.no_organism+[np.nan])
+
+    suffixes = imputation.imputed_suffixes[site]
+    columns  = sorted(set(i+suffix for rule in rules for i in rule['antibiogram'] for suffix in rule['suffixes']
+                          if suffix in suffixes))
+
+    data = {imputation.organism_columns[suffix]:rng.choice(np.array(names, dtype=object), rows) for suffix in suffixes}
+    for column in columns:
+        data[column] = rng.choice(np.array(results, dtype=object), rows, p=[0.45,0.35,0.2])
+
+    return pd.DataFrame(data)
+
+
+def drop_columns(data, site, rules, seed):
+    '''
+    Drops random antibiogram columns, as long as the rules can still be compiled (see compile_rules)
+    '''
+    rng = np.random.default_rng(seed)
+    organism_columns = [imputation.organism_columns[i] for i in imputation.imputed_suffixes[site]]
+
+    for column in rng.permutation([i for i in data.columns if i not in organism_columns])[:len(data.columns)//4]:
+        try:
+            imputation.compile_rules(rules, imputation.imputed_suffixes[site], data.columns.drop(column))
+        except KeyError:
+            continue
+        data = data.drop(columns=column)
+
+    return data
+
+
+@pytest.mark.parametrize('site', ['Sunnybrook','TOH','Trillium'])
+@pytest.mark.parametrize('categorical', [False,True])
+@pytest.mark.parametrize('drop', [False,True])
+def test_compiled_rules_match_row_by_row(site, categorical, drop):
+    rules = imputation.load_rules(site)
+    data  = fuzzed_extract(site, rules, rows=600, seed=1)
+    if drop: data = drop_columns(data, site, rules, seed=2)
+
+    expected = impute_rows(data, site, rules)
+
+    # Organism columns are categoricals when read back from storage
+    if categorical: data = organisms.categorize(data)
+    imputed = imputation.impute(data.copy(), site, rules)
+
+    for column, values in expected.items():
+        assert imputed[column].tolist()==values, column
@@ -0,0 +1,54 @@
+'''
+Incremental imputation of a refreshed extract against imputing every row
+'''
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from amr import imputation, ingest, storage, synthetic
+
+
+def refreshed(data, site, seed):
+    '''
+    Returns a later version of a cleaned extract: some rows removed, some edited, and new rows appended
+    '''
+    rng = np.random.default_rng(seed)
+    data = data.drop(index=rng.choice(data.index, 20, replace=False))
+
+    # Edited organisms and antibiograms change what the rules impute
+    edited = rng.choice(data.index, 40, replace=False)
+    data.loc[edited[:20], 'FINAL'] = data.loc[edited[20:], 'FINAL'].to_numpy()
+    antibiogram = [i for i in data.columns if i.endswith('_FINAL') and data[i].isin(['SUSCEPTIBLE','RESISTANT']).any()][0]
+    data.loc[edited[20:], antibiogram] = np.where(data.loc[edited[20:], antibiogram]=='SUSCEPTIBLE', 'RESISTANT', 'SUSCEPTIBLE')
+
+    new = ingest.cleaning[site](synthetic.extract(site, 300, seed=seed, start=len(data)+100, total=2000))
+    return pd.concat([data, new], ignore_index=True)
+
+
+@pytest.mark.parametrize('site', ['Sunnybrook','TOH'])
+def test_incremental_matches_full(site, tmp_path):
+    rules   = imputation.load_rules(site)
+    columns = ingest.output_columns[site]
+    first   = ingest.cleaning[site](synthetic.extract(site, 1000, seed=1, total=2000))
+    second  = refreshed(first, site, seed=2)
+
+    output = tmp_path/'imputed.parquet'
+    counts = ingest.impute_incremental(first, output, site, rules, columns)
+    assert counts['imputed']==len(first)
+
+    counts = ingest.impute_incremental(second, output, site, rules, columns)
+    assert counts['rows']==len(second)
+    assert 0<counts['reused']<len(second)-300
+    if ingest.row_keys[site]: assert counts['removed']==20 and counts['changed']>0
+
+    full = ingest.impute_cleaned(second.copy(), site, rules)
+    if columns is not None: full = full[columns]
+    storage.write(full, tmp_path/'full.parquet')
+
+    pd.testing.assert_frame_equal(storage.read(output), storage.read(tmp_path/'full.parquet'))
+
+    # Nothing changed, nothing imputed
+    counts = ingest.impute_incremental(second, output, site, rules, columns)
+    assert counts['imputed']==0
+    pd.testing.assert_frame_equal(storage.read(output), storage.read(tmp_path/'full.parquet'))
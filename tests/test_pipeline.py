@@ -0,0 +1,34 @@
+'''
+Stage outputs restored from the cache by the pipeline
+'''
+
+import os
+
+import pandas as pd
+
+from amr import pipeline, synthetic, training
+
+
+def test_restored_train_stage_matches_its_inputs(tmp_path):
+    extracts = []
+    for seed in [1,2]:
+        path = str(tmp_path/'extract{}.parquet'.format(seed))
+        synthetic.extract('TOH', 2000, seed=seed).to_parquet(path, index=False)
+        extracts.append(path)
+
+    def run(extract):
+        config = pipeline.configure({'TOH':extract}, output_directory=str(tmp_path/'pipeline'), training_processes=1)
+        return config, pipeline.run(config, processes=1, log=lambda *i: None)
+
+    # The second extract replaces every output, and going back to the first restores them from the cache
+    run(extracts[0])
+    run(extracts[1])
+    config, status = run(extracts[0])
+    assert status[('TOH','train')]=='restored'
+
+    directory = pipeline.site_directory(config, 'TOH')
+    data = training.read_inputs(os.path.join(directory,'regression.parquet'), config['antibiotics'])
+
+    for antibiotic in config['antibiotics']:
+        saved = pd.read_parquet(training.statistics_path(os.path.join(directory,'models'), antibiotic, 'TOH'))
+        pd.testing.assert_frame_equal(saved, training.statistics(data, antibiotic))